@@ -0,0 +1,74 @@
+"""
+Connectivity benchmark: CPU burned and time-to-online around an access point outage
+
+Runs the firmware in the simulator (TLS, default hardware) through three scenarios:
+- the access point goes down at 600 s for 60 s
+- the access point goes down at 600 s for 300 s
+- the broker goes down at 600 s for 300 s and the access point at 700 s for 60 s, so the Wi-Fi is lost
+  while the unit is trying to reach the broker
+Reported are the event loop iterations and the busy time of the CPU from the start of the outage until the
+unit is back online, the time from the access point coming back until the broker accepts the unit again,
+and the resets. The numbers are in virtual time, so they are the same on every host.
+
+Runs on Linux with CPython 3, the MicroPython modules are provided by the simulator (sim).
+Run from the repository root: python -m benchmarks.bench_connectivity
+"""
+from sim.simulation import Simulation
+
+HOURS = 0.5
+SCENARIOS = (
+    ("AP down 60 s", (600, 60), None),
+    ("AP down 300 s", (600, 300), None),
+    ("AP down during reconnect", (700, 60), (600, 300)),
+)
+
+
+def run(wifi_outage, broker_outage) -> tuple:
+    """ Returns the loop iterations, busy ms, time-to-online ms and resets of a scenario """
+    simulation = Simulation(HOURS)
+    simulation.add_default_hardware()
+    world = simulation.world
+    broker = world.broker
+    outages = [wifi_outage] if broker_outage is None else [wifi_outage, broker_outage]
+    outage_start_s = min(start_s for start_s, _ in outages)
+    # The unit can be online again once both the access point and the broker are back
+    recovered_ms = max(start_s + duration_s for start_s, duration_s in outages) * 1000
+    marks = {}
+    attach = broker.attach
+
+    def mark(name) -> None:
+        marks[name] = (world.clock.time_ms(), world.polls, world.clock.busy_us)
+
+    def attached(connection) -> None:
+        if "start" in marks and "online" not in marks and world.clock.time_ms() >= recovered_ms:
+            mark("online")
+        attach(connection)
+
+    broker.attach = attached
+    world.at(outage_start_s, mark, "start")
+    world.at(wifi_outage[0], world.wifi.set_ap_up, False)
+    world.at(wifi_outage[0] + wifi_outage[1], world.wifi.set_ap_up, True)
+    if broker_outage is not None:
+        world.broker_outage(*broker_outage)
+    simulation.run()
+    if "online" not in marks:
+        mark("online")
+        time_to_online = None
+    else:
+        time_to_online = marks["online"][0] - recovered_ms
+    polls = marks["online"][1] - marks["start"][1]
+    busy_ms = (marks["online"][2] - marks["start"][2]) // 1000
+    return polls, busy_ms, time_to_online, world.resets
+
+
+def main() -> None:
+    print("{:<28} {:>16} {:>10} {:>20} {:>7}".format(
+        "", "loop iterations", "busy ms", "time-to-online ms", "resets"))
+    for label, wifi_outage, broker_outage in SCENARIOS:
+        polls, busy_ms, time_to_online, resets = run(wifi_outage, broker_outage)
+        print("{:<28} {:>16} {:>10} {:>20} {:>7}".format(
+            label, polls, busy_ms, "-" if time_to_online is None else time_to_online, resets))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Deque benchmark
+
+Compares the ring buffer uasyncio.deque.deque with the previous list-backed implementation
+at different queue depths. Each round appends one item and pops one from the left,
+keeping the depth constant like a busy MQTT message queue. The ring buffer is preallocated
+with the depth in its fixed-capacity mode.
+The time is taken on the host CPU, the best of 5 runs, so only the ratio carries over to the MCU.
+Also checks that deque() grows past its initial capacity like the list-backed one and that a fixed
+deque raises IndexError when full. Exits non-zero if a check fails.
+
+Runs on Linux with CPython 3, the MicroPython modules are provided by the simulator (sim).
+Run from the repository root: python -m benchmarks.bench_deque
+"""
+import sys
+import time as host_time
+from sim.simulation import install_modules
+
+install_modules()
+
+from uasyncio.deque import deque
+
+DEPTHS = (10, 100, 1000, 10000)
+ROUNDS = 2000
+REPEAT = 5
+
+
+class ListDeque:
+    """ The previous deque implementation backed by a plain list """
+
+    def __init__(self, iterable=None):
+        if iterable is None:
+            self.q = []
+        else:
+            self.q = list(iterable)
+
+    def popleft(self):
+        return self.q.pop(0)
+
+    def append(self, a):
+        self.q.append(a)
+
+    def appendleft(self, a):
+        self.q.insert(0, a)
+
+    def __len__(self):
+        return len(self.q)
+
+
+def measure_ns_per_op(q, depth: int, rounds: int = ROUNDS) -> int:
+    """ Returns the best average time of an append + popleft round in nanoseconds at the given depth """
+    for i in range(depth):
+        q.append(i)
+    best = None
+    for _ in range(REPEAT):
+        start = host_time.perf_counter_ns()
+        for i in range(rounds):
+            q.append(i)
+            q.popleft()
+        ns = (host_time.perf_counter_ns() - start) // rounds
+        if best is None or ns < best:
+            best = ns
+    return best
+
+
+def check_api() -> bool:
+    """ The default deque is unbounded, a fixed one raises IndexError when full """
+    ok = True
+    q = deque()
+    items = list(range(100))
+    try:
+        q.extend(items)
+        q.appendleft(-1)
+    except IndexError:
+        pass
+    if list(q) != [-1] + items or len(q) != 101:
+        print("FAIL: deque() doesn't hold more than its initial capacity")
+        ok = False
+    fixed = deque(capacity=16, grow=False)
+    fixed.extend(range(16))
+    try:
+        fixed.append(16)
+        print("FAIL: a full fixed-capacity deque accepted an append")
+        ok = False
+    except IndexError:
+        pass
+    return ok
+
+
+def main() -> None:
+    ok = check_api()
+    print("{:>6} {:>16} {:>16}".format("depth", "list ns/op", "ring ns/op"))
+    for depth in DEPTHS:
+        list_ns = measure_ns_per_op(ListDeque(), depth)
+        ring_ns = measure_ns_per_op(deque(capacity=depth + 1, grow=False), depth)
+        print("{:>6} {:>16} {:>16}".format(depth, list_ns, ring_ns))
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Flood benchmark: 1000 status requests at once under a full runq, with the tasks shed and with the runq grown
+
+Runs the firmware in the simulator for an hour with loop_shed_tasks_on_overflow off and on. At 2 minutes the
+server side sends 1000 status requests (QoS 1) at once, while a background load keeps the runq at its initial
+length for a minute, so every task created in that minute finds it full. At 30 minutes the broker is down
+for a minute.
+Only the status request tasks are created as sheddable, the rest have to keep working while they are shed:
+- PUBACK: every request is acknowledged, nothing is left in flight at the broker before the outage
+- keepalive: the only disconnect is the outage, no keepalive timeout at the broker, no healthy connection
+  closed by the client for a ping that was never sent
+- reconnect: the unit connects again after the outage and publishes its status
+Reported are the shed tasks, the runq high-water mark and the checks. Exits non-zero if a check fails.
+
+Runs on Linux with CPython 3, the MicroPython modules are provided by the simulator (sim).
+Run from the repository root: python -m benchmarks.bench_flood
+"""
+import sys
+from sim.simulation import Simulation
+
+REQUESTS = 1000
+FLOOD_S = 120
+LOAD_S = 60
+OUTAGE_S = 1800
+OUTAGE_DURATION_S = 60
+
+
+def start_load() -> None:
+    """ Keeps the runq of the firmware at its initial length for LOAD_S, with callbacks queueing themselves again """
+    import uasyncio as asyncio
+    import utime as time
+    loop = asyncio.get_event_loop()
+    until = time.ticks_add(time.ticks_ms(), LOAD_S * 1000)
+
+    def spin():
+        if time.ticks_diff(until, time.ticks_ms()) > 0:
+            loop.call_soon(spin)
+    # A callback takes two entries
+    for _ in range(loop.runq_size // 2):
+        loop.call_soon(spin)
+
+
+def run(shed) -> dict:
+    simulation = Simulation(1, config={"loop_shed_tasks_on_overflow": shed})
+    simulation.add_default_hardware()
+    world = simulation.world
+    broker = world.broker
+    config = simulation.unit_config()
+    before_outage = {}
+
+    def flood():
+        for _ in range(REQUESTS):
+            broker.publish(config.mqtt_topic_status_request, "")
+
+    def record():
+        before_outage["inFlight"] = sum(len(c.in_flight) for c in broker.clients.values())
+        before_outage["disconnects"] = broker.disconnects
+        before_outage["pings"] = broker.pings
+    world.at(FLOOD_S - 1, start_load)
+    world.at(FLOOD_S, flood)
+    world.at(OUTAGE_S - 1, record)
+    world.broker_outage(OUTAGE_S, OUTAGE_DURATION_S)
+    summary = simulation.run()
+    statuses = broker.published(config.mqtt_topic_status)
+    return {
+        "resets": summary["resets"],
+        "shedTasks": summary["loop"]["shedTasks"],
+        "runqHwm": summary["loop"]["runqHwm"],
+        "inFlight": before_outage["inFlight"],
+        "disconnectsBefore": before_outage["disconnects"],
+        "pingsBefore": before_outage["pings"],
+        "keepaliveTimeouts": broker.keepalive_timeouts,
+        "connects": broker.connects,
+        "online": config.mqtt_unit_id in broker.clients,
+        "statusAfter": any(p.time_ms >= (OUTAGE_S + OUTAGE_DURATION_S) * 1000 for p in statuses)
+    }
+
+
+def check(ok: bool, message: str) -> bool:
+    if not ok:
+        print("FAIL: " + message)
+    return ok
+
+
+def main() -> None:
+    print("{:<8} {:>8} {:>10} {:>10} {:>12} {:>8} {:>10} {:>8}".format(
+        "policy", "shed", "runq hwm", "in flight", "disconnects", "pings", "connects", "online"))
+    ok = True
+    for label, shed in (("grow", False), ("shed", True)):
+        result = run(shed)
+        print("{:<8} {shedTasks:>8} {runqHwm:>10} {inFlight:>10} {disconnectsBefore:>12} {pingsBefore:>8} "
+              "{connects:>10} {online!s:>8}".format(label, **result))
+        ok &= check(result["resets"] == 0, label + ": the unit was reset")
+        ok &= check(result["inFlight"] == 0, label + ": QoS 1 requests left unacknowledged")
+        ok &= check(result["disconnectsBefore"] == 0 and result["keepaliveTimeouts"] == 0,
+                    label + ": the connection was lost before the outage")
+        ok &= check(result["pingsBefore"] > 0, label + ": no ping answered")
+        ok &= check(result["connects"] == 2 and result["online"] and result["statusAfter"],
+                    label + ": no reconnect after the outage")
+        if shed:
+            ok &= check(result["shedTasks"] > 0, label + ": no task shed, the flood didn't fill the runq")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Module router benchmark: control message dispatch with 50 registered modules
+
+50 relays are registered in a ModuleRegistry and control payloads with 1 and with 10 module ids are
+dispatched to them. Compared is the if-chain UnitService.handle_control_event had before, grown to the same
+modules: every module checked in turn with `module.id in payload.keys()`, with the addressed modules at the
+start, in the middle and at the end of the chain, so its cost depends on where the module is.
+Reported are the microseconds per control message, on the host CPU, so only the ratios carry over to the MCU.
+
+Runs on Linux with CPython 3, the MicroPython modules are provided by the simulator (sim).
+Run from the repository root: python -m benchmarks.bench_module_router
+"""
+import time
+from sim.simulation import install_modules
+from sim import world
+
+install_modules()
+world.current = world.World(hours=1)
+
+from modules.relay import Relay
+from modules.module_registry import ModuleRegistry
+
+MODULES = 50
+ROUNDS = 20000
+
+
+def if_chain(relays, payload) -> None:
+    """ The lookup of the former handle_control_event, one branch per module """
+    for relay in relays:
+        if relay.id in payload.keys():
+            relay.handle_control_message(payload[relay.id])
+
+
+def router(registry, payload) -> None:
+    for module_id, value in payload.items():
+        registry.dispatch(module_id, value)
+
+
+def per_message_us(dispatch, modules, payload) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        dispatch(modules, payload)
+    return (time.perf_counter() - start) * 1e6 / ROUNDS
+
+
+def main() -> None:
+    relays = [Relay("relay{}".format(i), i, 1) for i in range(MODULES)]
+    registry = ModuleRegistry()
+    for relay in relays:
+        registry.register(relay.get_module_id(), relay.handle_control_message)
+    payloads = (
+        ("1 module, first", [0]),
+        ("1 module, middle", [MODULES // 2]),
+        ("1 module, last", [MODULES - 1]),
+        ("10 modules, spread", list(range(0, MODULES, MODULES // 10))),
+    )
+    print("{} registered modules, {} rounds".format(MODULES, ROUNDS))
+    print("{:<22} {:>14} {:>14} {:>9}".format("payload", "if-chain us", "registry us", "speedup"))
+    for label, indexes in payloads:
+        payload = {relays[i].id: i % 2 for i in indexes}
+        chain_us = per_message_us(if_chain, relays, payload)
+        router_us = per_message_us(router, registry, payload)
+        assert all(relays[i].get_state()[1] == i % 2 for i in indexes)
+        print("{:<22} {:>14.2f} {:>14.2f} {:>8.1f}x".format(label, chain_us, router_us, chain_us / router_us))
+
+
+if __name__ == '__main__':
+    main()
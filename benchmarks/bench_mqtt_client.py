@@ -0,0 +1,179 @@
+"""
+MQTT client event loop stall benchmark
+
+Runs the MQTT side of the unit with the blocking umqtt.simple client, used the way MqttService used it,
+and with the asynchronous MqttClient against the broker of the simulator, for 5 virtual minutes over TLS
+and over plain TCP:
+- connect and subscribe to the two topics of the unit, a QoS 1 status publish every 10 s,
+  a control message from the server every 7 s, checked for every 100 ms
+- the broker stalls (connected but not answering) at 60 s for 30 s
+- the broker restarts at 150 s and is down for 30 s
+A 10 ms ticker task measures how late the event loop runs it, which is how long the relays,
+sensors and timers of the unit would have waited. Reported are the worst stall, the stalls over 100 ms,
+the time the loop was blocked in calls and the messages that got through. Over TLS the public key
+operations of the handshake hold the CPU with either client.
+
+Runs on Linux with CPython 3, the MicroPython modules are provided by the simulator (sim).
+Run from the repository root: python -m benchmarks.bench_mqtt_client
+"""
+import importlib
+from sim.simulation import install_modules, purge_firmware
+from sim.clock import SimulationEnd
+from sim import world
+
+install_modules()
+
+DURATION_S = 300
+TICK_MS = 10
+PUBLISH_EVERY_MS = 10000
+CHECK_EVERY_MS = 100
+TOPICS = ("/global/status_request", "/units/bench/control")
+STATUS = b'{"unitID": "bench", "relay|growlight": 1, "waterTemperatureCelsius": 21.5}'
+
+
+class Stats:
+
+    def __init__(self) -> None:
+        self.worst_ms = 0
+        self.stalls = 0
+        self.stalled_ms = 0
+        self.published = 0
+        self.received = 0
+        self.connects = 0
+
+
+class BlockingDriver:
+    """ umqtt.simple.MQTTClient, every call blocks the event loop """
+
+    def __init__(self, stats, ssl) -> None:
+        from umqtt.simple import MQTTClient
+        self.client = MQTTClient("bench", "broker.sim", 8883, "sim", "sim", keepalive=60, ssl=ssl)
+        self.client.set_callback(lambda topic, msg: setattr(stats, "received", stats.received + 1))
+
+    async def connect(self) -> None:
+        self.client.connect()
+        for topic in TOPICS:
+            self.client.subscribe(topic, qos=1)
+
+    async def publish(self, topic, msg) -> None:
+        self.client.publish(topic, msg, qos=1)
+
+    async def check_msg(self) -> None:
+        self.client.check_msg()
+
+    def close(self) -> None:
+        if self.client.sock is not None:
+            self.client.sock.close()
+
+
+class AsyncDriver:
+    """ mqtt.mqtt_client.MqttClient, every wait for the broker is an await """
+
+    def __init__(self, stats, ssl) -> None:
+        from mqtt.mqtt_client import MqttClient
+        self.client = MqttClient("bench", "broker.sim", 8883, "sim", "sim", keepalive=60, ssl=ssl)
+        self.client.set_callback(lambda topic, msg: setattr(stats, "received", stats.received + 1))
+
+    async def connect(self) -> None:
+        await self.client.connect()
+        for topic in TOPICS:
+            await self.client.subscribe(topic, qos=1)
+
+    async def publish(self, topic, msg) -> None:
+        await self.client.publish(topic, msg, qos=1)
+
+    async def check_msg(self) -> None:
+        # Incoming packets are handled as they arrive, only the connection is checked
+        if not self.client.is_connected():
+            raise OSError("connection lost")
+
+    def close(self) -> None:
+        self.client.close()
+
+
+def run(driver_class, ssl) -> Stats:
+    purge_firmware()
+    current = world.current = world.World(hours=DURATION_S / 3600)
+    current.wifi.connect()
+    current.every(7, current.broker.publish, TOPICS[1], b'{"relay|growlight": 1}')
+    current.broker_stall(60, 30)
+    current.broker_outage(150, 30)
+    asyncio = importlib.import_module("uasyncio")
+    time = importlib.import_module("utime")
+    loop = asyncio.get_event_loop()
+    stats = Stats()
+    driver = driver_class(stats, ssl)
+    connected = [False]
+
+    def lost() -> None:
+        connected[0] = False
+        driver.close()
+
+    async def ticker():
+        while True:
+            start = time.ticks_ms()
+            await asyncio.sleep_ms(TICK_MS)
+            late = time.ticks_diff(time.ticks_ms(), start) - TICK_MS
+            if late > stats.worst_ms:
+                stats.worst_ms = late
+            if late > 100:
+                stats.stalls += 1
+                stats.stalled_ms += late
+
+    async def connection():
+        while not current.wifi.is_connected():
+            await asyncio.sleep_ms(100)
+        while True:
+            if not connected[0]:
+                try:
+                    await driver.connect()
+                    connected[0] = True
+                    stats.connects += 1
+                except OSError:
+                    lost()
+            await asyncio.sleep(1)
+
+    async def publisher():
+        while True:
+            await asyncio.sleep_ms(PUBLISH_EVERY_MS)
+            if connected[0]:
+                try:
+                    await driver.publish("/global/status", STATUS)
+                    stats.published += 1
+                except OSError:
+                    lost()
+
+    async def checker():
+        while True:
+            await asyncio.sleep_ms(CHECK_EVERY_MS)
+            if connected[0]:
+                try:
+                    await driver.check_msg()
+                except OSError:
+                    lost()
+
+    for coro in (ticker(), connection(), publisher(), checker()):
+        loop.create_task(coro)
+    try:
+        loop.run_forever()
+    except SimulationEnd:
+        pass
+    stats.blocked_ms = current.clock.blocked_us // 1000
+    return stats
+
+
+def main() -> None:
+    print("{} s, broker stall at 60 s for 30 s, broker down at 150 s for 30 s".format(DURATION_S))
+    print("{:<28} {:>14} {:>13} {:>11} {:>11} {:>10} {:>9} {:>9}".format(
+        "", "worst stall ms", "stalls >100ms", "stalled ms", "blocked ms", "published", "received", "connects"))
+    for ssl in (True, False):
+        for label, driver_class in (("umqtt.simple (before)", BlockingDriver), ("MqttClient", AsyncDriver)):
+            stats = run(driver_class, ssl)
+            label += ", TLS" if ssl else ", TCP"
+            print("{:<28} {:>14} {:>13} {:>11} {:>11} {:>10} {:>9} {:>9}".format(
+                label, stats.worst_ms, stats.stalls, stats.stalled_ms, stats.blocked_ms,
+                stats.published, stats.received, stats.connects))
+
+
+if __name__ == '__main__':
+    main()
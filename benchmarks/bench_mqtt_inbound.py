@@ -0,0 +1,67 @@
+"""
+Inbound MQTT benchmark: idle wakeups and command-to-relay latency
+
+Runs the firmware in the simulator for an hour of virtual time:
+- the server toggles the growlight every 30 s for the first half hour, the latency of a command is the time
+  from its publish at the broker to the edge of the relay's pin
+- the second half hour only has the periodic status publish, the event loop iterations and the busy time
+  per second are counted from 40 min on, which is what an idle unit costs in CPU and radio-awake time
+The numbers are in virtual time, so they are the same on every host.
+
+Runs on Linux with CPython 3, the MicroPython modules are provided by the simulator (sim).
+Run from the repository root: python -m benchmarks.bench_mqtt_inbound
+"""
+import json
+from sim.simulation import Simulation
+
+HOURS = 1
+COMMAND_EVERY_S = 30
+COMMANDS_UNTIL_S = 1800
+IDLE_FROM_S = 2400
+
+
+def main() -> None:
+    simulation = Simulation(HOURS)
+    simulation.add_default_hardware()
+    world = simulation.world
+    config = simulation.unit_config()
+    commands = []
+    idle_start = {}
+
+    def command():
+        state = (len(commands) + 1) & 1
+        commands.append((world.clock.time_ms(), state))
+        world.broker.publish(config.mqtt_topic_control, json.dumps({"relay|growlight": state}))
+
+    def start_idle_window():
+        idle_start["polls"] = world.polls
+        idle_start["busy_us"] = world.clock.busy_us
+
+    t = COMMAND_EVERY_S
+    while t <= COMMANDS_UNTIL_S:
+        # Off the whole seconds the timers of the firmware run at
+        world.at(t + world.random.random(), command)
+        t += COMMAND_EVERY_S
+    world.at(IDLE_FROM_S, start_idle_window)
+    simulation.run()
+
+    edges = world.pin_edges.get(config.growlight_pin, [])
+    latencies = []
+    for sent_ms, state in commands:
+        for edge_ms, value in edges:
+            if edge_ms >= sent_ms and value == (state if config.growlight_relay_active_at else 1 - state):
+                latencies.append(edge_ms - sent_ms)
+                break
+    latencies.sort()
+    idle_s = HOURS * 3600 - IDLE_FROM_S
+    print("commands: {}, relay switched: {}".format(len(commands), len(latencies)))
+    if latencies:
+        print("command-to-relay latency ms: min {} median {} max {}".format(
+            latencies[0], latencies[len(latencies) // 2], latencies[-1]))
+    print("idle: {:.1f} wakeups/s, {:.2f} ms busy/s".format(
+        (world.polls - idle_start["polls"]) / idle_s,
+        (world.clock.busy_us - idle_start["busy_us"]) / 1000 / idle_s))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+MQTT QoS 1 in-flight window benchmark
+
+Publishes 500 numbered QoS 1 messages as fast as the MqttClient takes them, to the broker of the simulator
+over plain TCP with 50 ms of latency each way, for in-flight windows of 1, 4 and 16 messages.
+Reported are the messages per second from the first publish to the last acknowledgement,
+in virtual time so they are the same on every host.
+A second run restarts the broker at the middle of the messages: the ones in flight are sent again
+with the DUP flag after the reconnect, checked is that every message reached the broker and that the
+completion callbacks came in publish order.
+
+Runs on Linux with CPython 3, the MicroPython modules are provided by the simulator (sim).
+Run from the repository root: python -m benchmarks.bench_mqtt_window
+"""
+import importlib
+from sim.simulation import install_modules, purge_firmware
+from sim import world
+
+install_modules()
+
+MESSAGES = 500
+LATENCY_MS = 50
+WINDOWS = (1, 4, 16)
+TOPIC = "/global/status"
+STATUS = '{{"unitID": "bench", "seq": {}, "relay|growlight": 1, "waterTemperatureCelsius": 21.5}}'
+
+
+class Stats:
+
+    def __init__(self) -> None:
+        self.first_ms = None
+        self.last_ms = None
+        self.completed = []
+        self.connects = 0
+
+
+def run(window, outage) -> tuple:
+    """ Returns the Stats and the World of one run """
+    purge_firmware()
+    current = world.current = world.World(hours=1)
+    current.network.link.latency_ms = LATENCY_MS
+    current.wifi.connect()
+    asyncio = importlib.import_module("uasyncio")
+    time = importlib.import_module("utime")
+    MqttClient = importlib.import_module("mqtt.mqtt_client").MqttClient
+    loop = asyncio.get_event_loop()
+    client = MqttClient("bench", "broker.sim", 8883, "sim", "sim", keepalive=60, max_inflight=window)
+    stats = Stats()
+
+    def completed(seq) -> None:
+        stats.completed.append(seq)
+        if len(stats.completed) == MESSAGES:
+            stats.last_ms = time.ticks_ms()
+            loop.stop()
+
+    async def connection():
+        while not current.wifi.is_connected():
+            await asyncio.sleep_ms(100)
+        while True:
+            if not client.is_connected():
+                try:
+                    await client.connect()
+                    stats.connects += 1
+                except OSError:
+                    pass
+            await asyncio.sleep_ms(100)
+
+    async def publisher():
+        seq = 0
+        while seq < MESSAGES:
+            if not client.is_connected():
+                await asyncio.sleep_ms(100)
+                continue
+            if stats.first_ms is None:
+                stats.first_ms = time.ticks_ms()
+            try:
+                await client.publish(TOPIC, STATUS.format(seq), qos=1, callback=lambda s=seq: completed(s))
+            except OSError:
+                continue
+            seq += 1
+            if outage and seq == MESSAGES // 2:
+                current.broker.set_up(False)
+                current.at(current.clock.time_ms() / 1000 + 2, current.broker.set_up, True)
+
+    loop.create_task(connection())
+    loop.create_task(publisher())
+    loop.run_forever()
+    return stats, current
+
+
+def main() -> None:
+    print("{} QoS 1 messages, {} ms latency each way, TCP".format(MESSAGES, LATENCY_MS))
+    print("{:<14} {:>10} {:>14}".format("window", "msgs/s", "total ms"))
+    for window in WINDOWS:
+        stats, _ = run(window, False)
+        total_ms = stats.last_ms - stats.first_ms
+        print("{:<14} {:>10.1f} {:>14}".format(window, MESSAGES * 1000 / total_ms, total_ms))
+    print()
+    print("broker restart after {} messages".format(MESSAGES // 2))
+    print("{:<14} {:>10} {:>10} {:>10} {:>14} {:>9}".format(
+        "window", "received", "distinct", "with DUP", "callback order", "connects"))
+    for window in WINDOWS:
+        stats, current = run(window, True)
+        received = current.broker.published(TOPIC)
+        distinct = len(set(publication.payload for publication in received))
+        dup = sum(1 for publication in received if publication.dup)
+        ordered = "ok" if stats.completed == list(range(MESSAGES)) else "WRONG"
+        print("{:<14} {:>10} {:>10} {:>10} {:>14} {:>9}".format(
+            window, len(received), distinct, dup, ordered, stats.connects))
+
+
+if __name__ == '__main__':
+    main()
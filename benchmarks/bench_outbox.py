@@ -0,0 +1,168 @@
+"""
+MQTT outbox benchmark: flash writes per message and drain throughput
+
+Flash wear: 1,000 status messages, one in 50 of them important, are appended to an Outbox in a temporary
+directory with telemetry batches of 0 (every message written on its own, as without batching), 512 and
+2048 bytes. Reported are the file writes and the bytes written per message, and with a 16 KiB cap how many
+of the important messages and of the telemetry are still there.
+
+Drain: 200 stored messages are sent by MqttService after it connects to the broker of the simulator
+(TLS, 20 ms latency each way) with drain intervals of 0, 100 and 200 ms between the messages.
+Reported are the messages per second at the broker from the first to the last one, in virtual time.
+
+Overflow: once online, a burst of 50 messages is handed to MqttService at once, more than its outgoing queue
+holds. The ones that don't fit go to the outbox and have to be sent while the unit stays online; reported are
+the messages at the broker after a minute. Exits non-zero if any is missing.
+
+Runs on Linux with CPython 3, the MicroPython modules are provided by the simulator (sim).
+Run from the repository root: python -m benchmarks.bench_outbox
+"""
+import contextlib
+import importlib
+import io
+import os
+import sys
+import tempfile
+from sim.simulation import install_modules, purge_firmware, DEFAULT_CONFIG
+from sim import world
+
+install_modules()
+
+MESSAGES = 1000
+IMPORTANT_EVERY = 50
+BATCHES = (0, 512, 2048)
+CAP_BYTES = 16384
+DRAIN_MESSAGES = 200
+DRAIN_INTERVALS_MS = (0, 100, 200)
+BURST_MESSAGES = 50
+TOPIC = "/global/status"
+STATUS = '{"unitID": "tlvlp.iot.BazsalikON-aero", "ds18b20|waterTemperatureCelsius": 21.1875, ' \
+         '"relay|growlight": 0, "relay|irrigation": 0, "irrigationOnSec": 120, "irrigationOffSec": 120}'
+
+
+def fill(outbox, count) -> None:
+    for i in range(count):
+        outbox.append(TOPIC, STATUS, i % IMPORTANT_EVERY == 0)
+    outbox.flush()
+
+
+def flash_wear() -> None:
+    from mqtt.outbox import Outbox, IMPORTANT
+    print("{} messages of {} bytes, one in {} important".format(MESSAGES, len(TOPIC) + len(STATUS), IMPORTANT_EVERY))
+    print("{:<16} {:>12} {:>12} {:>18} {:>18}".format(
+        "batch bytes", "writes/msg", "bytes/msg", "important kept", "telemetry kept"))
+    for batch in BATCHES:
+        directory = tempfile.mkdtemp(prefix="bench-outbox-")
+        outbox = Outbox(directory, 1 << 30, batch_bytes=batch)
+        fill(outbox, MESSAGES)
+        writes = outbox.writes / MESSAGES
+        written = outbox.bytes_written / MESSAGES
+        capped = Outbox(tempfile.mkdtemp(prefix="bench-outbox-"), CAP_BYTES, batch_bytes=batch)
+        fill(capped, MESSAGES)
+        kept = [0, 0]
+        segment_id = 0
+        while True:
+            segment = capped.next_segment(segment_id)
+            if segment is None:
+                break
+            segment_id, messages = segment
+            kind = next(s[1] for s in capped.segments if s[0] == segment_id)
+            kept[kind] += len(messages)
+        # Reloading the directory finds the same segments, like after a reboot
+        assert len(Outbox(directory, 1 << 30).segments) == len(outbox.segments)
+        print("{:<16} {:>12.3f} {:>12.1f} {:>18} {:>18}".format(
+            batch, writes, written, "{}/{}".format(kept[IMPORTANT], MESSAGES // IMPORTANT_EVERY), kept[0]))
+
+
+def start_service(interval_ms):
+    """ Returns the world, the event loop and an MqttService connecting to the broker of the simulator """
+    purge_firmware()
+    current = world.current = world.World(hours=1)
+    current.wifi.connect()
+    os.chdir(tempfile.mkdtemp(prefix="bench-flash-"))
+    config = importlib.import_module("unit.config")
+    for key, value in DEFAULT_CONFIG.items():
+        setattr(config, key, value)
+    config.mqtt_outbox_drain_interval_ms = interval_ms
+    config.mqtt_outbox_max_bytes = 1 << 20
+    connectivity = importlib.import_module("unit.connectivity").Connectivity()
+    asyncio = importlib.import_module("uasyncio")
+    loop = asyncio.get_event_loop()
+    with contextlib.redirect_stdout(io.StringIO()):
+        mqtt_service = importlib.import_module("mqtt.mqtt_service").MqttService(connectivity)
+
+    async def start():
+        while not current.wifi.is_connected():
+            await asyncio.sleep_ms(100)
+        connectivity.wifi_up()
+
+    loop.create_task(start())
+    return current, loop, mqtt_service
+
+
+def drain(interval_ms) -> float:
+    """ Returns the messages per second the outbox was sent at """
+    current, loop, mqtt_service = start_service(interval_ms)
+    for _ in range(DRAIN_MESSAGES):
+        mqtt_service.outbox.append(TOPIC, STATUS)
+    received = []
+
+    def on_publish(publication) -> None:
+        received.append(current.clock.time_ms())
+        if len(received) == DRAIN_MESSAGES:
+            loop.stop()
+
+    current.broker.subscribe(TOPIC, on_publish)
+    with contextlib.redirect_stdout(io.StringIO()):
+        loop.run_forever()
+    return (DRAIN_MESSAGES - 1) * 1000 / (received[-1] - received[0])
+
+
+def overflow_online() -> tuple:
+    """ Returns the messages of the burst at the broker and the ones that went to the outbox """
+    current, loop, mqtt_service = start_service(100)
+    asyncio = importlib.import_module("uasyncio")
+    MqttMessage = importlib.import_module("mqtt.mqtt_service").MqttMessage
+    received = []
+    stored = [0]
+    store_message = mqtt_service.store_message
+
+    def counting_store(message) -> None:
+        stored[0] += 1
+        store_message(message)
+
+    mqtt_service.store_message = counting_store
+    current.broker.subscribe(TOPIC, received.append)
+
+    async def burst():
+        await mqtt_service.connectivity.wait_online()
+        for i in range(BURST_MESSAGES):
+            await mqtt_service.add_outgoing_message_to_queue(MqttMessage(TOPIC, "{}".format(i)))
+        await asyncio.sleep(60)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        loop.run_until_complete(burst())
+    return len(received), stored[0]
+
+
+def main() -> None:
+    cwd = os.getcwd()
+    flash_wear()
+    print()
+    print("drain of {} messages".format(DRAIN_MESSAGES))
+    print("{:<16} {:>12}".format("interval ms", "msgs/s"))
+    try:
+        for interval_ms in DRAIN_INTERVALS_MS:
+            print("{:<16} {:>12.1f}".format(interval_ms, drain(interval_ms)))
+        print()
+        received, stored = overflow_online()
+    finally:
+        os.chdir(cwd)
+    print("burst of {} messages online: {} in the outbox, {} at the broker".format(BURST_MESSAGES, stored, received))
+    if received != BURST_MESSAGES:
+        print("FAIL: messages stored in the outbox while online were not sent")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
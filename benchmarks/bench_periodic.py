@@ -0,0 +1,121 @@
+"""
+Periodic timer benchmark
+
+Compares the jitter of the previous "while True: work; await sleep(n)" service loops with EventLoop.call_every(),
+on a time scale of milliseconds instead of seconds:
+- a status updater with a 15ms blocking sensor read every 200ms (stands in for the 600s status period)
+- irrigation on/off edges with 120ms on and 80ms off (stands in for the 120s/120s schedule)
+While measuring, a background co-routine blocks the loop for 5ms every 30ms like the other services would.
+
+Reported per schedule: the drift of the last run from the ideal schedule and the maximum deviation of any run.
+
+Runs on Linux with CPython 3, the MicroPython modules are provided by the simulator (sim). The blocking work
+advances its virtual clock, so the jitter is that of the schedule alone.
+Run from the repository root: python -m benchmarks.bench_periodic
+"""
+from sim.simulation import install_modules
+from sim import world
+
+install_modules()
+world.current = world.World()
+
+import utime as time
+import uasyncio as asyncio
+
+PERIOD_MS = 200
+WORK_MS = 15
+RUNS = 15
+ON_MS = 120
+OFF_MS = 80
+CYCLES = 10
+BACKGROUND_PERIOD_MS = 30
+BACKGROUND_WORK_MS = 5
+
+
+def deviations(edges: list, first: int, period_ms: int) -> tuple:
+    """ Returns the drift of the last edge and the maximum absolute deviation from the ideal schedule """
+    offsets = [time.ticks_diff(edge, time.ticks_add(first, i * period_ms)) for i, edge in enumerate(edges)]
+    return offsets[-1], max(abs(offset) for offset in offsets)
+
+
+async def background_load(duration_ms: int) -> None:
+    end = time.ticks_add(time.ticks_ms(), duration_ms)
+    while time.ticks_diff(end, time.ticks_ms()) > 0:
+        time.sleep_ms(BACKGROUND_WORK_MS)
+        await asyncio.sleep_ms(BACKGROUND_PERIOD_MS)
+
+
+def measure_status_period(use_timer: bool) -> tuple:
+    loop = asyncio.get_event_loop()
+    starts = []
+
+    def send_status():
+        starts.append(time.ticks_ms())
+        time.sleep_ms(WORK_MS)
+
+    async def status_updater_loop():
+        for _ in range(RUNS):
+            send_status()
+            await asyncio.sleep_ms(PERIOD_MS)
+
+    async def scenario():
+        loop.create_task(background_load(PERIOD_MS * RUNS))
+        if use_timer:
+            timer = loop.call_every(PERIOD_MS, send_status)
+            await asyncio.sleep_ms(PERIOD_MS * (RUNS - 1) + PERIOD_MS // 2)
+            timer.cancel()
+        else:
+            await status_updater_loop()
+
+    loop.run_until_complete(scenario())
+    return deviations(starts, starts[0], PERIOD_MS)
+
+
+def measure_irrigation_edges(use_timer: bool) -> tuple:
+    loop = asyncio.get_event_loop()
+    on_edges = []
+    off_edges = []
+
+    def relay_on():
+        on_edges.append(time.ticks_ms())
+
+    def relay_off():
+        off_edges.append(time.ticks_ms())
+
+    async def automated_irrigation_loop():
+        for _ in range(CYCLES):
+            relay_on()
+            await asyncio.sleep_ms(ON_MS)
+            relay_off()
+            await asyncio.sleep_ms(OFF_MS)
+
+    async def scenario():
+        cycle_ms = ON_MS + OFF_MS
+        loop.create_task(background_load(cycle_ms * CYCLES))
+        if use_timer:
+            on_timer = loop.call_every(cycle_ms, relay_on)
+            off_timer = asyncio.Periodic(loop, cycle_ms, relay_off).start_at(time.ticks_add(on_timer.deadline, ON_MS))
+            await asyncio.sleep_ms(cycle_ms * CYCLES - OFF_MS // 2)
+            on_timer.cancel()
+            off_timer.cancel()
+        else:
+            await automated_irrigation_loop()
+
+    loop.run_until_complete(scenario())
+    cycle_ms = ON_MS + OFF_MS
+    on_drift, on_max = deviations(on_edges, on_edges[0], cycle_ms)
+    off_drift, off_max = deviations(off_edges, time.ticks_add(on_edges[0], ON_MS), cycle_ms)
+    return on_drift, on_max, off_drift, off_max
+
+
+def main() -> None:
+    for label, use_timer in (("sleep loop (before)", False), ("call_every (after)", True)):
+        drift, max_dev = measure_status_period(use_timer)
+        print("{:<20} status period   drift: {:>4}ms  max deviation: {:>4}ms".format(label, drift, max_dev))
+        on_drift, on_max, off_drift, off_max = measure_irrigation_edges(use_timer)
+        print("{:<20} irrigation on   drift: {:>4}ms  max deviation: {:>4}ms".format(label, on_drift, on_max))
+        print("{:<20} irrigation off  drift: {:>4}ms  max deviation: {:>4}ms".format(label, off_drift, off_max))
+
+
+if __name__ == '__main__':
+    main()
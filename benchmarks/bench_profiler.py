@@ -0,0 +1,151 @@
+"""
+Event loop profiler benchmark
+
+Overhead: the same workload runs with profiling off and on, 10 tasks of 2,000 slices each, every 10th slice
+a 1 ms sleep through the waitq, and a 5 ms periodic callback. Reported is the time per slice on the host CPU,
+the best of 5 runs, so only the ratio carries over to the MCU. Off is the loop of every unit that doesn't set
+loop_profiling_enabled, it checks profiler for None once per slice and per expired timer.
+
+Check: a known schedule runs on the virtual clock of the simulator with the profiler on, without the busy time
+the simulator charges per loop iteration by default, so snapshot() has to report exactly:
+- ticker: a task sleeping 10 times for 100 ms, 11 slices, 10 of them timer wakeups with 0 ms lag
+- every 150ms: tick: a periodic callback over the 1,000 ms of the ticker, 7 calls, all timer wakeups
+- poke: a callback scheduled 5 times with call_soon(), 5 calls, none of them a timer wakeup
+- late: the same callback due at 100 and 140 ms of every round, after a callback blocking the loop
+  from 90 to 140 ms, 10 rounds: 20 calls, all timer wakeups, 40 ms and 0 ms late
+Exits non-zero if a count differs.
+
+Runs on Linux with CPython 3, the MicroPython modules are provided by the simulator (sim).
+Run from the repository root: python -m benchmarks.bench_profiler
+"""
+import sys
+import time as host_time
+from sim.simulation import install_modules
+from sim import world
+
+install_modules()
+# No busy time charged per loop iteration, so the lags of the schedule are exact
+world.current = world.World(poll_cost_us=0)
+
+import utime as time
+import uasyncio as asyncio
+
+TASKS = 10
+SLICES = 2000
+SLEEP_EVERY = 10
+PERIOD_MS = 5
+REPEAT = 5
+ROUNDS = 10
+
+
+def noop() -> None:
+    pass
+
+
+def measure_us_per_slice(profiling: bool) -> float:
+    """ Returns the best time per task slice in microseconds on the host """
+    loop = asyncio.get_event_loop()
+
+    async def worker():
+        for i in range(SLICES):
+            if i % SLEEP_EVERY:
+                await asyncio.sleep(0)
+            else:
+                await asyncio.sleep_ms(1)
+
+    async def scenario():
+        timer = loop.call_every(PERIOD_MS, noop)
+        tasks = [loop.create_task(worker()) for _ in range(TASKS)]
+        for task in tasks:
+            await task
+        timer.cancel()
+
+    best = None
+    for _ in range(REPEAT):
+        if profiling:
+            loop.enable_profiling().reset()
+        start = host_time.perf_counter()
+        loop.run_until_complete(scenario())
+        us = (host_time.perf_counter() - start) * 1e6 / (TASKS * SLICES)
+        loop.disable_profiling()
+        if best is None or us < best:
+            best = us
+    return best
+
+
+def profile_schedule() -> dict:
+    """ Runs the known schedule with the profiler on and returns its snapshot """
+    loop = asyncio.get_event_loop()
+
+    async def ticker():
+        for _ in range(10):
+            await asyncio.sleep_ms(100)
+
+    def tick():
+        pass
+
+    def poke():
+        pass
+
+    def late():
+        pass
+
+    def blocker():
+        time.sleep_ms(50)
+
+    async def scenario():
+        timer = loop.call_every(150, tick)
+        await loop.create_task(ticker())
+        timer.cancel()
+        for _ in range(5):
+            loop.call_soon(poke)
+        for _ in range(ROUNDS):
+            loop.call_later_ms(90, blocker)
+            loop.call_later_ms(100, late)
+            loop.call_later_ms(140, late)
+            await asyncio.sleep_ms(200)
+
+    loop.enable_profiling().reset()
+    loop.run_until_complete(scenario())
+    snapshot = loop.profiler.snapshot()
+    loop.disable_profiling()
+    return snapshot
+
+
+def check_schedule() -> bool:
+    snapshot = profile_schedule()
+    expected = {
+        "ticker": {"slices": 11, "lags": 10, "lagAvgMs": 0, "lagMaxMs": 0},
+        "every 150ms: tick": {"slices": 7, "lags": 7, "lagAvgMs": 0, "lagMaxMs": 0},
+        "poke": {"slices": 5, "lags": 0, "lagAvgMs": 0, "lagMaxMs": 0},
+        "late": {"slices": 2 * ROUNDS, "lags": 2 * ROUNDS, "lagAvgMs": 20, "lagMaxMs": 40},
+    }
+    ok = True
+    print("{:<20} {:>8} {:>8} {:>8} {:>8}".format("", "slices", "lags", "lag avg", "lag max"))
+    for name, counts in expected.items():
+        stats = snapshot.get(name)
+        if stats is None:
+            print("FAIL: {} not in the snapshot".format(name))
+            ok = False
+            continue
+        print("{:<20} {:>8} {:>8} {:>8} {:>8}".format(
+            name, stats["slices"], stats["lags"], stats["lagAvgMs"], stats["lagMaxMs"]))
+        for key, value in counts.items():
+            if stats[key] != value:
+                print("FAIL: {} {}: {}, expected {}".format(name, key, stats[key], value))
+                ok = False
+    return ok
+
+
+def main() -> None:
+    off_us = measure_us_per_slice(False)
+    on_us = measure_us_per_slice(True)
+    print("{} tasks x {} slices".format(TASKS, SLICES))
+    print("profiling off: {:.2f} us per slice, on: {:.2f} us per slice, {:.2f}x".format(off_us, on_us, on_us / off_us))
+    print()
+    if not check_schedule():
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
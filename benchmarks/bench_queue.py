@@ -0,0 +1,121 @@
+"""
+Queue benchmark
+
+Compares the event-driven uasyncio.queues.Queue with the previous polling
+implementation that retried every 100ms:
+- idle wakeups per second of the event loop while a consumer waits on an empty queue
+- enqueue-to-dequeue latency of items put at random points in time, on two clocks:
+  - virtual: the event loop runs on the virtual clock of the simulator, where the polling queue waits for
+    its sleep. Every loop iteration is charged a fixed 100 us, so 100 us means the item was taken on the
+    next iteration, it is not a measured time.
+  - host: the CPU time on the host from put_nowait() until get() returns, the cost of the wake path itself,
+    so only the ratio carries over to the MCU. The sleep of the polling queue takes no host time.
+
+Runs on Linux with CPython 3, the MicroPython modules are provided by the simulator (sim).
+Run from the repository root: python -m benchmarks.bench_queue
+"""
+import time as host_time
+from sim.simulation import install_modules
+from sim import world
+
+install_modules()
+world.current = world.World()
+
+import utime as time
+import uasyncio as asyncio
+from uasyncio.queues import Queue
+from uasyncio.deque import deque
+
+IDLE_WINDOW_MS = 2000
+LATENCY_SAMPLES = 20
+LATENCY_PUT_INTERVAL_MS = 37
+
+
+class PollingQueue:
+    """ The previous Queue implementation that polls with a fixed delay """
+    _attempt_delay = 0.1
+
+    def __init__(self, maxsize=0):
+        self.maxsize = maxsize
+        self._queue = deque()
+
+    @asyncio.coroutine
+    def get(self):
+        while not self._queue:
+            yield from asyncio.sleep(self._attempt_delay)
+        return self._queue.popleft()
+
+    @asyncio.coroutine
+    def put(self, val):
+        while len(self._queue) >= self.maxsize and self.maxsize:
+            yield from asyncio.sleep(self._attempt_delay)
+        self._queue.append(val)
+
+    def put_nowait(self, val):
+        self._queue.append(val)
+
+
+def measure_idle_wakeups(queue_class) -> float:
+    """ Returns the number of event loop wakeups per second while the only consumer is waiting """
+    loop = asyncio.get_event_loop()
+    queue = queue_class()
+    wakeups = [0]
+    wait = loop.wait
+
+    def counting_wait(delay):
+        wakeups[0] += 1
+        wait(delay)
+
+    async def consumer():
+        await queue.get()
+
+    async def scenario():
+        loop.create_task(consumer())
+        await asyncio.sleep(0)
+        loop.wait = counting_wait
+        await asyncio.sleep_ms(IDLE_WINDOW_MS)
+        loop.wait = wait
+        # Release the consumer
+        await queue.put(None)
+        await asyncio.sleep_ms(200)
+
+    loop.run_until_complete(scenario())
+    return wakeups[0] * 1000 / IDLE_WINDOW_MS
+
+
+def measure_latency(queue_class) -> tuple:
+    """ Returns the average and maximum enqueue-to-dequeue latency in microseconds, virtual and on the host """
+    loop = asyncio.get_event_loop()
+    queue = queue_class()
+    virtual = []
+    host = []
+
+    async def consumer():
+        for _ in range(LATENCY_SAMPLES):
+            sent_us, sent_ns = await queue.get()
+            host.append((host_time.perf_counter_ns() - sent_ns) // 1000)
+            virtual.append(time.ticks_diff(time.ticks_us(), sent_us))
+
+    async def scenario():
+        loop.create_task(consumer())
+        for _ in range(LATENCY_SAMPLES):
+            await asyncio.sleep_ms(LATENCY_PUT_INTERVAL_MS)
+            queue.put_nowait((time.ticks_us(), host_time.perf_counter_ns()))
+        await asyncio.sleep_ms(200)
+
+    loop.run_until_complete(scenario())
+    return sum(virtual) // len(virtual), max(virtual), sum(host) // len(host), max(host)
+
+
+def main() -> None:
+    print("{:<22} {:>8}  {:>24}  {:>24}".format("", "idle", "virtual latency us", "host latency us"))
+    print("{:<22} {:>8}  {:>11} {:>12}  {:>11} {:>12}".format("", "wakeup/s", "avg", "max", "avg", "max"))
+    for label, queue_class in (("polling (before)", PollingQueue), ("event-driven (after)", Queue)):
+        wakeups = measure_idle_wakeups(queue_class)
+        virtual_avg, virtual_max, host_avg, host_max = measure_latency(queue_class)
+        print("{:<22} {:>8.1f}  {:>11d} {:>12d}  {:>11d} {:>12d}".format(
+            label, wakeups, virtual_avg, virtual_max, host_avg, host_max))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Fleet reconnect benchmark: 200 units against one broker
+
+Runs the MqttClient of 200 units in one simulated world, over plain TCP so that the TLS handshakes,
+which each unit would do on its own CPU, don't queue up on the single simulated one. The broker accepts
+at most 20 CONNECTs per second and refuses the others with "server unavailable", like an overloaded broker.
+The units boot together, and the broker restarts at 120 s, down for 10 s.
+Reconnecting the way MqttService did before, at once and then every second with a DNS lookup per attempt,
+is compared with the ReconnectPolicy of the service with the defaults of unit/config.py: capped exponential
+backoff with full jitter, also before the first attempt, and cached addresses. A third run keeps the broker down after 120 s and lists
+a fallback broker.
+
+Reported are the CONNECTs the broker got in its busiest second, the refused ones, the time until all the units
+are online after the boot and after the broker is back, and the DNS lookups. The numbers are in virtual time.
+
+Runs on Linux with CPython 3, the MicroPython modules are provided by the simulator (sim).
+Run from the repository root: python -m benchmarks.bench_reconnect
+"""
+import importlib
+from sim.simulation import install_modules, purge_firmware
+from sim.broker import Broker
+from sim.clock import SimulationEnd
+from sim import world
+
+install_modules()
+
+UNITS = 200
+CONNECT_LIMIT = 20
+RESTART_S = 120
+DOWN_S = 10
+DURATION_S = 400
+SERVERS = [("broker.sim", 8883)]
+FALLBACK = ("backup.sim", 8883)
+
+
+class Fleet:
+
+    def __init__(self) -> None:
+        self.online = 0
+        # Virtual ms when all the units were online, after the boot and after the broker came back
+        self.all_online_ms = []
+        self.on_fallback = 0
+
+
+def run(with_policy, failover) -> tuple:
+    """ Returns the Fleet, the World and the brokers of one run """
+    purge_firmware()
+    current = world.current = world.World(hours=DURATION_S / 3600)
+    current.network.dns_ms = 0
+    current.wifi.connect()
+    current.broker.connect_limit = CONNECT_LIMIT
+    servers = SERVERS
+    brokers = [current.broker]
+    if failover:
+        current.network.add_host(FALLBACK[0], "10.0.0.2")
+        backup = Broker(current.clock, current.network, ("10.0.0.2", 8883))
+        backup.connect_limit = CONNECT_LIMIT
+        brokers.append(backup)
+        servers = SERVERS + [FALLBACK]
+        current.at(RESTART_S, current.broker.set_up, False)
+    else:
+        current.broker_outage(RESTART_S, DOWN_S)
+    asyncio = importlib.import_module("uasyncio")
+    time = importlib.import_module("utime")
+    Event = importlib.import_module("uasyncio.synchro").Event
+    mqtt_client = importlib.import_module("mqtt.mqtt_client")
+    ReconnectPolicy = importlib.import_module("unit.reconnect_policy").ReconnectPolicy
+    config = importlib.import_module("unit.config")
+    loop = asyncio.get_event_loop(UNITS * 2, UNITS * 4)
+    fleet = Fleet()
+
+    def connected(server) -> None:
+        fleet.online += 1
+        if server == FALLBACK[0]:
+            fleet.on_fallback += 1
+        if fleet.online == UNITS:
+            fleet.all_online_ms.append(time.ticks_ms())
+
+    async def unit(i):
+        client = mqtt_client.MqttClient("unit-{}".format(i), SERVERS[0][0], SERVERS[0][1], "sim", "sim",
+                                        keepalive=60)
+        lost = Event()
+        client.set_close_callback(lost.set)
+        policy = None
+        if with_policy:
+            policy = ReconnectPolicy(config.mqtt_reconnect_base_ms, config.mqtt_reconnect_cap_ms, servers)
+        while not current.wifi.is_connected():
+            await asyncio.sleep_ms(100)
+        while True:
+            addr = None
+            if policy is not None:
+                await asyncio.sleep_ms(policy.next_delay_ms())
+                client.server, client.port = policy.server()
+                addr = policy.address()
+            try:
+                await client.connect(addr=addr)
+            except (OSError, mqtt_client.MqttException):
+                client.close()
+                lost.clear()
+                if policy is not None:
+                    policy.failed()
+                else:
+                    await asyncio.sleep_ms(1000)
+                continue
+            if policy is not None:
+                policy.succeeded()
+            connected(client.server)
+            await lost.wait()
+            lost.clear()
+            fleet.online -= 1
+            if client.server == FALLBACK[0]:
+                fleet.on_fallback -= 1
+
+    for i in range(UNITS):
+        loop.create_task(unit(i))
+    try:
+        loop.run_forever()
+    except SimulationEnd:
+        pass
+    return fleet, current, brokers
+
+
+def busiest_second(connect_log, from_ms, to_ms) -> int:
+    counts = {}
+    for t in connect_log:
+        if from_ms <= t < to_ms:
+            counts[t // 1000] = counts.get(t // 1000, 0) + 1
+    return max(counts.values()) if counts else 0
+
+
+def main() -> None:
+    print("{} units, broker accepts {} CONNECTs/s, restart at {} s".format(UNITS, CONNECT_LIMIT, RESTART_S))
+    print("{:<34} {:>11} {:>11} {:>9} {:>11} {:>11} {:>9}".format(
+        "", "boot peak/s", "after peak", "refused", "boot ms", "after ms", "DNS"))
+    for label, with_policy, failover in (("at once, then every 1 s (before)", False, False),
+                                         ("ReconnectPolicy", True, False),
+                                         ("ReconnectPolicy, primary stays down", True, True)):
+        fleet, current, brokers = run(with_policy, failover)
+        back_ms = (RESTART_S + (0 if failover else DOWN_S)) * 1000
+        log = []
+        for broker in brokers:
+            log += broker.connect_log
+        times = ["-", "-"]
+        for i, t in enumerate(fleet.all_online_ms[:2]):
+            times[i] = t if i == 0 else t - back_ms
+        print("{:<34} {:>11} {:>11} {:>9} {:>11} {:>11} {:>9}".format(
+            label, busiest_second(log, 0, RESTART_S * 1000), busiest_second(log, back_ms, DURATION_S * 1000),
+            sum(broker.refused for broker in brokers), times[0], times[1], current.network.dns_lookups))
+        if failover:
+            print("{:<34} {} of {} units on the fallback broker at the end".format("", fleet.on_fallback, UNITS))
+
+
+if __name__ == '__main__':
+    main()
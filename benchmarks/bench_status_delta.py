@@ -0,0 +1,58 @@
+"""
+Delta status benchmark: status bytes per day in the simulator
+
+Runs the firmware in the simulator for 24 hours with the full status of every publish, the behavior before
+delta mode, and with status_delta_enabled and the defaults of unit/config.py: a keyframe every hour and a
+0.25 °C deadband on the water temperature. Two scenarios:
+- only the periodic status, every 10 minutes
+- a control message every hour and a status request every 2 hours on top, the status requests are answered
+  with a full status in both modes
+Reported are the status messages and the bytes of their QoS 1 PUBLISH packets on /global/status and
+/global/status_delta, so the time series and the errors are not counted.
+
+Runs on Linux with CPython 3, the MicroPython modules are provided by the simulator (sim).
+Run from the repository root: python -m benchmarks.bench_status_delta
+"""
+import json
+from sim.simulation import Simulation
+
+TOPICS = ("/global/status", "/global/status_delta")
+SCENARIOS = (("periodic only", 0, 0), ("control 1 h, requests 2 h", 3600, 7200))
+
+
+def publish_packet_bytes(topic, payload) -> int:
+    """ Fixed header, topic, packet id and payload of a QoS 1 PUBLISH """
+    remaining = 2 + len(topic) + 2 + len(payload)
+    return 1 + (1 if remaining < 128 else 2) + remaining
+
+
+def run(delta, control_every, status_request_every) -> tuple:
+    """ Returns the status messages and bytes of a day """
+    simulation = Simulation(24, config={"status_delta_enabled": delta})
+    simulation.add_default_hardware()
+    world = simulation.world
+    config = simulation.unit_config()
+    if status_request_every:
+        world.every(status_request_every, world.broker.publish, config.mqtt_topic_status_request, "")
+    if control_every:
+        state = [0]
+
+        def toggle_growlight():
+            state[0] ^= 1
+            world.broker.publish(config.mqtt_topic_control, json.dumps({"relay|growlight": state[0]}))
+        world.every(control_every, toggle_growlight)
+    simulation.run()
+    publications = [p for topic in TOPICS for p in world.broker.published(topic)]
+    return len(publications), sum(publish_packet_bytes(p.topic, p.payload) for p in publications)
+
+
+def main() -> None:
+    print("{:<28} {:<8} {:>10} {:>12}".format("", "mode", "messages", "bytes/day"))
+    for label, control_every, status_request_every in SCENARIOS:
+        for mode, delta in (("full", False), ("delta", True)):
+            messages, day_bytes = run(delta, control_every, status_request_every)
+            print("{:<28} {:<8} {:>10} {:>12}".format(label, mode, messages, day_bytes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Status encoding benchmark: ujson against the packed binary status
+
+Encodes the status of the unit, the dict UnitService.send_status_to_server builds, with ujson.dumps and with
+PackedStatusCodec.encode. Reported are the payload bytes, the bytes of the QoS 1 PUBLISH packet on its topic,
+the encode time on the host CPU, so only the ratio carries over to the MCU, and the peak heap allocated by
+an encode, traced by tracemalloc.
+
+A second part runs the firmware in the simulator for 24 hours publishing both formats, as a unit does while
+the server side migrates, and checks that every packed status decodes to the JSON one published with it.
+Reported are the status bytes per day on each topic.
+
+Runs on Linux with CPython 3, the MicroPython modules are provided by the simulator (sim).
+Run from the repository root: python -m benchmarks.bench_status_encoding
+"""
+import json
+import time
+import tracemalloc
+from sim.simulation import install_modules, Simulation
+
+install_modules()
+
+import ujson
+from unit import config
+from unit.packed_status import PackedStatusCodec
+
+ROUNDS = 20000
+TRACED_ROUNDS = 1000
+SENSOR = "ds18b20|waterTemperatureCelsius"
+RELAYS = ("relay|growlight", "relay|irrigation")
+SECONDS = ("irrigationOnSec", "irrigationOffSec")
+
+
+def status_dict() -> dict:
+    status = config.unit_id_dict.copy()
+    status.update([(SENSOR, 21.1875), (RELAYS[0], 1), (RELAYS[1], 0),
+                   (SECONDS[0], config.irrigation_on_sec), (SECONDS[1], config.irrigation_off_sec)])
+    return status
+
+
+def publish_packet_bytes(topic, payload) -> int:
+    """ Fixed header, topic, packet id and payload of a QoS 1 PUBLISH """
+    remaining = 2 + len(topic) + 2 + len(payload)
+    return 1 + (1 if remaining < 128 else 2) + remaining
+
+
+def encode_us(encode, status) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        encode(status)
+    return (time.perf_counter() - start) * 1e6 / ROUNDS
+
+
+def heap_per_encode(encode, status) -> float:
+    """ Returns the average peak heap in bytes allocated by an encode """
+    peak = 0
+    tracemalloc.start()
+    for _ in range(TRACED_ROUNDS):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        encode(status)
+        peak += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return peak / TRACED_ROUNDS
+
+
+def encoding() -> None:
+    codec = PackedStatusCodec(config.unit_id_dict, (SENSOR,), RELAYS, SECONDS)
+    status = status_dict()
+    assert codec.decode(codec.encode(status)) == status
+    print("{:<10} {:>14} {:>14} {:>12} {:>14}".format("format", "payload bytes", "packet bytes", "encode us",
+                                                      "peak heap B"))
+    for label, encode, topic in (("ujson", ujson.dumps, config.mqtt_topic_status),
+                                 ("packed", codec.encode, config.mqtt_topic_status_packed)):
+        payload = encode(status)
+        print("{:<10} {:>14} {:>14} {:>12.2f} {:>14.0f}".format(
+            label, len(payload), publish_packet_bytes(topic, payload), encode_us(encode, status),
+            heap_per_encode(encode, status)))
+
+
+def simulated_day() -> None:
+    simulation = Simulation(24, config={"status_formats": ["json", "packed"]})
+    simulation.add_default_hardware()
+    simulation.run()
+    broker = simulation.world.broker
+    codec = PackedStatusCodec(config.unit_id_dict, (SENSOR,), RELAYS, SECONDS)
+    statuses = broker.published(config.mqtt_topic_status)
+    packed = broker.published(config.mqtt_topic_status_packed)
+    assert len(statuses) == len(packed)
+    for json_status, packed_status in zip(statuses, packed):
+        assert codec.decode(packed_status.payload) == json.loads(json_status.payload)
+    print()
+    print("24 h in the simulator, {} statuses in each format, all the packed ones decoded".format(len(packed)))
+    print("{:<10} {:>14}".format("format", "bytes/day"))
+    for label, publications in (("ujson", statuses), ("packed", packed)):
+        print("{:<10} {:>14}".format(label, sum(publish_packet_bytes(p.topic, p.payload) for p in publications)))
+
+
+def main() -> None:
+    encoding()
+    simulated_day()
+
+
+if __name__ == '__main__':
+    main()
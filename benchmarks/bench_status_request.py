@@ -0,0 +1,62 @@
+"""
+Status request benchmark: request-to-publish latency under a burst of 20 status requests
+
+Runs the firmware in the simulator (TLS, 20 ms latency each way) and the server side sends 20 requests
+to /global/status_request, once all at the same moment and once one every 50 ms. A request is answered by the
+first status the broker gets after it, or by one it got at most status_request_window_ms (500 ms) before it,
+which the firmware doesn't repeat if nothing changed. The latency is the time from the request until the
+answer, 0 for the ones answered before. Also reported are the statuses published for the burst.
+The cached configuration is the default of unit/config.py: the status is sent with the latest water temperature
+sample and the requests of a burst are collapsed. The uncached one takes a new sample, a 750 ms conversion,
+for every status.
+The numbers are in virtual time, so they are the same on every host.
+
+Runs on Linux with CPython 3, the MicroPython modules are provided by the simulator (sim).
+Run from the repository root: python -m benchmarks.bench_status_request
+"""
+from sim.simulation import Simulation
+
+REQUESTS = 20
+WINDOW_MS = 500
+BURSTS = (("20 at once", 1830, 0), ("one every 50 ms", 2130, 50))
+CONFIGS = (
+    ("cached", {"status_request_window_ms": WINDOW_MS}),
+    ("uncached", {"water_temp_max_age_sec": 0}),
+)
+REQUEST_TOPIC = "/global/status_request"
+STATUS_TOPIC = "/global/status"
+
+
+def run(overrides) -> list:
+    """ Returns the latencies in ms and the statuses published for each burst """
+    simulation = Simulation(0.75, config=overrides)
+    simulation.add_default_hardware()
+    world = simulation.world
+    requests = {}
+    for label, start_s, spacing_ms in BURSTS:
+        requests[label] = [start_s * 1000 + i * spacing_ms for i in range(REQUESTS)]
+        for request_ms in requests[label]:
+            world.at(request_ms / 1000, world.broker.publish, REQUEST_TOPIC, "")
+    simulation.run()
+    statuses = [p.time_ms for p in world.broker.published(STATUS_TOPIC)]
+    results = []
+    for label, start_s, _ in BURSTS:
+        latencies = [max(0, next(t for t in statuses if t >= request_ms - WINDOW_MS) - request_ms)
+                     for request_ms in requests[label]]
+        published = sum(1 for t in statuses if start_s * 1000 <= t < start_s * 1000 + 60000)
+        results.append((label, latencies, published))
+    return results
+
+
+def main() -> None:
+    print("{:<10} {:<16} {:>12} {:>12} {:>12} {:>10}".format(
+        "", "burst", "median ms", "max ms", "sum ms", "statuses"))
+    for config_label, overrides in CONFIGS:
+        for label, latencies, published in run(overrides):
+            latencies.sort()
+            print("{:<10} {:<16} {:>12} {:>12} {:>12} {:>10}".format(
+                config_label, label, latencies[len(latencies) // 2], latencies[-1], sum(latencies), published))
+
+
+if __name__ == '__main__':
+    main()
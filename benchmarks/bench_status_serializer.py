@@ -0,0 +1,116 @@
+"""
+Status serializer benchmark: JsonSerializer against the dict copy and ujson.dumps of every publish
+
+Serializes the status and an error message the way UnitService did before, copying config.unit_id_dict,
+updating it with the values and calling ujson.dumps, and with the JsonSerializer compiled from the status schema
+at boot, which is given the values only. Both have to produce the same document, for the 1/16 °C steps of
+a DS18B20 and for temperatures with more decimals.
+The status is encoded with the same values every time and with a new water temperature in every message,
+the serializer keeps the encoded numbers that didn't change.
+Reported are the encode time on the host CPU, the best of 5 runs, so only the ratio carries over to the MCU,
+and the peak heap allocated by one message, traced by tracemalloc, next to the size of the message the
+serializer has to copy out of its buffer.
+
+Runs on Linux with CPython 3, the MicroPython modules are provided by the simulator (sim).
+Run from the repository root: python -m benchmarks.bench_status_serializer
+"""
+import time
+import tracemalloc
+from sim.simulation import install_modules
+
+install_modules()
+
+import ujson
+from unit import config
+from unit.json_serializer import JsonSerializer
+
+ROUNDS = 20000
+RUNS = 5
+TRACED_ROUNDS = 1000
+STATUS_KEYS = ("ds18b20|waterTemperatureCelsius", "relay|growlight", "relay|irrigation",
+               "irrigationOnSec", "irrigationOffSec")
+STATUS_VALUES = [21.1875, 1, 0, config.irrigation_on_sec, config.irrigation_off_sec]
+TEMPERATURES = [20 + i / 16 for i in range(64)]
+ERROR = "Unit service - Error! Unrecognized module id: relay|bogus in {\"relay|bogus\": 1}"
+
+
+def status_dict_dumps(temperature=STATUS_VALUES[0]) -> str:
+    """ The former path of send_status_to_server """
+    status_dict = config.unit_id_dict.copy()
+    status_dict.update([
+        (STATUS_KEYS[0], temperature),
+        (STATUS_KEYS[1], STATUS_VALUES[1]),
+        (STATUS_KEYS[2], STATUS_VALUES[2]),
+        ("irrigationOnSec", config.irrigation_on_sec),
+        ("irrigationOffSec", config.irrigation_off_sec)
+    ])
+    return ujson.dumps(status_dict)
+
+
+def error_dict_dumps() -> str:
+    """ The former path of send_error_to_server """
+    error_dict = config.unit_id_dict.copy()
+    error_dict.update({
+        "error": ERROR
+    })
+    return ujson.dumps(error_dict)
+
+
+def encode_us(encode) -> float:
+    best = None
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            encode()
+        run_us = (time.perf_counter() - start) * 1e6 / ROUNDS
+        if best is None or run_us < best:
+            best = run_us
+    return best
+
+
+def heap_per_message(encode) -> float:
+    """ Returns the average peak heap in bytes allocated by one message """
+    peak = 0
+    tracemalloc.start()
+    for _ in range(TRACED_ROUNDS):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        encode()
+        peak += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return peak / TRACED_ROUNDS
+
+
+def main() -> None:
+    status_serializer = JsonSerializer(config.unit_id_dict, STATUS_KEYS)
+    error_serializer = JsonSerializer(config.unit_id_dict, ("error",))
+    changing = [0]
+
+    def next_temperature() -> float:
+        changing[0] += 1
+        return TEMPERATURES[changing[0] & 63]
+
+    cases = (
+        ("status", "dict + ujson", status_dict_dumps),
+        ("status", "JsonSerializer",
+         lambda: status_serializer.encode([STATUS_VALUES[0], STATUS_VALUES[1], STATUS_VALUES[2],
+                                           config.irrigation_on_sec, config.irrigation_off_sec])),
+        ("status, new temperature", "dict + ujson", lambda: status_dict_dumps(next_temperature())),
+        ("status, new temperature", "JsonSerializer",
+         lambda: status_serializer.encode([next_temperature(), STATUS_VALUES[1], STATUS_VALUES[2],
+                                           config.irrigation_on_sec, config.irrigation_off_sec])),
+        ("error", "dict + ujson", error_dict_dumps),
+        ("error", "JsonSerializer", lambda: error_serializer.encode((ERROR,))),
+    )
+    assert status_serializer.encode(STATUS_VALUES).decode() == status_dict_dumps()
+    assert error_serializer.encode((ERROR,)).decode() == error_dict_dumps()
+    for temperature in TEMPERATURES + [21.123456, -0.1, 1e-7, 25]:
+        assert status_serializer.encode([temperature] + STATUS_VALUES[1:]).decode() == status_dict_dumps(temperature)
+    print("{:<24} {:<16} {:>10} {:>12} {:>14}".format("message", "path", "bytes", "encode us", "peak heap B"))
+    for message, label, encode in cases:
+        print("{:<24} {:<16} {:>10} {:>12.2f} {:>14.0f}".format(
+            message, label, len(encode()), encode_us(encode), heap_per_message(encode)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""
+StreamReader benchmark
+
+Streams 64 KB through a local socketpair and reads it back with the buffered StreamReader and with the
+previous reader that concatenated every read with buf += res:
+- readexactly of the whole stream in one call and in 1 KB frames
+- readline of 64 byte lines
+- readexactly_into a preallocated buffer (buffered reader only)
+Reported are the wall time, the reads of the socket and the peak heap allocated while reading.
+
+Runs on Linux with CPython 3, the MicroPython modules are provided by the simulator (sim).
+Run from the repository root: python -m benchmarks.bench_stream
+"""
+import select
+import socket
+import time as host_time
+import tracemalloc
+from sim.simulation import install_modules
+from sim import world
+
+install_modules()
+world.current = world.World()
+
+import uasyncio as asyncio
+from uasyncio import IORead, IOReadDone
+
+STREAM_BYTES = 64 * 1024
+FRAME_BYTES = 1024
+LINE = b"x" * 63 + b"\n"
+# lwIP hands out at most one TCP segment per read
+SEGMENT_BYTES = 1460
+REPEAT = 5
+
+
+class ConcatStreamReader:
+    """ The previous StreamReader, growing the result with buf += res """
+
+    def __init__(self, polls, ios=None):
+        if ios is None:
+            ios = polls
+        self.polls = polls
+        self.ios = ios
+
+    @asyncio.coroutine
+    def readexactly(self, n):
+        buf = b""
+        while n:
+            yield IORead(self.polls)
+            res = self.ios.read(n)
+            assert res is not None
+            if not res:
+                yield IOReadDone(self.polls)
+                break
+            buf += res
+            n -= len(res)
+        return buf
+
+    @asyncio.coroutine
+    def readline(self):
+        buf = b""
+        while True:
+            yield IORead(self.polls)
+            res = self.ios.readline()
+            assert res is not None
+            if not res:
+                yield IOReadDone(self.polls)
+                break
+            buf += res
+            if buf[-1] == 0x0a:
+                break
+        return buf
+
+
+class SocketStream:
+    """ One end of a local socketpair with the stream methods of a MicroPython socket, one segment per read """
+
+    def __init__(self, sock) -> None:
+        sock.setblocking(False)
+        self.sock = sock
+        self.reads = 0
+
+    def read(self, n=-1):
+        self.reads += 1
+        try:
+            return self.sock.recv(n if 0 < n < SEGMENT_BYTES else SEGMENT_BYTES)
+        except BlockingIOError:
+            return None
+
+    def readinto(self, buf):
+        self.reads += 1
+        try:
+            return self.sock.recv_into(buf, min(len(buf), SEGMENT_BYTES))
+        except BlockingIOError:
+            return None
+
+    def readline(self):
+        self.reads += 1
+        try:
+            peek = self.sock.recv(SEGMENT_BYTES, socket.MSG_PEEK)
+        except BlockingIOError:
+            return None
+        end = peek.find(b"\n")
+        return self.sock.recv(len(peek) if end < 0 else end + 1)
+
+    def close(self):
+        self.sock.close()
+
+    def _poll_events(self) -> int:
+        readable, _, _ = select.select([self.sock], [], [], 0)
+        return 1 if readable else 0
+
+
+def stream_of(data: bytes) -> SocketStream:
+    a, b = socket.socketpair()
+    a.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 * STREAM_BYTES)
+    b.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * STREAM_BYTES)
+    a.sendall(data)
+    a.shutdown(socket.SHUT_WR)
+    a.close()
+    return SocketStream(b)
+
+
+def measure(reader_class, data: bytes, consume) -> tuple:
+    """ Returns the best wall time in ms, the socket reads and the peak heap in bytes of reading data """
+    loop = asyncio.get_event_loop()
+    best = None
+    for _ in range(REPEAT):
+        stream = stream_of(data)
+        reader = reader_class(stream)
+        tracemalloc.start()
+        start = host_time.perf_counter()
+        loop.run_until_complete(consume(reader))
+        elapsed = host_time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        # Readers that didn't reach the end of the stream leave it registered
+        try:
+            loop.remove_reader(stream)
+        except (OSError, KeyError):
+            pass
+        stream.close()
+        if best is None or elapsed < best[0]:
+            best = (elapsed, stream.reads, peak)
+    return round(best[0] * 1000, 3), best[1], best[2]
+
+
+async def read_whole(reader):
+    assert len(await reader.readexactly(STREAM_BYTES)) == STREAM_BYTES
+
+
+async def read_frames(reader):
+    for _ in range(STREAM_BYTES // FRAME_BYTES):
+        assert len(await reader.readexactly(FRAME_BYTES)) == FRAME_BYTES
+
+
+async def read_lines(reader):
+    for _ in range(STREAM_BYTES // len(LINE)):
+        assert await reader.readline() == LINE
+
+
+FRAME = memoryview(bytearray(FRAME_BYTES))
+
+
+async def read_frames_into(reader):
+    for _ in range(STREAM_BYTES // FRAME_BYTES):
+        assert await reader.readexactly_into(FRAME) == FRAME_BYTES
+
+
+def main() -> None:
+    data = bytes(range(256)) * (STREAM_BYTES // 256)
+    lines = LINE * (STREAM_BYTES // len(LINE))
+    print("{:<34} {:>10} {:>8} {:>12}".format("64 KB via socketpair", "ms", "reads", "peak heap B"))
+    for label, reader_class, payload, consume in (
+            ("readexactly 64 KB, concat (before)", ConcatStreamReader, data, read_whole),
+            ("readexactly 64 KB, buffered", asyncio.StreamReader, data, read_whole),
+            ("readexactly 1 KB, concat (before)", ConcatStreamReader, data, read_frames),
+            ("readexactly 1 KB, buffered", asyncio.StreamReader, data, read_frames),
+            ("readexactly_into 1 KB, buffered", asyncio.StreamReader, data, read_frames_into),
+            ("readline 64 B, concat (before)", ConcatStreamReader, lines, read_lines),
+            ("readline 64 B, buffered", asyncio.StreamReader, lines, read_lines)):
+        ms, reads, peak = measure(reader_class, payload, consume)
+        print("{:<34} {:>10.3f} {:>8} {:>12}".format(label, ms, reads, peak))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+Synchronisation primitives benchmark
+
+- fairness: tasks contending for a Lock and a Semaphore(2) must be served in FIFO order, so the
+  acquisitions go round robin over the tasks in the order they first queued up
+- wake order of a Condition: the waiters must be woken in the order they started waiting, by notify()
+  one at a time and by notify_all()
+- wakeup latency of Event.set() compared to the shared_flags style busy loop
+  "while not flag: await asyncio.sleep(0)", together with the number of busy iterations it burns.
+  The latency is the CPU time on the host from setting the flag until the waiter resumes, so only the ratio
+  carries over to the MCU. The virtual clock of the simulator charges every loop iteration a fixed 100 us,
+  which would be the same for both.
+Exits non-zero if an order is not FIFO.
+
+Runs on Linux with CPython 3, the MicroPython modules are provided by the simulator (sim).
+Run from the repository root: python -m benchmarks.bench_synchro
+"""
+import sys
+import time as host_time
+from sim.simulation import install_modules
+from sim import world
+
+install_modules()
+world.current = world.World()
+
+import uasyncio as asyncio
+from uasyncio.synchro import Lock, Semaphore, Event, Condition
+
+CONTENDERS = 5
+ROUNDS = 20
+WAKEUPS = 20
+SET_AFTER_MS = 20
+
+
+def measure_fairness(primitive) -> tuple:
+    """ Returns the acquisitions per task and whether the acquisitions followed FIFO order """
+    loop = asyncio.get_event_loop()
+    order = []
+
+    async def contender(i):
+        for _ in range(ROUNDS):
+            await primitive.acquire()
+            order.append(i)
+            await asyncio.sleep_ms(1)
+            primitive.release()
+
+    async def scenario():
+        tasks = [loop.create_task(contender(i)) for i in range(CONTENDERS)]
+        for task in tasks:
+            await task
+
+    loop.run_until_complete(scenario())
+    counts = [order.count(i) for i in range(CONTENDERS)]
+    # The tasks queue up in the order they were created and a released task goes to the back of the queue
+    fifo = order == list(range(CONTENDERS)) * ROUNDS
+    return counts, fifo
+
+
+def measure_condition_order(notify_all: bool) -> tuple:
+    """ Returns the order the waiters of a Condition were woken in and whether it is FIFO """
+    loop = asyncio.get_event_loop()
+    condition = Condition()
+    order = []
+
+    async def waiter(i):
+        async with condition:
+            await condition.wait()
+            order.append(i)
+
+    async def scenario():
+        # Staggered, so the waiters start waiting in a known order, not that of their creation
+        waiting = [(CONTENDERS - 1 - i) * 3 % CONTENDERS for i in range(CONTENDERS)]
+        tasks = []
+        for i in waiting:
+            tasks.append(loop.create_task(waiter(i)))
+            await asyncio.sleep_ms(1)
+        for _ in range(1 if notify_all else CONTENDERS):
+            async with condition:
+                if notify_all:
+                    condition.notify_all()
+                else:
+                    condition.notify()
+            await asyncio.sleep_ms(1)
+        for task in tasks:
+            await task
+        return waiting
+
+    waiting = loop.run_until_complete(scenario())
+    return order, order == waiting
+
+
+def measure_wakeup(use_event: bool) -> tuple:
+    """ Returns the average and maximum wakeup latency in nanoseconds on the host and the busy loop iterations """
+    loop = asyncio.get_event_loop()
+    latencies = []
+    busy_iterations = [0]
+    state = {"flag": False, "set_at": 0}
+    event = Event()
+
+    async def waiter():
+        if use_event:
+            await event.wait()
+        else:
+            while not state["flag"]:
+                busy_iterations[0] += 1
+                await asyncio.sleep(0)
+        latencies.append(host_time.perf_counter_ns() - state["set_at"])
+
+    async def scenario():
+        for _ in range(WAKEUPS):
+            event.clear()
+            state["flag"] = False
+            task = loop.create_task(waiter())
+            await asyncio.sleep_ms(SET_AFTER_MS)
+            state["set_at"] = host_time.perf_counter_ns()
+            state["flag"] = True
+            event.set()
+            await task
+
+    loop.run_until_complete(scenario())
+    return sum(latencies) // len(latencies), max(latencies), busy_iterations[0]
+
+
+def main() -> None:
+    ok = True
+    for label, primitive in (("Lock", Lock()), ("Semaphore(2)", Semaphore(2))):
+        counts, fifo = measure_fairness(primitive)
+        print("{:<14} acquisitions per task: {}  FIFO: {}".format(label, counts, fifo))
+        ok &= fifo
+    for label, notify_all in (("notify()", False), ("notify_all()", True)):
+        order, fifo = measure_condition_order(notify_all)
+        print("{:<14} Condition wake order: {}  FIFO: {}".format(label, order, fifo))
+        ok &= fifo
+    for label, use_event in (("busy loop", False), ("Event", True)):
+        avg_ns, max_ns, busy = measure_wakeup(use_event)
+        print("{:<14} wakeup latency on the host avg: {:>6}ns  max: {:>6}ns  busy iterations: {}".format(
+            label, avg_ns, max_ns, busy))
+    if not ok:
+        print("FAIL: waiters were not served in FIFO order")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+DS18B20 sampling benchmark: 8 sensors on 2 buses
+
+Samples 4 sensors on each of 2 1-wire buses of the simulator, whose bus transactions and conversions take their
+time on the virtual clock:
+- before: each bus read in turn the way TempSensorDS18B20.read_all_celsius did before ROM caching, scanning
+  the bus, converting and waiting 750 ms for every read
+- each bus read in turn with TempSensorDS18B20.read_all_celsius, the ROM codes kept from the first scan
+- TempSensorManager: the conversions started on both buses at once with one wait, at 12 to 9 bits
+Reported are the milliseconds per sample of all the sensors and the bus transactions per sample,
+averaged over 20 samples after the first one, which scans the buses.
+The numbers are in virtual time, so they are the same on every host.
+
+Runs on Linux with CPython 3, the MicroPython modules are provided by the simulator (sim).
+Run from the repository root: python -m benchmarks.bench_temp_sensors
+"""
+import importlib
+from sim.simulation import install_modules, purge_firmware
+from sim import world
+
+install_modules()
+
+PINS = (23, 25)
+SENSORS_PER_BUS = 4
+SAMPLES = 20
+
+
+async def rescan_each_read(sensors) -> None:
+    """ The former read_all_celsius of every bus in turn """
+    asyncio = importlib.import_module("uasyncio")
+    for sensor in sensors:
+        roms = sensor.channel.scan()
+        sensor.channel.convert_temp()
+        await asyncio.sleep_ms(750)
+        sensor.store_sample([sensor.channel.read_temp(rom) for rom in roms])
+
+
+async def each_bus_in_turn(sensors) -> None:
+    for sensor in sensors:
+        sensor.store_sample(await sensor.read_all_celsius())
+
+
+def run(sample, resolution) -> tuple:
+    """ Returns the ms and the bus transactions per sample """
+    purge_firmware()
+    current = world.current = world.World(hours=1)
+    for pin in PINS:
+        for _ in range(SENSORS_PER_BUS):
+            current.add_sensor(pin)
+    asyncio = importlib.import_module("uasyncio")
+    TempSensorDS18B20 = importlib.import_module("modules.temp_sensor_ds18b20").TempSensorDS18B20
+    TempSensorManager = importlib.import_module("modules.temp_sensor_manager").TempSensorManager
+    sensors = [TempSensorDS18B20("bus{}".format(i), pin, resolution) for i, pin in enumerate(PINS)]
+    manager = TempSensorManager(sensors)
+    loop = asyncio.get_event_loop()
+
+    async def sampling():
+        if sample is None:
+            await manager.sample()
+        else:
+            await sample(sensors)
+
+    loop.run_until_complete(sampling())
+    start_ms = current.clock.time_ms()
+    start_transactions = sum(bus.transactions for bus in current.buses.values())
+    for _ in range(SAMPLES):
+        loop.run_until_complete(sampling())
+    assert all(len(sensor.last_readings) == SENSORS_PER_BUS for sensor in sensors)
+    transactions = sum(bus.transactions for bus in current.buses.values()) - start_transactions
+    return (current.clock.time_ms() - start_ms) / SAMPLES, transactions / SAMPLES
+
+
+def main() -> None:
+    print("{} sensors on {} buses".format(SENSORS_PER_BUS * len(PINS), len(PINS)))
+    print("{:<34} {:>14} {:>14}".format("", "ms/sample", "transactions"))
+    for label, sample, resolution in (("before: rescan on every read", rescan_each_read, 12),
+                                      ("cached ROMs, bus after bus", each_bus_in_turn, 12),
+                                      ("TempSensorManager, 12 bit", None, 12),
+                                      ("TempSensorManager, 11 bit", None, 11),
+                                      ("TempSensorManager, 10 bit", None, 10),
+                                      ("TempSensorManager, 9 bit", None, 9)):
+        ms, transactions = run(sample, resolution)
+        print("{:<34} {:>14.1f} {:>14.1f}".format(label, ms, transactions))
+
+
+if __name__ == '__main__':
+    main()
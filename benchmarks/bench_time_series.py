@@ -0,0 +1,97 @@
+"""
+Time series benchmark: memory and aggregation speed of a 24 hour buffer
+
+Fills the TimeSeries of the water temperature (int16 in 1/16 °C) with 24 hours of samples taken every 15 s,
+the default of unit/config.py, and every 5 s, and compares it with keeping the samples in a list of floats,
+an object per sample, trimmed to the same length.
+Reported are the bytes allocated by the buffer once full and by 24 more hours of samples (the TimeSeries
+allocates nothing after boot), traced by tracemalloc, and the microseconds an aggregate of min, max, mean
+and last takes over a 10 minute upload window and over the whole buffer, on the host CPU, so only the
+ratios carry over to the MCU.
+
+Runs on Linux with CPython 3, the MicroPython modules are provided by the simulator (sim).
+Run from the repository root: python -m benchmarks.bench_time_series
+"""
+import math
+import time
+import tracemalloc
+from sim.simulation import install_modules
+
+install_modules()
+
+from unit.time_series import TimeSeries
+
+INTERVALS_SEC = (15, 5)
+WINDOW_SEC = 600
+ROUNDS = 200
+
+
+class ListSeries:
+    """ The samples as a list of floats, trimmed to the capacity """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.values = []
+
+    def append(self, value) -> None:
+        self.values.append(value)
+        if len(self.values) > self.capacity:
+            del self.values[0]
+
+    def aggregate(self, samples: int):
+        window = self.values[-samples:]
+        return min(window), max(window), sum(window) / len(window), window[-1]
+
+
+def temperature(i) -> float:
+    return round((21.0 + 1.5 * math.sin(i / 500)) * 16) / 16
+
+
+def append_day(series, capacity, first=0) -> None:
+    for i in range(first, first + capacity):
+        series.append(temperature(i))
+
+
+def allocated(f) -> int:
+    """ Returns the bytes f leaves allocated """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    keep = f()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del keep
+    return after - before
+
+
+def aggregate_us(series, samples) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        series.aggregate(samples)
+    return (time.perf_counter() - start) * 1e6 / ROUNDS
+
+
+def main() -> None:
+    print("{:<8} {:<12} {:>9} {:>14} {:>16} {:>12} {:>12}".format(
+        "every", "buffer", "samples", "full bytes", "+24 h bytes", "window us", "24 h us"))
+    for interval in INTERVALS_SEC:
+        capacity = 24 * 3600 // interval
+        window = WINDOW_SEC // interval
+        for label, make in (("TimeSeries", lambda: TimeSeries(capacity, "h", 16)),
+                            ("float list", lambda: ListSeries(capacity))):
+            def fill():
+                series = make()
+                append_day(series, capacity)
+                return series
+
+            full_bytes = allocated(fill)
+            series = fill()
+            more_bytes = allocated(lambda: append_day(series, capacity, capacity))
+            expected = [temperature(i) for i in range(capacity, 2 * capacity)]
+            assert series.aggregate(capacity) == (min(expected), max(expected), sum(expected) / capacity, expected[-1])
+            print("{:<8} {:<12} {:>9} {:>14} {:>16} {:>12.1f} {:>12.1f}".format(
+                "{} s".format(interval), label, capacity, full_bytes, more_bytes,
+                aggregate_us(series, window), aggregate_us(series, capacity)))
+
+
+if __name__ == '__main__':
+    main()
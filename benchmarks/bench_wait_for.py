@@ -0,0 +1,112 @@
+"""
+wait_for benchmark
+
+Issues 10,000 quick wait_for calls with a long timeout and tracks the length of the event loop's waitq.
+Before, every call left its timeout timer in the waitq until the deadline, now the timer is removed
+as soon as the guarded co-routine completes, so the waitq has to stay flat.
+Then checks the race of a co-routine that completes in the same tick its timeout expires: the timeout
+timer is already in the runq then and can't be removed anymore, it must not throw a TimeoutError into
+the task after wait_for has returned. Exits non-zero if a check fails.
+
+Runs on Linux with CPython 3, the MicroPython modules are provided by the simulator (sim).
+Run from the repository root: python -m benchmarks.bench_wait_for
+"""
+import sys
+import time as host_time
+from sim.simulation import install_modules
+from sim import world
+
+install_modules()
+world.current = world.World()
+
+import utime as time
+import uasyncio as asyncio
+from uasyncio.queues import Queue
+
+CALLS = 10000
+TIMEOUT_SEC = 60
+RACE_TIMEOUT_MS = 10
+RACES = 100
+
+
+async def quick_operation() -> int:
+    await asyncio.sleep_ms(0)
+    return 1
+
+
+def measure_wait_for() -> dict:
+    loop = asyncio.get_event_loop()
+    result = {"calls": CALLS, "waitqStart": len(loop.waitq)}
+
+    async def scenario():
+        max_len = 0
+        start = host_time.perf_counter()
+        for _ in range(CALLS):
+            await asyncio.wait_for(quick_operation(), TIMEOUT_SEC)
+            if len(loop.waitq) > max_len:
+                max_len = len(loop.waitq)
+        result["usPerCall"] = (host_time.perf_counter() - start) * 1e6 / CALLS
+        result["waitqMax"] = max_len
+        result["waitqEnd"] = len(loop.waitq)
+
+    loop.run_until_complete(scenario())
+    return result
+
+
+def measure_same_tick() -> dict:
+    """
+    The producer blocks past the deadline of the consumer's wait_for and then hands it an item, so the
+    consumer is queued in the runq ahead of its expired timeout and completes before the timeout runs.
+    """
+    loop = asyncio.get_event_loop()
+    result = {"races": RACES, "waitqStart": len(loop.waitq), "completed": 0, "lateTimeouts": 0}
+
+    async def producer(queue):
+        await asyncio.sleep_ms(1)
+        time.sleep_ms(RACE_TIMEOUT_MS)
+        queue.put_nowait(1)
+
+    async def consumer():
+        queue = Queue()
+        for _ in range(RACES):
+            loop.create_task(producer(queue))
+            try:
+                await asyncio.wait_for_ms(queue.get(), RACE_TIMEOUT_MS)
+            except asyncio.TimeoutError:
+                continue
+            result["completed"] += 1
+            try:
+                # Anything after wait_for returned, a late timeout would arrive here
+                await asyncio.sleep_ms(RACE_TIMEOUT_MS)
+            except asyncio.TimeoutError:
+                result["lateTimeouts"] += 1
+        result["waitqEnd"] = len(loop.waitq)
+
+    loop.run_until_complete(consumer())
+    return result
+
+
+def check(ok: bool, message: str) -> bool:
+    if not ok:
+        print("FAIL: " + message)
+    return ok
+
+
+def main() -> None:
+    result = measure_wait_for()
+    print("{calls} wait_for calls: waitq start: {waitqStart}, max: {waitqMax}, end: {waitqEnd}, "
+          "{usPerCall:.1f}us per call on the host".format(**result))
+    ok = check(result["waitqMax"] <= result["waitqStart"] + 1, "Timeout timers are left in the waitq")
+    ok &= check(result["waitqEnd"] == result["waitqStart"], "Timeout timers are not released")
+    race = measure_same_tick()
+    print("{races} wait_for calls completing in the tick of their timeout: completed: {completed}, "
+          "TimeoutError after completion: {lateTimeouts}, waitq end: {waitqEnd}".format(**race))
+    ok &= check(race["completed"] == RACES, "wait_for timed out although the co-routine completed first")
+    ok &= check(race["lateTimeouts"] == 0, "TimeoutError delivered after wait_for returned")
+    ok &= check(race["waitqEnd"] == race["waitqStart"], "Timeout timers are not released")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+StreamWriter vectored write benchmark
+
+Writes 1,000 MQTT PUBLISH frames (fixed header, topic, payload) the three ways a protocol can:
+- concatenating the pieces and calling awrite() once, which allocates the whole frame
+- awriteiter() over the pieces, as it was: one write of the stream per piece
+- awritev() gathering the pieces in the scratch buffer of the writer
+Reported are the frames per second on the host CPU, the best of 5 runs, so only the ratios carry over to the
+MCU, the writes of the stream per frame and the peak heap allocated per frame, net of the coroutine the
+benchmark itself runs per frame.
+A second run writes to a stream accepting only part of every write, to check partial writes are resumed,
+and awritev() once more with a 64 byte scratch buffer, smaller than the frame, taking 20 bytes per write.
+
+Runs on Linux with CPython 3, the MicroPython modules are provided by the simulator (sim).
+Run from the repository root: python -m benchmarks.bench_writev
+"""
+import time as host_time
+import tracemalloc
+from sim.simulation import install_modules
+from sim import world
+
+install_modules()
+world.current = world.World()
+
+import uasyncio as asyncio
+
+FRAMES = 1000
+REPEAT = 5
+TOPIC = b"/units/tlvlp.iot.BazsalikON-aero/control"
+PAYLOAD = b'{"unitID": "tlvlp.iot.BazsalikON-aero", "relay|growlight": 1, "waterTemperatureCelsius": 21.5}'
+
+
+class SinkStream:
+    """ Always writable stream, accepting at most max_write bytes per write if set """
+
+    def __init__(self, max_write=0) -> None:
+        self.max_write = max_write
+        # What was written, None to only count the bytes
+        self.out = bytearray()
+        self.written = 0
+        self.writes = 0
+
+    def write(self, buf, off=0, sz=-1):
+        self.writes += 1
+        if sz < 0:
+            sz = len(buf) - off
+        if self.max_write and sz > self.max_write:
+            sz = self.max_write
+        self.written += sz
+        if self.out is not None:
+            self.out += memoryview(buf)[off:off + sz]
+        return sz
+
+    def close(self):
+        pass
+
+    def _poll_events(self) -> int:
+        return 4  # POLLOUT
+
+
+def frame_pieces() -> tuple:
+    """ The fixed header, topic and payload of a QoS 0 PUBLISH """
+    remaining = 2 + len(TOPIC) + len(PAYLOAD)
+    header = bytes([0x30, remaining & 0x7F | 0x80, remaining >> 7]) if remaining > 0x7F \
+        else bytes([0x30, remaining])
+    return header, len(TOPIC).to_bytes(2, "big"), TOPIC, PAYLOAD
+
+
+async def write_concat(writer, pieces):
+    await writer.awrite(b"".join(pieces))
+
+
+async def write_per_piece(writer, pieces):
+    # awriteiter() before it gathered the pieces
+    for piece in pieces:
+        await writer.awrite(piece)
+
+
+async def write_vectored(writer, pieces):
+    await writer.awritev(pieces)
+
+
+async def write_nothing(writer, pieces):
+    # Baseline of the heap used by the benchmark itself
+    pass
+
+
+def heap_per_frame(write, writer, pieces) -> float:
+    """ Returns the average peak heap in bytes allocated while writing a frame """
+    loop = asyncio.get_event_loop()
+
+    async def traced():
+        peak = 0
+        for _ in range(FRAMES):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            await write(writer, pieces)
+            peak += tracemalloc.get_traced_memory()[1] - before
+        return peak
+
+    writer.s.out = None
+    tracemalloc.start()
+    peak = loop.run_until_complete(traced())
+    tracemalloc.stop()
+    return peak / FRAMES
+
+
+def measure(write, max_write=0, baseline=0.0, bufsize=256) -> tuple:
+    """ Returns the frames per second, writes per frame and peak heap bytes per frame above the baseline """
+    loop = asyncio.get_event_loop()
+    pieces = frame_pieces()
+    stream = SinkStream(max_write)
+    writer = asyncio.StreamWriter(stream, {}, bufsize)
+
+    async def timed():
+        start = host_time.perf_counter()
+        for _ in range(FRAMES):
+            await write(writer, pieces)
+        return host_time.perf_counter() - start
+
+    elapsed = loop.run_until_complete(timed())
+    assert stream.out == b"".join(pieces) * FRAMES
+    stream.out = None
+    for _ in range(REPEAT - 1):
+        elapsed = min(elapsed, loop.run_until_complete(timed()))
+    writes = stream.writes / (FRAMES * REPEAT)
+    return FRAMES / elapsed, writes, heap_per_frame(write, writer, pieces) - baseline
+
+
+def main() -> None:
+    print("{} frames of {} bytes".format(FRAMES, sum(len(piece) for piece in frame_pieces())))
+    baseline = heap_per_frame(write_nothing, asyncio.StreamWriter(SinkStream(), {}), frame_pieces())
+    print("{:<42} {:>12} {:>14} {:>14}".format("", "frames/s", "writes/frame", "heap B/frame"))
+    for max_write in (0, 50):
+        for label, write in (("concat + awrite", write_concat),
+                             ("awrite per piece (before)", write_per_piece),
+                             ("awritev", write_vectored)):
+            if max_write:
+                label += ", partial writes"
+            rate, writes, heap = measure(write, max_write, baseline)
+            print("{:<42} {:>12.0f} {:>14.2f} {:>14.1f}".format(label, rate, writes, heap))
+    rate, writes, heap = measure(write_vectored, 20, baseline, 64)
+    print("{:<42} {:>12.0f} {:>14.2f} {:>14.1f}".format("awritev, 20 B writes, 64 B scratch", rate, writes, heap))
+
+
+if __name__ == '__main__':
+    main()
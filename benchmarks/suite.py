@@ -0,0 +1,406 @@
+"""
+Benchmark suite of the hot paths of the firmware
+
+Runs on Linux with CPython 3 against the vendored uasyncio, the MicroPython modules are provided by the
+stand-ins of the simulator (sim). The event loop runs on the virtual clock, so sleeps cost no wall time
+and the numbers only reflect the work done. Every case is run a few times and the best run is reported:
+- event loop: create_task spawn rate and call_soon callback throughput
+- waitq: TimerQueue push/pop and remove
+- Queue put/get round trips between two tasks
+- StreamReader readexactly, readexactly_into and readline throughput
+- the incoming MQTT path: MqttService.callback -> UnitService.handle_control_event -> status publish
+
+Results are printed as JSON, compare two runs to catch regressions:
+    python -m benchmarks.suite --output before.json
+    python -m benchmarks.suite --compare before.json
+
+Run from the repository root: python -m benchmarks.suite [--quick] [--output FILE] [--compare FILE]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time as host_time
+from sim.simulation import install_modules
+from sim import world
+
+install_modules()
+world.current = world.World()
+
+import uasyncio as asyncio
+from uasyncio.queues import Queue
+from uasyncio.timerq import TimerQueue
+
+REPEAT = 5
+SCALE = 1.0
+
+CASES = []
+
+
+def case(name: str, unit: str):
+    """ Registers a benchmark case, the function returns the number of operations done """
+    def register(f):
+        CASES.append((name, unit, f))
+        return f
+    return register
+
+
+def get_loop():
+    # The queues may grow to absorb the bursts of the spawn benchmarks
+    return asyncio.get_event_loop(16, 16, 1 << 16)
+
+
+def n_of(n: int) -> int:
+    return max(1, int(n * SCALE))
+
+
+# Event loop
+
+@case("loop.create_task", "tasks")
+def bench_create_task() -> int:
+    loop = get_loop()
+    n = n_of(20000)
+
+    async def noop():
+        pass
+
+    async def spawner():
+        for i in range(n):
+            loop.create_task(noop())
+            if i & 63 == 63:
+                await asyncio.sleep(0)
+        while loop.task_count() > 1:
+            await asyncio.sleep(0)
+
+    loop.run_until_complete(spawner())
+    return n
+
+
+@case("loop.call_soon", "callbacks")
+def bench_call_soon() -> int:
+    loop = get_loop()
+    n = n_of(50000)
+    done = [0]
+
+    def callback(i):
+        done[0] += 1
+
+    async def scheduler():
+        for i in range(n):
+            loop.call_soon(callback, i)
+            if i & 63 == 63:
+                await asyncio.sleep(0)
+        while done[0] < n:
+            await asyncio.sleep(0)
+
+    loop.run_until_complete(scheduler())
+    return n
+
+
+# Waitq
+
+@case("waitq.push_pop", "timers")
+def bench_waitq_push_pop() -> int:
+    n = n_of(20000)
+    rng = random.Random(1)
+    times = [rng.randrange(1 << 20) for _ in range(n)]
+    waitq = TimerQueue()
+    res = [0, 0, 0]
+    for t in times:
+        waitq.push(t, None, (), True)
+    while waitq:
+        waitq.pop(res)
+    return n
+
+
+@case("waitq.remove", "timers")
+def bench_waitq_remove() -> int:
+    n = n_of(20000)
+    rng = random.Random(2)
+    waitq = TimerQueue()
+    handles = [waitq.push(rng.randrange(1 << 20), None) for _ in range(n)]
+    rng.shuffle(handles)
+    for handle in handles:
+        waitq.remove(handle)
+    return n
+
+
+# Queue
+
+@case("queue.round_trip", "round trips")
+def bench_queue_round_trip() -> int:
+    loop = get_loop()
+    n = n_of(10000)
+    requests = Queue(1)
+    responses = Queue(1)
+
+    async def echo():
+        for _ in range(n):
+            await responses.put(await requests.get())
+
+    async def client():
+        loop.create_task(echo())
+        for i in range(n):
+            await requests.put(i)
+            await responses.get()
+
+    loop.run_until_complete(client())
+    return n
+
+
+# StreamReader
+
+class MemoryStream:
+    """ Always readable in-memory stream handing out at most one TCP segment per read, like a socket """
+
+    def __init__(self, data: bytes, segment=1460) -> None:
+        self.data = data
+        self.pos = 0
+        self.segment = segment
+
+    def read(self, n=-1):
+        if n < 0 or n > self.segment:
+            n = self.segment
+        chunk = self.data[self.pos:self.pos + n]
+        self.pos += len(chunk)
+        return chunk
+
+    def readinto(self, buf):
+        chunk = self.read(len(buf))
+        buf[:len(chunk)] = chunk
+        return len(chunk)
+
+    def readline(self):
+        end = self.data.find(b"\n", self.pos, self.pos + self.segment)
+        end = self.pos + self.segment if end < 0 else end + 1
+        chunk = self.data[self.pos:end]
+        self.pos += len(chunk)
+        return chunk
+
+    def close(self):
+        pass
+
+    def _poll_events(self) -> int:
+        return 1  # POLLIN
+
+
+STREAM_BYTES = 64 * 1024
+
+
+@case("stream.readexactly", "bytes")
+def bench_readexactly() -> int:
+    loop = get_loop()
+    frame = 1024
+    n = n_of(16)
+    data = bytes(range(256)) * (STREAM_BYTES // 256)
+
+    async def reader():
+        for _ in range(n):
+            stream = asyncio.StreamReader(MemoryStream(data))
+            for _ in range(STREAM_BYTES // frame):
+                await stream.readexactly(frame)
+            await stream.aclose()
+
+    loop.run_until_complete(reader())
+    return n * STREAM_BYTES
+
+
+@case("stream.readexactly_into", "bytes")
+def bench_readexactly_into() -> int:
+    loop = get_loop()
+    frame = memoryview(bytearray(1024))
+    n = n_of(16)
+    data = bytes(range(256)) * (STREAM_BYTES // 256)
+
+    async def reader():
+        for _ in range(n):
+            stream = asyncio.StreamReader(MemoryStream(data))
+            for _ in range(STREAM_BYTES // len(frame)):
+                await stream.readexactly_into(frame)
+            await stream.aclose()
+
+    loop.run_until_complete(reader())
+    return n * STREAM_BYTES
+
+
+@case("stream.readline", "bytes")
+def bench_readline() -> int:
+    loop = get_loop()
+    line = b"x" * 63 + b"\n"
+    n = n_of(16)
+    data = line * (STREAM_BYTES // len(line))
+
+    async def reader():
+        for _ in range(n):
+            stream = asyncio.StreamReader(MemoryStream(data))
+            for _ in range(STREAM_BYTES // len(line)):
+                await stream.readline()
+            await stream.aclose()
+
+    loop.run_until_complete(reader())
+    return n * STREAM_BYTES
+
+
+# Incoming MQTT path
+
+class CountingClient:
+    """ Takes the place of the MQTT client, counts the publishes and wakes the benchmark on each """
+
+    def __init__(self) -> None:
+        self.published = 0
+        self.event = None
+
+    async def publish(self, topic, payload, retain=False, qos=0, callback=None):
+        self.published += 1
+        self.event.set()
+
+    def is_connected(self) -> bool:
+        return True
+
+
+@case("mqtt.control_to_status", "messages")
+def bench_control_to_status() -> int:
+    from uasyncio.synchro import Event
+    from mqtt.mqtt_service import MqttService
+    from unit.unit_service import UnitService
+    from unit import config
+    from unit.connectivity import Connectivity
+
+    loop = get_loop()
+    n = n_of(300)
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp(prefix="bench-flash-"))
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        if not world.current.buses:
+            world.current.add_sensor(config.water_temp_sensor_pin)
+        connectivity = Connectivity()
+        connectivity.wifi_up()
+        connectivity.mqtt_connecting()
+        connectivity.mqtt_up()
+        mqtt_service = MqttService(connectivity)
+        client = CountingClient()
+        client.event = Event()
+        mqtt_service.mqtt_client = client
+        unit_service = UnitService(mqtt_service)
+        topic = config.mqtt_topic_control.encode()
+        payloads = (b'{"relay|growlight": 1}', b'{"relay|growlight": 0}')
+
+        async def server():
+            # Let the startup status go out first
+            await client.event.wait()
+            for i in range(n):
+                client.event.clear()
+                mqtt_service.callback(topic, payloads[i & 1])
+                await client.event.wait()
+
+        loop.run_until_complete(server())
+        for timer in mqtt_service.timers + unit_service.timers:
+            timer.cancel()
+        for task in mqtt_service.tasks + unit_service.tasks:
+            task.cancel()
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+        os.chdir(cwd)
+    return n
+
+
+# Runner
+
+def run_case(f) -> tuple:
+    """ Runs the case REPEAT times, returns the operations and the best and median wall time """
+    results = []
+    ops = 0
+    for _ in range(REPEAT):
+        start = host_time.perf_counter()
+        ops = f()
+        results.append(host_time.perf_counter() - start)
+    results.sort()
+    return ops, results[0], results[len(results) // 2]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """ Returns the cases that got slower than the baseline by more than threshold """
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get("results", {}).get(name)
+        if before is None:
+            continue
+        ratio = result["opsPerSec"] / before["opsPerSec"]
+        result["vsBaseline"] = round(ratio, 3)
+        if ratio < 1 - threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main() -> None:
+    global REPEAT, SCALE
+    parser = argparse.ArgumentParser(description="Benchmarks the hot paths of the firmware")
+    parser.add_argument("--quick", action="store_true", help="a tenth of the work, for a smoke test")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--case", action="append", default=[], help="run only the cases with this prefix")
+    parser.add_argument("--output", help="also write the JSON results to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON results of an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.1, help="slowdown reported as a regression")
+    args = parser.parse_args()
+    REPEAT = args.repeat
+    SCALE = 0.1 if args.quick else 1.0
+
+    results = {}
+    for name, unit, f in CASES:
+        if args.case and not any(name.startswith(prefix) for prefix in args.case):
+            continue
+        ops, best, median = run_case(f)
+        results[name] = {
+            "unit": unit,
+            "ops": ops,
+            "bestSec": round(best, 6),
+            "medianSec": round(median, 6),
+            "opsPerSec": round(ops / best, 1),
+            "usPerOp": round(best * 1000000 / ops, 3)
+        }
+        print("{:<28} {:>14.1f} {}/s {:>10.3f} us/op".format(
+            name, ops / best, unit, best * 1000000 / ops), file=sys.stderr)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "repeat": REPEAT,
+            "scale": SCALE
+        },
+        "results": results
+    }
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        report["regressions"] = regressions
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+    if regressions:
+        print("Regressions: {}".format(", ".join(regressions)), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,37 +1,58 @@
 from wifi.wifi_service import WifiService
-from mqtt.mqtt_service import MqttService
+from mqtt.mqtt_service import MqttService, MqttMessage
 from unit.unit_service import UnitService
-from umqtt.simple import MQTTException
+from unit.connectivity import Connectivity
 from unit import config
 import uasyncio as asyncio
 import gc
 import machine
+import ujson
+import utime as time
 
 
 def main() -> None:
     """ Main module of the tlvlp.iot project """
 
+    # Init the event loop before the services schedule their co-routines
+    overflow = asyncio.OVERFLOW_SHED if config.loop_shed_tasks_on_overflow else asyncio.OVERFLOW_GROW
+    loop = asyncio.get_event_loop(config.loop_runq_len, config.loop_waitq_len, config.loop_queue_max_len, overflow)
+
     # Init services
-    WifiService()
-    mqtt_service = MqttService()
+    connectivity = Connectivity()
+    WifiService(connectivity)
+    mqtt_service = MqttService(connectivity)
     UnitService(mqtt_service)
 
     # Start all scheduled co-routines
-    loop = asyncio.get_event_loop()
-    loop.create_task(garbage_collector_loop())
+    loop.call_every(config.gc_collect_interval_sec * 1000, collect_garbage)
+    if config.loop_profiling_enabled:
+        loop.enable_profiling()
+        dump_interval_ms = config.loop_profile_dump_interval_sec * 1000
+        dump_timer = asyncio.Periodic(loop, dump_interval_ms, dump_loop_profile, (mqtt_service,))
+        dump_timer.start_at(time.ticks_add(loop.time(), dump_interval_ms))
     try:
         loop.run_forever()
-    except (IndexError, MQTTException):
-        # Reset the unit if the task loop runs out of coros and freezes eg in a message flood.
+    except IndexError:
+        # Reset the unit if the task loop runs out of coros even at config.loop_queue_max_len entries.
+        mqtt_service.outbox.flush()
         machine.reset()
 
 
-async def garbage_collector_loop():
+def collect_garbage() -> None:
     """ Periodically runs the garbage collection """
-    while True:
-        print("Running garbage collection")
-        gc.collect()
-        await asyncio.sleep(config.gc_collect_interval_sec)
+    print("Running garbage collection")
+    gc.collect()
+    print("Event loop queues: {}".format(asyncio.get_event_loop().queue_stats()))
+
+
+def dump_loop_profile(mqtt_service):
+    """ Periodically prints the event loop profile and returns the co-routine publishing it if enabled """
+    profiler = asyncio.get_event_loop().profiler
+    profiler.dump()
+    if config.loop_profile_publish:
+        message = MqttMessage(config.mqtt_topic_profile, ujson.dumps(profiler.snapshot()))
+        return mqtt_service.add_outgoing_message_to_queue(message)
+    return None
 
 
 if __name__ == '__main__':
@@ -1,3 +1,8 @@
 
+
 class InvalidModuleInputException(Exception):
     pass
+
+
+class UnknownModuleException(Exception):
+    pass
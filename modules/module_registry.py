@@ -0,0 +1,33 @@
+from modules.exceptions import InvalidModuleInputException, UnknownModuleException
+
+
+class ModuleRegistry:
+
+    def __init__(self) -> None:
+        """
+        Module registry for the tlvlp.iot project
+        Maps the module ids of the unit (eg. relay|growlight) to their control handlers,
+        so a control message is dispatched with one dict lookup per module whatever the number of modules
+        """
+        self.handlers = {}
+
+    def register(self, module_id: str, handler=None) -> None:
+        """
+        :param handler: called with the value of the module in a control message, None for a read-only module
+        """
+        if module_id in self.handlers:
+            raise ValueError("Module registry - Error! Module id already registered: {}".format(module_id))
+        self.handlers[module_id] = handler
+
+    def module_ids(self):
+        return self.handlers.keys()
+
+    def dispatch(self, module_id: str, value) -> None:
+        """ Passes the value to the handler of the module """
+        try:
+            handler = self.handlers[module_id]
+        except KeyError:
+            raise UnknownModuleException(module_id)
+        if handler is None:
+            raise InvalidModuleInputException(module_id)
+        handler(value)
@@ -1,25 +1,48 @@
 import uasyncio as asyncio
+import utime as time
+from uasyncio.synchro import Lock
 from machine import Pin
 from onewire import OneWire, OneWireError
 import ds18x20
 
+# Conversion time of the DS18B20 by resolution in bits
+CONVERSION_MS = {9: 94, 10: 188, 11: 375, 12: 750}
+
 
 class TempSensorDS18B20:
 
-    def __init__(self, name: str, pin_num: int) -> None:
+    def __init__(self, name: str, pin_num: int, resolution=12) -> None:
         """
         Digital temp sensor DS18B20 for the tlvlp.iot project
 
         Tested on ESP32 MCUs
         :param pin_num: Digital input pin number for reading measurements
+        :param resolution: 9 to 12 bits, a 9 bit conversion takes 94 ms instead of the 750 ms of 12 bits
         """
+        if resolution not in CONVERSION_MS:
+            raise ValueError("TempSensorDS18B20 - Error! Unsupported resolution: {}".format(resolution))
         self.reference = "ds18b20|" + name
+        self.resolution = resolution
         one_wire = OneWire(Pin(pin_num))
         self.channel = ds18x20.DS18X20(one_wire)
+        # ROM codes of the sensors on the bus, replaced by the scan before the next conversion if scan_pending
+        self.roms = []
+        self.scan_pending = True
+        # Snapshot of the latest readings, kept by sample()
+        self.last_readings = []
+        self.last_celsius = -1.0
+        self.sampled_at_ms = None
+        self.sample_lock = Lock()
+
+    def get_module_id(self) -> str:
+        return self.reference
+
+    def conversion_ms(self) -> int:
+        return CONVERSION_MS[self.resolution]
 
-    async def read_first_celsius(self, delay_ms=750) -> tuple:
+    async def read_first_celsius(self, delay_ms=None) -> tuple:
         """
-        :param delay_ms: a set delay before the reading is done
+        :param delay_ms: a set delay before the reading is done, the conversion time of the resolution by default
         :return: readings from the first sensor on the pin
         The order is not guaranteed so works best with only one sensor
         """
@@ -29,20 +52,77 @@ class TempSensorDS18B20:
         else:
             return self.reference, -1.0
 
-    async def read_all_celsius(self, delay_ms=750) -> list:
+    async def sample(self, delay_ms=None) -> None:
+        """
+        Takes a reading of the sensors of the bus into the snapshot
+        A call while a conversion is running waits for that one instead of starting another.
+        """
+        if self.sample_lock.locked:
+            await self.sample_lock.acquire()
+            self.sample_lock.release()
+            return
+        async with self.sample_lock:
+            self.store_sample(await self.read_all_celsius(delay_ms))
+
+    def store_sample(self, readings: list) -> None:
+        self.last_readings = readings
+        self.last_celsius = readings[0] if readings else -1.0
+        self.sampled_at_ms = time.ticks_ms()
+
+    async def read_cached_celsius(self, max_age_ms: int) -> tuple:
+        """
+        :param max_age_ms: the snapshot is used if it is not older than this, otherwise a new reading is taken
+        :return: the same tuple as read_first_celsius()
+        """
+        if self.sampled_at_ms is None or time.ticks_diff(time.ticks_ms(), self.sampled_at_ms) > max_age_ms:
+            await self.sample()
+        return self.reference, self.last_celsius
+
+    async def read_all_celsius(self, delay_ms=None) -> list:
         """
-        :param delay_ms: a set delay before the reading is done
+        :param delay_ms: a set delay before the reading is done, the conversion time of the resolution by default
         :return: readings for all the sensors on the same channel/pin
         """
-        readings = []
+        if not self.start_conversion():
+            return []
+        await asyncio.sleep_ms(self.conversion_ms() if delay_ms is None else delay_ms)
+        return self.read_converted()
+
+    def rescan(self) -> None:
+        """
+        The bus is scanned again before the next conversion
+        The ROM codes are kept until then, a conversion that is running reads the sensors it was started on.
+        """
+        self.scan_pending = True
+
+    def start_conversion(self) -> bool:
+        """
+        Starts a conversion on all the sensors of the bus, scanning it first if the ROM codes are not known
+        :return: False if the bus failed
+        """
         try:
-            sensors = self.channel.scan()
+            if self.scan_pending:
+                roms = self.channel.scan()
+                for rom in roms:
+                    # Alarm thresholds, then the resolution in the configuration register
+                    self.channel.write_scratch(rom, bytes([0, 0, (self.resolution - 9) << 5 | 0x1F]))
+                self.roms = roms
+                self.scan_pending = False
             self.channel.convert_temp()
-            await asyncio.sleep_ms(delay_ms)
-            for sensor in sensors:
-                readings.append(self.channel.read_temp(sensor))
+            return True
+        except OneWireError:
+            print("TempSensorDS18B20 - Error! Unable to start conversion: OneWireError")
+            self.scan_pending = True
+            return False
+
+    def read_converted(self) -> list:
+        """ Returns the readings of the conversion started by start_conversion() once it is done """
+        readings = []
+        try:
+            for rom in self.roms:
+                readings.append(self.channel.read_temp(rom))
         except OneWireError:
             print("TempSensorDS18B20 - Error! Unable to read temp sensor(s): OneWireError")
+            # A sensor may have been removed or replaced
+            self.scan_pending = True
         return readings
-
-
@@ -0,0 +1,34 @@
+import uasyncio as asyncio
+
+
+class TempSensorManager:
+
+    def __init__(self, sensors: list) -> None:
+        """
+        DS18B20 sensor manager for the tlvlp.iot project
+        Samples the sensors of several TempSensorDS18B20 buses together: the conversions are started on every bus
+        at once and share one wait, the longest conversion time of the buses.
+        The ROM codes found by the scan of a bus are kept until rescan() or an error on the bus.
+        :param sensors: TempSensorDS18B20 instances, one for each bus
+        """
+        self.sensors = sensors
+
+    def rescan(self) -> None:
+        """ Every bus is scanned again at the next sample, for a slow timer that picks up replaced sensors """
+        for sensor in self.sensors:
+            sensor.rescan()
+
+    async def sample(self) -> None:
+        """ Takes a reading on every bus into its snapshot, the buses sampling on their own are left to it """
+        sensors = [sensor for sensor in self.sensors if not sensor.sample_lock.locked]
+        for sensor in sensors:
+            await sensor.sample_lock.acquire()
+        try:
+            started = [sensor for sensor in sensors if sensor.start_conversion()]
+            if started:
+                await asyncio.sleep_ms(max(sensor.conversion_ms() for sensor in started))
+            for sensor in sensors:
+                sensor.store_sample(sensor.read_converted() if sensor in started else [])
+        finally:
+            for sensor in sensors:
+                sensor.sample_lock.release()
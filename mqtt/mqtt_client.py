@@ -0,0 +1,429 @@
+import uasyncio as asyncio
+import uerrno
+import utime as time
+from uasyncio.synchro import Event, Lock, Semaphore
+
+CONNACK = 0x20
+PUBLISH = 0x30
+PUBACK = 0x40
+SUBACK = 0x90
+PINGRESP = 0xD0
+
+
+class MqttException(Exception):
+    pass
+
+
+def _remaining_length(n: int) -> bytes:
+    """ Variable length encoding of the remaining length of a packet """
+    out = bytearray()
+    while n > 0x7F:
+        out.append(n & 0x7F | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def _fixed_header(kind: int, remaining: int) -> bytes:
+    return bytes([kind]) + _remaining_length(remaining)
+
+
+def _short(n: int) -> bytes:
+    return bytes([n >> 8, n & 0xFF])
+
+
+def _encode(s) -> bytes:
+    return s.encode() if isinstance(s, str) else s
+
+
+class MqttClient:
+
+    def __init__(self, client_id, server, port=0, user=None, password=None, keepalive=0, ssl=False,
+                 response_timeout_ms=10000, bufsize=256, max_inflight=1) -> None:
+        """
+        Asynchronous MQTT 3.1.1 client for the tlvlp.iot project, with the interface of umqtt.simple.MQTTClient
+
+        The connection is a StreamReader / StreamWriter pair and every wait for the network is an await,
+        so the other co-routines keep running while it connects, waits for acknowledgements or while the
+        broker doesn't answer. Supports QoS 0 and 1, last will and keepalive pings sent when the connection
+        is idle. Only the public key operations of the TLS handshake still hold the CPU.
+
+        There is no check_msg(): the socket is registered with the event loop, which calls the client when bytes
+        arrive. They are parsed incrementally in a preallocated buffer, so a partial packet just waits
+        for the rest, and complete messages are passed to the callback right away.
+
+        QoS 1 publishes are pipelined: up to max_inflight of them wait for their PUBACK at the same time,
+        so the throughput is not capped at one message per round trip to the broker.
+        :param response_timeout_ms: time given to the broker to answer or take our data
+        before the connection is considered lost
+        :param bufsize: initial size of the receive buffer, it grows for bigger packets
+        :param max_inflight: number of QoS 1 publishes sent without waiting for their PUBACK
+        """
+        if port == 0:
+            port = 8883 if ssl else 1883
+        self.client_id = client_id
+        self.server = server
+        self.port = port
+        self.user = user
+        self.pswd = password
+        self.keepalive = keepalive
+        self.ssl = ssl
+        self.response_timeout_ms = response_timeout_ms
+        self.cb = None
+        self.close_cb = None
+        self.lw_topic = None
+        self.lw_msg = None
+        self.lw_qos = 0
+        self.lw_retain = False
+        # The socket polled for incoming data, the stream read from (eg. its SSL wrapper) and the writer
+        self.sock = None
+        self.ios = None
+        self.writer = None
+        # Received data not handled yet is rx_buf[rx_start:rx_end]
+        self.rx_buf = bytearray(bufsize)
+        self.rx_mv = memoryview(self.rx_buf)
+        self.rx_start = 0
+        self.rx_end = 0
+        self.pid = 0
+        # Packet id: [Event, acknowledgement body] of the subscriptions waiting for one, 0 for the CONNACK
+        self.acks = {}
+        # QoS 1 publishes not completed yet, in the order they were published: [pid, packet, acknowledged, callback]
+        # They stay across connections, to be sent again after a reconnect
+        self.inflight = []
+        self.inflight_slots = Semaphore(max_inflight)
+        # A packet is written by one task at a time
+        self.write_lock = Lock()
+        # PUBACKs of the received QoS 1 messages, written with the next packet or by puback_task
+        self.pubacks = bytearray()
+        self.puback_task = None
+        # Tasks waiting for the connection, failed at once if it is lost
+        self.io_tasks = []
+        self.last_write_ms = 0
+        self.ping_sent_ms = None
+        self.keepalive_timer = None
+
+    def set_callback(self, f) -> None:
+        self.cb = f
+
+    def set_close_callback(self, f) -> None:
+        """ f() is called when a connection is closed, by close() or because it was lost """
+        self.close_cb = f
+
+    def set_last_will(self, topic, msg, retain=False, qos=0) -> None:
+        assert 0 <= qos <= 2
+        assert topic
+        self.lw_topic = _encode(topic)
+        self.lw_msg = _encode(msg)
+        self.lw_qos = qos
+        self.lw_retain = retain
+
+    def is_connected(self) -> bool:
+        return self.writer is not None
+
+    # Connection
+
+    async def connect(self, clean_session=True, addr=None) -> bool:
+        """
+        Connects to the broker, returns the session present flag
+        :param addr: resolved address of the server, eg. cached, None to resolve it now
+        """
+        self.close()
+        # Sent again once connected, the ones published from now on are written on the new connection
+        resend = self.inflight[:]
+        # A server that doesn't accept the connection fails it like one that doesn't answer
+        reader, self.writer = await self._io(asyncio.open_connection(self.server, self.port, self.ssl, addr))
+        self.sock = reader.polls
+        self.ios = reader.ios
+        self.rx_start = self.rx_end = 0
+        ack = self.acks[0] = [Event(), None]
+        asyncio.get_event_loop().add_reader(self.sock, self._on_readable)
+        client_id = _encode(self.client_id)
+        flags = clean_session << 1
+        payload = [_short(len(client_id)), client_id]
+        if self.lw_topic:
+            flags |= 0x4 | self.lw_qos << 3 | self.lw_retain << 5
+            payload += [_short(len(self.lw_topic)), self.lw_topic, _short(len(self.lw_msg)), self.lw_msg]
+        if self.user is not None:
+            flags |= 0xC0
+            user = _encode(self.user)
+            pswd = _encode(self.pswd)
+            payload += [_short(len(user)), user, _short(len(pswd)), pswd]
+        variable = b"\x00\x04MQTT\x04" + bytes([flags]) + _short(self.keepalive)
+        remaining = len(variable) + sum(len(piece) for piece in payload)
+        await self._write(_fixed_header(0x10, remaining), variable, *payload)
+        await self._wait_ack(0, ack)
+        resp = ack[1]
+        if len(resp) < 2:
+            self.close()
+            raise OSError(uerrno.ECONNRESET)
+        if resp[1] != 0:
+            self.close()
+            raise MqttException(resp[1])
+        self.ping_sent_ms = None
+        await self._resend(resend)
+        if self.keepalive:
+            # Checked four times per keepalive period, pinging after half of it without sending anything
+            self.keepalive_timer = asyncio.get_event_loop().call_every(self.keepalive * 250, self._check_keepalive)
+        return resp[0] & 1
+
+    def close(self) -> None:
+        """ Drops the connection without a DISCONNECT, the tasks waiting for it fail with OSError """
+        sock = self.sock
+        writer = self.writer
+        if writer is None:
+            return
+        self.sock = self.ios = self.writer = None
+        if self.keepalive_timer is not None:
+            self.keepalive_timer.cancel()
+            self.keepalive_timer = None
+        loop = asyncio.get_event_loop()
+        loop.remove_reader(sock)
+        loop.remove_writer(writer.s)
+        writer.s.close()
+        self.acks.clear()
+        # The broker sends the messages not acknowledged again after reconnecting
+        self.pubacks = bytearray()
+        cur_task = loop.cur_task
+        for task in self.io_tasks:
+            if task is not cur_task:
+                task.throw(OSError(uerrno.ECONNRESET))
+        if self.close_cb is not None:
+            self.close_cb()
+
+    async def disconnect(self) -> None:
+        try:
+            await self._write(b"\xe0\x00")
+        finally:
+            self.close()
+
+    async def ping(self) -> None:
+        if self.ping_sent_ms is None:
+            self.ping_sent_ms = time.ticks_ms()
+        await self._write(b"\xc0\x00")
+
+    def _check_keepalive(self):
+        """ Returns the co-routine sending a ping if nothing was sent for half of the keepalive period """
+        now = time.ticks_ms()
+        if self.ping_sent_ms is not None:
+            if time.ticks_diff(now, self.ping_sent_ms) > self.response_timeout_ms:
+                print("MQTT client - Error! No answer to ping, connection lost.")
+                self.close()
+            return None
+        if time.ticks_diff(now, self.last_write_ms) >= self.keepalive * 500:
+            self.ping_sent_ms = now
+            return self._send_quietly(b"\xc0\x00")
+        return None
+
+    async def _send_quietly(self, *bufs) -> None:
+        """ Sends a packet nobody waits for, eg. from a callback """
+        try:
+            await self._write(*bufs)
+        except OSError:
+            pass  # the connection is closed, the service notices it
+
+    async def _send_pubacks(self) -> None:
+        """ Writes the PUBACKs queued while nothing else is written, the ones of a burst go out together """
+        try:
+            while self.pubacks and self.writer is not None:
+                await self._send_quietly()
+        finally:
+            self.puback_task = None
+
+    # Publishing and subscribing
+
+    def _next_pid(self) -> int:
+        self.pid = self.pid % 0xFFFF + 1
+        return self.pid
+
+    async def publish(self, topic, msg, retain=False, qos=0, callback=None) -> None:
+        """
+        Publishes a message, returns when it is written (QoS 0) or in flight (QoS 1)
+        A QoS 1 publish first waits for one of the max_inflight slots, which fails the connection after
+        response_timeout_ms. Once in flight the message is sent again with the DUP flag after every reconnect
+        until the broker acknowledges it, even if writing it fails now.
+        :param callback: called without arguments when a QoS 1 message is acknowledged, the callbacks are called
+        in the order the messages were published
+        """
+        assert 0 <= qos <= 1
+        topic = _encode(topic)
+        msg = _encode(msg)
+        remaining = 2 + len(topic) + len(msg)
+        if not qos:
+            await self._write(_fixed_header(PUBLISH | retain, remaining), _short(len(topic)), topic, msg)
+            return
+        if self.writer is None:
+            raise OSError(uerrno.ENOTCONN)
+        await self._io(self.inflight_slots.acquire())
+        pid = self._next_pid()
+        packet = (_fixed_header(PUBLISH | qos << 1 | retain, remaining + 2), _short(len(topic)), topic,
+                  _short(pid), msg)
+        self.inflight.append([pid, packet, False, callback])
+        await self._send_quietly(*packet)
+
+    def pending(self) -> int:
+        """ Returns the number of QoS 1 publishes not acknowledged yet """
+        return len(self.inflight)
+
+    async def subscribe(self, topic, qos=0) -> None:
+        assert self.cb is not None, "Subscribe callback is not set"
+        topic = _encode(topic)
+        pid = self._next_pid()
+        ack = self.acks[pid] = [Event(), None]
+        await self._write(_fixed_header(0x82, 5 + len(topic)), _short(pid), _short(len(topic)), topic,
+                          bytes([qos]))
+        await self._wait_ack(pid, ack)
+        if ack[1][2] == 0x80:
+            raise MqttException(ack[1][2])
+
+    async def _resend(self, entries) -> None:
+        # The messages in flight when the connection was lost, with the DUP flag and their packet ids
+        for entry in entries:
+            if entry[2]:
+                continue
+            packet = entry[1]
+            await self._write(bytes([packet[0][0] | 0x08]) + packet[0][1:], *packet[1:])
+
+    def _acknowledged(self, pid: int) -> None:
+        # Completes the messages at the front of the in-flight list that are acknowledged, in publish order
+        inflight = self.inflight
+        for entry in inflight:
+            if entry[0] == pid:
+                entry[2] = True
+                break
+        else:
+            return
+        while inflight and inflight[0][2]:
+            callback = inflight.pop(0)[3]
+            self.inflight_slots.release()
+            if callback is not None:
+                callback()
+
+    async def _wait_ack(self, pid, ack) -> None:
+        """ Waits for the acknowledgement of pid, handled by _on_readable() """
+        try:
+            await self._io(ack[0].wait())
+        finally:
+            self.acks.pop(pid, None)
+
+    # Receiving
+
+    def _on_readable(self) -> None:
+        """ IO callback of the event loop: reads what arrived and handles the complete packets """
+        try:
+            while self.sock is not None:
+                self._make_room()
+                n = self.ios.readinto(self.rx_mv[self.rx_end:])
+                if n is None:
+                    # Nothing more for now, or only TLS handshake data
+                    break
+                if not n:
+                    raise OSError(uerrno.ECONNRESET)
+                self.rx_end += n
+                self._parse()
+        except OSError:
+            # The service notices the closed connection
+            self.close()
+            return
+        if self.sock is not None:
+            asyncio.get_event_loop().add_reader(self.sock, self._on_readable)
+
+    def _make_room(self) -> None:
+        # Makes sure there is free space after the received data
+        if self.rx_start == self.rx_end:
+            self.rx_start = self.rx_end = 0
+        elif self.rx_end == len(self.rx_buf):
+            n = self.rx_end - self.rx_start
+            if self.rx_start:
+                # Move the start of the partial packet to the front
+                self.rx_buf[:n] = self.rx_mv[self.rx_start:self.rx_end]
+            else:
+                buf = bytearray(2 * len(self.rx_buf))
+                buf[:n] = self.rx_mv
+                self.rx_buf = buf
+                self.rx_mv = memoryview(buf)
+            self.rx_start = 0
+            self.rx_end = n
+
+    def _parse(self) -> None:
+        # Handles the complete packets in the buffer, a partial one is left for the next read
+        buf = self.rx_buf
+        start = self.rx_start
+        while self.sock is not None:
+            end = self.rx_end
+            # Remaining length, in one to four bytes after the first byte
+            i = start + 1
+            sz = 0
+            sh = 0
+            while i < end:
+                b = buf[i]
+                i += 1
+                sz |= (b & 0x7F) << sh
+                if not b & 0x80:
+                    break
+                sh += 7
+            else:
+                break
+            if end - i < sz:
+                break
+            self.rx_start = i + sz
+            self._handle(buf[start], i, i + sz)
+            start = self.rx_start
+
+    def _handle(self, op: int, start: int, end: int) -> None:
+        # Handles the packet with its body at rx_buf[start:end]
+        kind = op & 0xF0
+        buf = self.rx_buf
+        if kind == PUBLISH:
+            pos = start + 2 + (buf[start] << 8 | buf[start + 1])
+            topic = bytes(self.rx_mv[start + 2:pos])
+            qos = op >> 1 & 3
+            if qos == 2:
+                # Only subscribed with QoS 0 or 1, the exactly once handshake is not supported
+                print("MQTT client - Error! QoS 2 message dropped from topic: {}".format(topic))
+                return
+            if qos:
+                # PUBACK with the packet id, queued on the writer
+                self.pubacks += b"\x40\x02"
+                self.pubacks += self.rx_mv[pos:pos + 2]
+                pos += 2
+                # done() as well, a task closed before it started never resets the field
+                if self.puback_task is None or self.puback_task.done():
+                    self.puback_task = asyncio.get_event_loop().create_task(self._send_pubacks())
+            self.cb(topic, bytes(self.rx_mv[pos:end]))
+        elif kind == PUBACK:
+            self._acknowledged(buf[start] << 8 | buf[start + 1])
+        elif kind == SUBACK or kind == CONNACK:
+            ack = self.acks.get(0 if kind == CONNACK else buf[start] << 8 | buf[start + 1])
+            if ack is not None:
+                ack[1] = bytes(self.rx_mv[start:end])
+                ack[0].set()
+        elif kind == PINGRESP:
+            self.ping_sent_ms = None
+
+    # Connection IO
+
+    async def _write(self, *bufs) -> None:
+        async with self.write_lock:
+            if self.writer is None:
+                raise OSError(uerrno.ENOTCONN)
+            if self.pubacks:
+                # The PUBACKs queued so far go out with this packet
+                bufs = (self.pubacks,) + bufs
+                self.pubacks = bytearray()
+            await self._io(self.writer.awritev(bufs))
+            self.last_write_ms = time.ticks_ms()
+
+    async def _io(self, coro):
+        """ Awaits coro waiting for the connection, closes the connection if it fails or takes too long """
+        task = asyncio.get_event_loop().cur_task
+        self.io_tasks.append(task)
+        try:
+            return await asyncio.wait_for_ms(coro, self.response_timeout_ms)
+        except asyncio.TimeoutError:
+            self.close()
+            raise OSError(uerrno.ETIMEDOUT)
+        except OSError:
+            self.close()
+            raise
+        finally:
+            self.io_tasks.remove(task)
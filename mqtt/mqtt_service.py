@@ -1,19 +1,22 @@
-from umqtt.simple import MQTTClient
-from uasyncio.queues import Queue
+from mqtt.mqtt_client import MqttClient, MqttException
+from mqtt.outbox import Outbox
+from uasyncio.queues import Queue, QueueFull
 import uasyncio as asyncio
-import machine
-from unit import shared_flags, config
+from unit import config
+from unit.connectivity import DOWN, WIFI_UP, ONLINE
+from unit.reconnect_policy import ReconnectPolicy
 
 
 class MqttMessage:
 
-    def __init__(self, topic: str, payload: str) -> None:
+    def __init__(self, topic: str, payload: str, important=False) -> None:
         """
         Queue items for both incoming and outgoing MQTT messages
         :param topic: MQTT topic where the payload was received from / should be delivered to
         :param payload: MQTT message payload
+        :param important: kept in the outbox when telemetry is dropped to make room, eg. errors and state changes
         """
-        self.queue_item = (topic, payload)
+        self.queue_item = (topic, payload, important)
 
     def get_topic(self) -> str:
         return self.queue_item[0]
@@ -21,51 +24,91 @@ class MqttMessage:
     def get_payload(self) -> str:
         return self.queue_item[1]
 
+    def is_important(self) -> bool:
+        return self.queue_item[2]
+
 
 class MqttService:
 
-    def __init__(self) -> None:
+    def __init__(self, connectivity) -> None:
         """
         MQTT Service for the tlvlp.iot project
         Handles the connection and communication with the server via an MQTT broker
 
-        Currently it is using a blocking MQTT client with asynchronous co-routines. This results in blocking all the
-        other coros for the duration of the connection (usually around 2-3s and the timeout is 15s)
+        Connects when the connectivity state machine reports the Wi-Fi up and when the broker connection is lost,
+        going through config.mqtt_server and config.mqtt_fallback_servers with a capped exponential backoff and
+        full jitter while the Wi-Fi stays up, so a fleet losing its broker doesn't come back all at once.
+
+        The MQTT client is asynchronous: connecting, publishing and waiting for the broker never block the other
+        co-routines, a broker that doesn't answer within config.mqtt_response_timeout_sec drops the connection.
+        Up to config.mqtt_max_inflight QoS 1 messages are sent without waiting for their acknowledgement,
+        the ones not acknowledged when the connection is lost are sent again after reconnecting.
+
+        Messages that can't be sent, because the unit is not online or the outgoing queue is full, are stored
+        in an outbox on the flash and sent at a limited pace after reconnecting, even after a reboot.
 
         Tested on ESP32 MCUs
+        :param connectivity: tlvlp.iot connectivity state machine instance
         """
 
         print("MQTT service - Initializing service")
         self.mqtt_client = None
+        self.connectivity = connectivity
         self.connection_in_progress = False
+        self.reconnect_policy = ReconnectPolicy(config.mqtt_reconnect_base_ms, config.mqtt_reconnect_cap_ms,
+                                                [(config.mqtt_server, config.mqtt_port)] + config.mqtt_fallback_servers,
+                                                config.mqtt_address_cache_sec)
         self.message_queue_incoming = Queue(config.mqtt_queue_size)
         self.message_queue_outgoing = Queue(config.mqtt_queue_size)
+        self.outbox = Outbox(config.mqtt_outbox_dir, config.mqtt_outbox_max_bytes,
+                             config.mqtt_outbox_segment_bytes, config.mqtt_outbox_batch_bytes)
+        self.outbox_drain_task = None
+        # Segment id and number of its messages handed over to the client by the last drain
+        self.outbox_drained = (0, 0)
         # Add scheduled tasks
         loop = asyncio.get_event_loop()
-        loop.create_task(self.connection_checker_loop())
-        loop.create_task(self.incoming_message_checker_loop())
-        loop.create_task(self.outgoing_message_sender_loop())
+        self.tasks = [loop.create_task(self.outgoing_message_sender_loop())]
+        self.timers = [loop.call_every(config.mqtt_outbox_flush_interval_sec * 1000, self.outbox.flush)]
+        connectivity.subscribe(self.on_connectivity_change)
         print("MQTT service - Service initialization complete")
 
+    def on_connectivity_change(self, old: int, new: int):
+        """ Returns the connecting co-routine when the Wi-Fi is up without a broker connection """
+        if new == WIFI_UP and not self.connection_in_progress:
+            return self.start_service()
+        if new == DOWN and self.mqtt_client is not None:
+            # The connection can't work without the Wi-Fi, fail whatever waits for it now
+            self.mqtt_client.close()
+        if new == ONLINE:
+            self.start_outbox_drain()
+        return None
+
     async def start_service(self) -> None:
         print("MQTT service - Starting service")
         self.connection_in_progress = True
-        await self.init_client()
-        await self.set_callback()
-        await self.set_last_will()
-        await self.connect_to_broker()
-        await self.subscribe_to_topics()
-        shared_flags.mqtt_is_connected = True
-        self.connection_in_progress = False
-        print("MQTT service - Service is running")
+        try:
+            await self.init_client()
+            await self.set_callback()
+            await self.set_last_will()
+            await self.connect_to_broker()
+        finally:
+            self.connection_in_progress = False
+        if self.connectivity.is_online():
+            print("MQTT service - Service is running")
 
     # Startup methods
 
     async def init_client(self) -> None:
+        if self.mqtt_client is not None:
+            # Reconnecting: the client keeps the messages in flight to send them again
+            return
         print("MQTT service - Initializing client")
-        self.mqtt_client = MQTTClient(config.mqtt_unit_id, config.mqtt_server, config.mqtt_port,
+        self.mqtt_client = MqttClient(config.mqtt_unit_id, config.mqtt_server, config.mqtt_port,
                                       config.mqtt_user, config.mqtt_password,
-                                      ssl=config.mqtt_use_ssl, keepalive=config.mqtt_keepalive_sec)
+                                      ssl=config.mqtt_use_ssl, keepalive=config.mqtt_keepalive_sec,
+                                      response_timeout_ms=config.mqtt_response_timeout_sec * 1000,
+                                      max_inflight=config.mqtt_max_inflight)
+        self.mqtt_client.set_close_callback(self.connectivity.mqtt_down)
         await asyncio.sleep(0)
 
     async def set_callback(self) -> None:
@@ -74,9 +117,9 @@ class MqttService:
         await asyncio.sleep(0)
 
     def callback(self, topic_bytes: bytes, payload_bytes: bytes) -> None:
-        """ All incoming messages are handled by this method """
+        """ All incoming messages are handled by this method, called by the client as soon as they arrive """
         message = MqttMessage(topic_bytes.decode(), payload_bytes.decode())
-        asyncio.get_event_loop().create_task(self.add_incoming_message_to_queue(message))
+        self.add_incoming_message_to_queue(message)
 
     async def set_last_will(self) -> None:
         print("MQTT service - Setting last will")
@@ -84,73 +127,111 @@ class MqttService:
         await asyncio.sleep(0)
 
     async def connect_to_broker(self) -> None:
-        print("MQTT service - Connecting to broker")
-        connected = False
-        while not connected:
+        """ Connects and subscribes until it succeeds, gives up when the Wi-Fi is lost, to start again with it """
+        policy = self.reconnect_policy
+        while self.connectivity.state == WIFI_UP:
+            await asyncio.sleep_ms(policy.next_delay_ms())
+            if self.connectivity.state != WIFI_UP:
+                return
+            self.mqtt_client.server, self.mqtt_client.port = policy.server()
+            print("MQTT service - Connecting to broker {}".format(self.mqtt_client.server))
+            self.connectivity.mqtt_connecting()
             try:
-                self.mqtt_client.connect()
-                connected = True
+                await self.mqtt_client.connect(addr=policy.address())
                 print("MQTT service - Connected to broker")
-            except OSError:
-                if not shared_flags.wifi_is_connected:
-                    # If the network connection is lost while trying to connect to the broker
-                    machine.reset()
-                await asyncio.sleep(0)
-        await asyncio.sleep(0)
+                await self.subscribe_to_topics()
+                policy.succeeded()
+                self.connectivity.mqtt_up()
+                return
+            except (OSError, MqttException):
+                print("MQTT service - Error! Connecting to broker failed.")
+                policy.failed()
+                self.mqtt_client.close()
+                self.connectivity.mqtt_down()
 
     async def subscribe_to_topics(self) -> None:
         print("MQTT service - Subscribing to topics")
         for topic in config.mqtt_subscribe_topics:
-            self.mqtt_client.subscribe(topic, qos=config.mqtt_qos)
+            await self.mqtt_client.subscribe(topic, qos=config.mqtt_qos)
         await asyncio.sleep(0)
 
     # Interface methods
 
-    async def add_incoming_message_to_queue(self, message: MqttMessage) -> None:
-        """ Takes an MqttMessage and adds it to the queue to be processed """
-        if self.message_queue_incoming.full():
-            return  # filter out message flood
-        await self.message_queue_incoming.put(message)
+    def add_incoming_message_to_queue(self, message: MqttMessage) -> None:
+        """ Takes an MqttMessage and hands it over to the processing loop without spawning a task """
+        try:
+            self.message_queue_incoming.put_nowait(message)
+        except QueueFull:
+            pass  # filter out message flood
 
     async def add_outgoing_message_to_queue(self, message: MqttMessage) -> None:
-        """ Takes an MqttMessage and adds it to the queue to be processed """
-        if self.message_queue_outgoing.full():
-            return  # prevent message flood
+        """
+        Takes an MqttMessage and adds it to the queue to be processed,
+        or to the outbox if the unit is not online or the queue is full
+        """
+        if not self.connectivity.is_online() or self.message_queue_outgoing.full():
+            self.store_message(message)
+            return
         await self.message_queue_outgoing.put(message)
 
-    # Scheduled loops
+    def store_message(self, message: MqttMessage) -> None:
+        """ Stores a message in the outbox, to be sent after reconnecting or right away if the unit is online """
+        self.outbox.append(message.get_topic(), message.get_payload(), message.is_important())
+        if self.connectivity.is_online():
+            # Overflow of the outgoing queue, a running drain picks it up with its next segment
+            self.start_outbox_drain()
 
-    async def connection_checker_loop(self) -> None:
-        """ Periodically checks the connection status and reconnects if necessary """
-        while True:
-            if not shared_flags.mqtt_is_connected and not self.connection_in_progress and shared_flags.wifi_is_connected:
-                await self.start_service()
-            await asyncio.sleep(config.mqtt_connection_check_interval_sec)
+    # Scheduled loops
 
     async def outgoing_message_sender_loop(self) -> None:
-        """ Processes the outgoing message queue"""
+        """ Processes the outgoing message queue, parked while the unit is not online """
         while True:
             message = await self.message_queue_outgoing.get()
             topic = message.get_topic()
             payload = message.get_payload()
+            await self.connectivity.wait_online()
             try:
-                while not shared_flags.mqtt_is_connected:
-                    await asyncio.sleep(0)
-                self.mqtt_client.publish(topic, payload, qos=config.mqtt_qos)
+                await self.mqtt_client.publish(topic, payload, qos=config.mqtt_qos)
                 print("MQTT service - Message published to topic:{} with payload: {}".format(topic, payload))
             except OSError:
-                print("MQTT service - Error in publishing message to topic:{} with payload: {}".format(topic, payload))
-                shared_flags.mqtt_is_connected = False
-
-    async def incoming_message_checker_loop(self) -> None:
-        """ Periodically checks for new messages at the broker. Messages will be handled via the callback method """
-        while True:
-            if shared_flags.mqtt_is_connected:
-                try:
-                    self.mqtt_client.check_msg()
-                except OSError:
-                    print("MQTT service - Error! Messages cannot be retrieved from the MQTT broker. Connection lost.")
-                    shared_flags.mqtt_is_connected = False
-            await asyncio.sleep_ms(config.mqtt_message_check_interval_ms)
+                print("MQTT service - Error in publishing message to topic:{} with payload: {}. Stored in the outbox."
+                      .format(topic, payload))
+                self.store_message(message)
 
+    def start_outbox_drain(self) -> None:
+        task = self.outbox_drain_task
+        if (task is None or task.done()) and not self.outbox.is_empty():
+            self.outbox_drain_task = asyncio.get_event_loop().create_task(self.outbox_drain_loop())
 
+    async def outbox_drain_loop(self) -> None:
+        """
+        Sends the messages of the outbox oldest first, one per config.mqtt_outbox_drain_interval_ms
+        A segment is deleted when its last message is acknowledged. If the connection is lost the drain stops,
+        the next one goes on from the first message not handed over to the client, the client sends the ones in
+        flight again itself.
+        """
+        print("MQTT service - Sending the messages stored in the outbox")
+        # Segment ids start from 1, the segments before the last one drained are in flight or delivered
+        segment_id = self.outbox_drained[0] - 1
+        try:
+            while self.connectivity.is_online():
+                segment = self.outbox.next_segment(segment_id)
+                if segment is None:
+                    print("MQTT service - Outbox sent")
+                    break
+                segment_id, messages = segment
+                first = self.outbox_drained[1] if self.outbox_drained[0] == segment_id else 0
+                for i in range(first, len(messages)):
+                    callback = None
+                    if i == len(messages) - 1 and config.mqtt_qos:
+                        callback = lambda segment_id=segment_id: self.outbox.remove(segment_id)
+                    await self.mqtt_client.publish(messages[i][0], messages[i][1], qos=config.mqtt_qos,
+                                                   callback=callback)
+                    self.outbox_drained = (segment_id, i + 1)
+                    await asyncio.sleep_ms(config.mqtt_outbox_drain_interval_ms)
+                if not messages or not config.mqtt_qos:
+                    self.outbox.remove(segment_id)
+        except OSError:
+            print("MQTT service - Error! Sending the outbox stopped, connection lost.")
+        finally:
+            self.outbox_drain_task = None
@@ -0,0 +1,155 @@
+import uos
+import ustruct
+
+TELEMETRY = 0
+IMPORTANT = 1
+# Segment file names end with the kind of their messages
+_SUFFIX = "ti"
+
+
+def _encode(s) -> bytes:
+    return s.encode() if isinstance(s, str) else s
+
+
+class Outbox:
+
+    def __init__(self, directory: str, max_bytes: int, segment_bytes=4096, batch_bytes=512) -> None:
+        """
+        Append-only outbox on the flash file system for the MQTT messages that can't be sent now
+
+        Messages are appended to segment files, telemetry and important messages (errors, state changes) to
+        separate ones. Telemetry is collected in RAM and written batch_bytes at a time to spare the flash,
+        an important message is written at once. When the segments take more than max_bytes, the oldest telemetry
+        segment is deleted; important ones only go when there is no telemetry left to drop.
+        Segments are read back oldest first and deleted once all their messages are delivered, so after a reboot
+        a message may be sent twice but isn't lost.
+        :param directory: directory of the segment files, created if missing
+        :param max_bytes: flash used by the segments at most
+        :param segment_bytes: size of a segment file, a new one is started when the next batch doesn't fit
+        :param batch_bytes: telemetry written to the flash at a time
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.batch_bytes = batch_bytes
+        # [segment id, kind, bytes], oldest first, and the segment each kind appends to
+        self.segments = []
+        self.active = [None, None]
+        self.pending = [bytearray(), bytearray()]
+        self.next_id = 1
+        # Flash wear
+        self.bytes_written = 0
+        self.writes = 0
+        self.dropped_bytes = 0
+        self._load()
+
+    def _load(self) -> None:
+        # Picks up the segments left by the previous boot
+        try:
+            uos.mkdir(self.directory)
+        except OSError:
+            pass  # exists already
+        for name in uos.listdir(self.directory):
+            try:
+                segment = [int(name[:-1]), _SUFFIX.index(name[-1]), 0]
+            except ValueError:
+                continue  # not a segment
+            segment[2] = uos.stat(self._path(segment))[6]
+            self.segments.append(segment)
+        self.segments.sort()
+        if self.segments:
+            self.next_id = self.segments[-1][0] + 1
+
+    def _path(self, segment) -> str:
+        return "{}/{:08d}{}".format(self.directory, segment[0], _SUFFIX[segment[1]])
+
+    def is_empty(self) -> bool:
+        return not self.segments and not self.pending[TELEMETRY] and not self.pending[IMPORTANT]
+
+    def size(self) -> int:
+        """ Returns the bytes used on the flash """
+        return sum(segment[2] for segment in self.segments)
+
+    def append(self, topic, payload, important=False) -> None:
+        """ Stores a message, written to the flash at once if important or with the next batch of telemetry """
+        topic = _encode(topic)
+        payload = _encode(payload)
+        kind = IMPORTANT if important else TELEMETRY
+        buf = self.pending[kind]
+        buf += ustruct.pack("<HH", len(topic), len(payload))
+        buf += topic
+        buf += payload
+        if important or len(buf) >= self.batch_bytes:
+            self._flush(kind)
+
+    def flush(self) -> None:
+        """ Writes the messages collected in RAM to the flash, eg. before a reset """
+        self._flush(TELEMETRY)
+        self._flush(IMPORTANT)
+
+    def _flush(self, kind: int) -> None:
+        buf = self.pending[kind]
+        if not buf:
+            return
+        segment = self.active[kind]
+        if segment is None or segment[2] and segment[2] + len(buf) > self.segment_bytes:
+            segment = self.active[kind] = [self.next_id, kind, 0]
+            self.next_id += 1
+            self.segments.append(segment)
+        with open(self._path(segment), "ab") as f:
+            f.write(buf)
+        segment[2] += len(buf)
+        self.bytes_written += len(buf)
+        self.writes += 1
+        self.pending[kind] = bytearray()
+        self._drop_over_cap()
+
+    def _drop_over_cap(self) -> None:
+        size = self.size()
+        while size > self.max_bytes:
+            victim = self.segments[0]
+            for segment in self.segments:
+                if segment[1] == TELEMETRY:
+                    victim = segment
+                    break
+            size -= victim[2]
+            self.dropped_bytes += victim[2]
+            self.remove(victim[0])
+
+    def next_segment(self, after=0):
+        """
+        Returns (segment id, [(topic, payload)]) of the oldest segment after the given id, None if there is none
+        Writes the batches first, the segment returned isn't appended to any more.
+        """
+        self.flush()
+        for segment in self.segments:
+            if segment[0] > after:
+                break
+        else:
+            return None
+        if self.active[segment[1]] is segment:
+            self.active[segment[1]] = None
+        with open(self._path(segment), "rb") as f:
+            data = f.read()
+        messages = []
+        pos = 0
+        # A record cut short by a power loss ends the segment
+        while pos + 4 <= len(data):
+            topic_len, payload_len = ustruct.unpack_from("<HH", data, pos)
+            pos += 4
+            end = pos + topic_len + payload_len
+            if end > len(data):
+                break
+            messages.append((data[pos:pos + topic_len], data[pos + topic_len:end]))
+            pos = end
+        return segment[0], messages
+
+    def remove(self, segment_id: int) -> None:
+        """ Deletes a segment whose messages are delivered """
+        for i, segment in enumerate(self.segments):
+            if segment[0] == segment_id:
+                del self.segments[i]
+                if self.active[segment[1]] is segment:
+                    self.active[segment[1]] = None
+                uos.remove(self._path(segment))
+                return
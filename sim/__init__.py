@@ -0,0 +1,16 @@
+"""
+Host-side simulator of the unit
+
+Runs the unmodified firmware on CPython with stand-ins of the MicroPython modules (sim/mpy) talking to
+a simulated world: virtual clock, Wi-Fi access point, network, MQTT broker, pins and DS18B20 sensors.
+Idle time is skipped, so a day of the unit runs in seconds and every run with the same seed is identical.
+
+Usage from Python::
+
+    from sim.simulation import Simulation
+
+    simulation = Simulation(hours=24)
+    simulation.add_default_hardware()
+    simulation.world.wifi_outage(3600, 120)
+    print(simulation.run())
+"""
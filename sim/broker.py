@@ -0,0 +1,378 @@
+import struct
+
+CONNECT = 0x10
+CONNACK = 0x20
+PUBLISH = 0x30
+PUBACK = 0x40
+SUBSCRIBE = 0x80
+SUBACK = 0x90
+UNSUBSCRIBE = 0xA0
+UNSUBACK = 0xB0
+PINGREQ = 0xC0
+PINGRESP = 0xD0
+DISCONNECT = 0xE0
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """ MQTT topic filter matching with the + and # wildcards """
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    for i, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if i >= len(topic_levels):
+            return False
+        if level != "+" and level != topic_levels[i]:
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+def encode_length(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            byte |= 0x80
+        out.append(byte)
+        if not n:
+            return bytes(out)
+
+
+def encode_str(s) -> bytes:
+    if isinstance(s, str):
+        s = s.encode()
+    return struct.pack("!H", len(s)) + s
+
+
+def packet(header: int, body: bytes) -> bytes:
+    return bytes([header]) + encode_length(len(body)) + body
+
+
+class Publication:
+    """ A message published to the broker, by a client or the server side of the simulation """
+    __slots__ = ("time_ms", "client_id", "topic", "payload", "qos", "retain", "dup")
+
+    def __init__(self, time_ms, client_id, topic, payload, qos=0, retain=False, dup=False):
+        self.time_ms = time_ms
+        self.client_id = client_id
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.dup = dup
+
+    def __repr__(self):
+        return "<Publication %d %s %s %r>" % (self.time_ms, self.client_id, self.topic, self.payload)
+
+
+class BrokerConnection:
+
+    def __init__(self, broker, endpoint) -> None:
+        """ Server side of one client connection, parses the packets as they arrive """
+        self.broker = broker
+        self.endpoint = endpoint
+        self.buf = bytearray()
+        self.client_id = None
+        self.subscriptions = {}
+        self.will = None
+        self.keepalive_s = 0
+        self.last_seen_us = broker.clock.time_us()
+        self.keepalive_timer = None
+        self.next_pid = 0
+        # Unacknowledged QoS 1 deliveries by packet id
+        self.in_flight = {}
+        self.open = True
+        broker.connections.add(self)
+        endpoint.on_data = self.on_data
+        endpoint.on_close = self.on_close
+
+    def send(self, data: bytes) -> None:
+        if self.open:
+            self.broker.packets_out += 1
+            self.endpoint.send(data)
+
+    def on_data(self) -> None:
+        self.buf += self.endpoint.receive()
+        self.last_seen_us = self.broker.clock.time_us()
+        # A stalled broker leaves the packets in the buffer until it answers again
+        while self.open and self.broker.responsive:
+            # Fixed header and remaining length
+            if len(self.buf) < 2:
+                return
+            length = 0
+            shift = 0
+            i = 1
+            while True:
+                if i >= len(self.buf):
+                    return
+                byte = self.buf[i]
+                length |= (byte & 0x7F) << shift
+                shift += 7
+                i += 1
+                if not byte & 0x80:
+                    break
+            if len(self.buf) < i + length:
+                return
+            header = self.buf[0]
+            body = bytes(self.buf[i:i + length])
+            del self.buf[:i + length]
+            self.broker.packets_in += 1
+            self.handle(header, body)
+
+    def handle(self, header: int, body: bytes) -> None:
+        kind = header & 0xF0
+        if self.client_id is None and kind != CONNECT:
+            self.drop()
+        elif kind == CONNECT:
+            self.handle_connect(body)
+        elif kind == PUBLISH:
+            self.handle_publish(header, body)
+        elif kind == PUBACK:
+            self.in_flight.pop(struct.unpack("!H", body[:2])[0], None)
+        elif kind == SUBSCRIBE:
+            self.handle_subscribe(body)
+        elif kind == UNSUBSCRIBE:
+            self.handle_unsubscribe(body)
+        elif kind == PINGREQ:
+            self.broker.pings += 1
+            self.send(bytes([PINGRESP, 0]))
+        elif kind == DISCONNECT:
+            self.will = None
+            self.drop()
+        else:
+            self.drop()
+
+    def handle_connect(self, body: bytes) -> None:
+        name_len = struct.unpack("!H", body[:2])[0]
+        pos = 2 + name_len
+        level, flags, keepalive = struct.unpack("!BBH", body[pos:pos + 4])
+        pos += 4
+        fields = []
+        while pos < len(body):
+            n = struct.unpack("!H", body[pos:pos + 2])[0]
+            fields.append(body[pos + 2:pos + 2 + n])
+            pos += 2 + n
+        self.client_id = fields.pop(0).decode()
+        if flags & 0x04:
+            will_topic = fields.pop(0).decode()
+            will_payload = fields.pop(0)
+            self.will = Publication(0, self.client_id, will_topic, will_payload, (flags >> 3) & 3, bool(flags & 0x20))
+        self.keepalive_s = keepalive
+        if level != 4 or not self.broker.accepts_connections():
+            self.send(packet(CONNACK, b"\x00\x03"))
+            self.drop()
+            return
+        self.broker.attach(self)
+        self.send(packet(CONNACK, b"\x00\x00"))
+        self.schedule_keepalive_check()
+
+    def handle_publish(self, header: int, body: bytes) -> None:
+        qos = (header >> 1) & 3
+        topic_len = struct.unpack("!H", body[:2])[0]
+        topic = body[2:2 + topic_len].decode()
+        pos = 2 + topic_len
+        if qos:
+            pid = struct.unpack("!H", body[pos:pos + 2])[0]
+            pos += 2
+        self.broker.publish(topic, body[pos:], qos, bool(header & 1), self.client_id, bool(header & 0x08))
+        if qos:
+            self.send(packet(PUBACK, struct.pack("!H", pid)))
+
+    def handle_subscribe(self, body: bytes) -> None:
+        pid = body[:2]
+        pos = 2
+        granted = bytearray()
+        topics = []
+        while pos < len(body):
+            n = struct.unpack("!H", body[pos:pos + 2])[0]
+            topic_filter = body[pos + 2:pos + 2 + n].decode()
+            qos = min(body[pos + 2 + n] & 3, 1)
+            pos += 3 + n
+            self.subscriptions[topic_filter] = qos
+            granted.append(qos)
+            topics.append(topic_filter)
+        self.send(packet(SUBACK, pid + bytes(granted)))
+        for topic_filter in topics:
+            for retained in self.broker.retained.values():
+                if topic_matches(topic_filter, retained.topic):
+                    self.deliver(retained, self.subscriptions[topic_filter], True)
+
+    def handle_unsubscribe(self, body: bytes) -> None:
+        pos = 2
+        while pos < len(body):
+            n = struct.unpack("!H", body[pos:pos + 2])[0]
+            self.subscriptions.pop(body[pos + 2:pos + 2 + n].decode(), None)
+            pos += 2 + n
+        self.send(packet(UNSUBACK, body[:2]))
+
+    def deliver(self, publication: Publication, qos: int, retain=False) -> None:
+        """ Sends a PUBLISH to the client at the lower of the two QoS levels """
+        qos = min(qos, publication.qos)
+        body = encode_str(publication.topic)
+        if qos:
+            self.next_pid = self.next_pid % 0xFFFF + 1
+            body += struct.pack("!H", self.next_pid)
+            self.in_flight[self.next_pid] = publication
+        body += publication.payload
+        self.broker.deliveries += 1
+        self.send(packet(PUBLISH | qos << 1 | (1 if retain else 0), body))
+
+    def schedule_keepalive_check(self) -> None:
+        if self.keepalive_s and self.open:
+            clock = self.broker.clock
+            # The client is dropped if nothing is heard from it for one and a half keepalive periods
+            deadline = self.last_seen_us + self.keepalive_s * 1500000
+            self.keepalive_timer = clock.call_at(deadline, self.check_keepalive)
+
+    def check_keepalive(self) -> None:
+        if not self.open:
+            return
+        clock = self.broker.clock
+        if not self.broker.responsive:
+            self.keepalive_timer = clock.call_later(self.keepalive_s * 1500000, self.check_keepalive)
+        elif clock.time_us() - self.last_seen_us >= self.keepalive_s * 1500000:
+            self.broker.keepalive_timeouts += 1
+            self.drop()
+        else:
+            self.schedule_keepalive_check()
+
+    def on_close(self) -> None:
+        """ The client closed the connection or it broke """
+        self.drop()
+
+    def drop(self) -> None:
+        if not self.open:
+            return
+        self.open = False
+        self.broker.connections.discard(self)
+        if self.keepalive_timer is not None:
+            self.broker.clock.cancel(self.keepalive_timer)
+        self.broker.detach(self)
+        self.endpoint.close()
+        if self.will is not None:
+            will = self.will
+            self.will = None
+            self.broker.publish(will.topic, will.payload, will.qos, will.retain, will.client_id)
+
+
+class Broker:
+
+    def __init__(self, clock, network, address=("10.0.0.1", 8883)) -> None:
+        """
+        MQTT 3.1.1 broker stand-in listening on the simulated network
+
+        Supports what the units use: clean sessions, QoS 0 and 1, retained messages, last will and keepalive.
+        Every message published is logged with its virtual time, so scenarios can check what the unit sent
+        and the server side can publish to the unit with publish().
+        """
+        self.clock = clock
+        self.network = network
+        self.address = address
+        self.up = True
+        # A stalled broker keeps the connections but doesn't process packets, eg. when overloaded
+        self.responsive = True
+        # CONNECTs accepted per second at most, the ones over it are refused with "server unavailable"
+        self.connect_limit = None
+        self.connect_window_us = 0
+        self.connect_window_count = 0
+        self.clients = {}
+        # All the open connections, also the ones not connected yet
+        self.connections = set()
+        self.retained = {}
+        self.log = []
+        self.subscribers = []
+        # Statistics
+        self.connects = 0
+        self.disconnects = 0
+        self.packets_in = 0
+        self.packets_out = 0
+        self.deliveries = 0
+        self.pings = 0
+        self.keepalive_timeouts = 0
+        # Virtual time in ms of every CONNECT received and the number refused
+        self.connect_log = []
+        self.refused = 0
+        network.listen(address, self.accept)
+
+    def accepts_connections(self) -> bool:
+        """ Called for every CONNECT """
+        self.connect_log.append(self.clock.time_ms())
+        if not self.up:
+            return False
+        if self.connect_limit is not None:
+            now = self.clock.time_us()
+            if now - self.connect_window_us >= 1000000:
+                self.connect_window_us = now
+                self.connect_window_count = 0
+            if self.connect_window_count >= self.connect_limit:
+                self.refused += 1
+                return False
+            self.connect_window_count += 1
+        return True
+
+    def accept(self, endpoint) -> None:
+        if not self.up:
+            endpoint.close()
+            return
+        BrokerConnection(self, endpoint)
+
+    def attach(self, connection: BrokerConnection) -> None:
+        # A new connection with the same client id takes over the session
+        previous = self.clients.get(connection.client_id)
+        if previous is not None:
+            previous.drop()
+        self.clients[connection.client_id] = connection
+        self.connects += 1
+
+    def detach(self, connection: BrokerConnection) -> None:
+        if self.clients.get(connection.client_id) is connection:
+            del self.clients[connection.client_id]
+            self.disconnects += 1
+
+    def set_up(self, up: bool) -> None:
+        """ Starts or stops the broker, stopping breaks all the connections """
+        self.up = up
+        if up:
+            self.network.listen(self.address, self.accept)
+        else:
+            self.network.unlisten(self.address)
+            for connection in list(self.clients.values()):
+                connection.will = None
+                connection.drop()
+
+    def set_responsive(self, responsive: bool) -> None:
+        """ Stalls the broker or lets it catch up with the packets that arrived in the meantime """
+        self.responsive = responsive
+        if responsive:
+            for connection in list(self.connections):
+                connection.on_data()
+
+    def subscribe(self, topic_filter: str, callback) -> None:
+        """ Calls callback(publication) for every message matching the filter, for the server side of a scenario """
+        self.subscribers.append((topic_filter, callback))
+
+    def publish(self, topic: str, payload, qos=1, retain=False, client_id=None, dup=False) -> None:
+        """ Routes a message to the subscribed clients, client_id None is the server side of the simulation """
+        if isinstance(payload, str):
+            payload = payload.encode()
+        publication = Publication(self.clock.time_ms(), client_id, topic, bytes(payload), qos, retain, dup)
+        self.log.append(publication)
+        if retain:
+            if payload:
+                self.retained[topic] = publication
+            else:
+                self.retained.pop(topic, None)
+        for topic_filter, callback in self.subscribers:
+            if topic_matches(topic_filter, topic):
+                callback(publication)
+        for connection in list(self.clients.values()):
+            for topic_filter, sub_qos in connection.subscriptions.items():
+                if topic_matches(topic_filter, topic):
+                    connection.deliver(publication, sub_qos)
+                    break
+
+    def published(self, topic_filter="#", client_id=None) -> list:
+        """ Returns the logged messages matching the topic filter, optionally only the ones of a client """
+        return [p for p in self.log
+                if topic_matches(topic_filter, p.topic) and (client_id is None or p.client_id == client_id)]
@@ -0,0 +1,132 @@
+import heapq
+import time
+
+
+class SimulationEnd(BaseException):
+    """ Raised from inside the firmware when the simulated time is up, not catchable by its except Exception """
+    pass
+
+
+class VirtualClock:
+
+    def __init__(self, end_us=None, poll_cost_us=100, cpu_scale=0.0) -> None:
+        """
+        Virtual microsecond clock of the simulator
+
+        Nothing advances it on its own: idle waits of the event loop skip straight to the next event,
+        blocking calls (socket reads, utime.sleep, 1-wire transactions) are charged as blocked time
+        and every event loop iteration is charged poll_cost_us of busy time, so busy-wait loops make progress.
+        With cpu_scale the real CPU time spent by the firmware is added as well, scaled to the target MCU.
+        World events (packet deliveries, outages, sensor changes) are timers fired as the clock passes them.
+        :param end_us: the clock raises SimulationEnd when it would pass this time
+        """
+        self.now_us = 0
+        self.end_us = end_us
+        self.poll_cost_us = poll_cost_us
+        self.cpu_scale = cpu_scale
+        self.timers = []
+        self.seq = 0
+        # Where the virtual time went
+        self.busy_us = 0
+        self.blocked_us = 0
+        self.idle_us = 0
+        self._real_ns = time.perf_counter_ns()
+
+    def time_us(self) -> int:
+        if self.cpu_scale:
+            real_ns = time.perf_counter_ns()
+            elapsed_us = int((real_ns - self._real_ns) * self.cpu_scale) // 1000
+            if elapsed_us:
+                self._real_ns = real_ns
+                self.busy_us += elapsed_us
+                self.now_us += elapsed_us
+        return self.now_us
+
+    def time_ms(self) -> int:
+        return self.time_us() // 1000
+
+    # World events
+
+    def call_at(self, t_us: int, callback, *args) -> list:
+        """ Schedules a world event, returns the entry that can be cancelled with cancel() """
+        self.seq += 1
+        entry = [t_us, self.seq, callback, args]
+        heapq.heappush(self.timers, entry)
+        return entry
+
+    def call_later(self, delay_us: int, callback, *args) -> list:
+        return self.call_at(self.time_us() + delay_us, callback, *args)
+
+    def cancel(self, entry) -> None:
+        # Cancelled entries stay in the heap without a callback
+        entry[2] = None
+
+    def next_event_us(self):
+        timers = self.timers
+        while timers and timers[0][2] is None:
+            heapq.heappop(timers)
+        return timers[0][0] if timers else None
+
+    def run_due(self) -> None:
+        """ Fires the world events that are due """
+        timers = self.timers
+        while timers and timers[0][0] <= self.now_us:
+            entry = heapq.heappop(timers)
+            callback = entry[2]
+            if callback is not None:
+                callback(*entry[3])
+
+    # Advancing the time
+
+    def advance_to(self, t_us: int) -> None:
+        """ Moves the clock forward to t_us, firing the world events on the way """
+        self.time_us()
+        while True:
+            nxt = self.next_event_us()
+            if nxt is None or nxt > t_us:
+                break
+            self._set(nxt)
+            self.run_due()
+        self._set(t_us)
+
+    def _set(self, t_us: int) -> None:
+        if t_us <= self.now_us:
+            return
+        if self.end_us is not None and t_us > self.end_us:
+            self.now_us = self.end_us
+            raise SimulationEnd("time is up")
+        self.now_us = t_us
+
+    def charge(self, us: int) -> None:
+        """ Busy time, the firmware keeps the CPU """
+        self.busy_us += us
+        self.advance_to(self.time_us() + us)
+
+    def block(self, us: int) -> None:
+        """ Blocked time, the firmware waits in a blocking call """
+        self.blocked_us += us
+        self.advance_to(self.time_us() + us)
+
+    def idle(self, us: int) -> None:
+        """ Idle time, the event loop sleeps """
+        self.idle_us += us
+        self.advance_to(self.time_us() + us)
+
+    def block_until(self, predicate, timeout_us=None) -> bool:
+        """
+        Blocks until the predicate is true, returns False on timeout
+        Raises SimulationEnd if nothing can ever make the predicate true
+        """
+        start = self.time_us()
+        deadline = None if timeout_us is None else start + timeout_us
+        while not predicate():
+            nxt = self.next_event_us()
+            if nxt is None or (deadline is not None and nxt > deadline):
+                if deadline is None:
+                    raise SimulationEnd("stalled in a blocking call")
+                self.blocked_us += deadline - self.now_us
+                self.advance_to(deadline)
+                return predicate()
+            self.blocked_us += max(0, nxt - self.now_us)
+            self.advance_to(nxt)
+        return True
@@ -0,0 +1,59 @@
+"""
+ds18x20 stand-in with the API of the MicroPython driver
+
+A conversion takes 94 to 750 ms depending on the resolution, the scratchpad keeps the previous
+reading until it is done. Readings are quantized to the resolution of the sensor.
+"""
+from sim import world
+from onewire import OneWireError, COMMAND_US
+
+CONVERSION_MS = {9: 94, 10: 188, 11: 375, 12: 750}
+READ_SCRATCH_US = 6000
+
+
+class DS18X20:
+
+    def __init__(self, onewire):
+        self.ow = onewire
+
+    def scan(self) -> list:
+        return [rom for rom in self.ow.scan() if rom[0] in (0x10, 0x22, 0x28)]
+
+    def convert_temp(self) -> None:
+        """ Starts a conversion on all the sensors of the bus """
+        self.ow._transaction(COMMAND_US)
+        clock = world.current.clock
+        now_us = clock.time_us()
+        for sensor in self.ow.bus.sensors.values():
+            sensor.converting_until_us = now_us + CONVERSION_MS[sensor.resolution] * 1000
+            sensor.converting_value = sensor.temperature(now_us / 1000000)
+
+    def _sensor(self, rom):
+        sensor = self.ow.bus.sensors.get(bytes(rom))
+        if sensor is None:
+            raise OneWireError()
+        until_us = sensor.converting_until_us
+        if until_us is not None and world.current.clock.time_us() >= until_us:
+            step = 0.5 ** (sensor.resolution - 8)
+            sensor.reading = round(sensor.converting_value / step) * step
+            sensor.converting_until_us = None
+        return sensor
+
+    def read_scratch(self, rom) -> bytearray:
+        self.ow._transaction(READ_SCRATCH_US)
+        sensor = self._sensor(rom)
+        raw = int(sensor.reading * 16) & 0xFFFF
+        config = ((sensor.resolution - 9) << 5) | 0x1F
+        return bytearray([raw & 0xFF, raw >> 8, 0x4B, 0x46, config, 0xFF, 0x0C, 0x10, 0x00])
+
+    def write_scratch(self, rom, buf) -> None:
+        self.ow._transaction(COMMAND_US)
+        sensor = self._sensor(rom)
+        sensor.resolution = ((buf[2] >> 5) & 3) + 9
+
+    def read_temp(self, rom) -> float:
+        buf = self.read_scratch(rom)
+        raw = buf[0] | buf[1] << 8
+        if raw & 0x8000:
+            raw -= 0x10000
+        return raw / 16
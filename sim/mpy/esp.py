@@ -0,0 +1,9 @@
+""" esp stand-in """
+
+
+def osdebug(level) -> None:
+    pass
+
+
+def flash_size() -> int:
+    return 4 * 1024 * 1024
@@ -0,0 +1,74 @@
+"""
+machine stand-in
+
+Output pins record their edges in the simulated world, reset() reboots the firmware.
+"""
+from sim import world
+
+PWRON_RESET = 1
+HARD_RESET = 2
+WDT_RESET = 3
+DEEPSLEEP_RESET = 4
+SOFT_RESET = 5
+
+_reset_cause = PWRON_RESET
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+    OPEN_DRAIN = 7
+    PULL_UP = 2
+    PULL_DOWN = 1
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self.mode = mode
+        self.pull = pull
+        if value is not None:
+            self.value(value)
+
+    def value(self, value=None):
+        if value is None:
+            return world.current.pins.get(self.id, 0)
+        world.current.set_pin(self.id, 1 if value else 0)
+        return None
+
+    def __call__(self, value=None):
+        return self.value(value)
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def __repr__(self):
+        return "Pin({})".format(self.id)
+
+
+def reset() -> None:
+    world.current.resets += 1
+    raise world.Reset()
+
+
+def soft_reset() -> None:
+    reset()
+
+
+def reset_cause() -> int:
+    return HARD_RESET if world.current.resets else PWRON_RESET
+
+
+def unique_id() -> bytes:
+    return b"\x24\x0a\xc4\x00\x00\x01"
+
+
+def freq(hz=None) -> int:
+    return 240000000
+
+
+def idle() -> None:
+    world.current.clock.charge(1000)
@@ -0,0 +1,49 @@
+"""
+network stand-in, the station interface of the simulated world
+"""
+from sim import world
+
+STA_IF = 0
+AP_IF = 1
+
+STAT_IDLE = 1000
+STAT_CONNECTING = 1001
+STAT_GOT_IP = 1010
+
+
+class WLAN:
+
+    def __init__(self, interface=STA_IF):
+        self.interface = interface
+
+    def active(self, is_active=None):
+        wifi = world.current.wifi
+        if is_active is None:
+            return wifi.active
+        wifi.active = bool(is_active)
+        if not is_active:
+            wifi.disconnect()
+        return None
+
+    def connect(self, ssid=None, password=None):
+        wifi = world.current.wifi
+        if not wifi.active:
+            raise OSError("STA must be active")
+        wifi.connect()
+
+    def disconnect(self):
+        world.current.wifi.disconnect()
+
+    def isconnected(self) -> bool:
+        return world.current.wifi.is_connected()
+
+    def status(self, param=None):
+        wifi = world.current.wifi
+        if wifi.is_connected():
+            return STAT_GOT_IP
+        return STAT_CONNECTING if wifi.wanted else STAT_IDLE
+
+    def ifconfig(self) -> tuple:
+        wifi = world.current.wifi
+        ip = wifi.ip if wifi.is_connected() else "0.0.0.0"
+        return ip, "255.255.255.0", "10.0.0.254", "10.0.0.254"
@@ -0,0 +1,41 @@
+"""
+onewire stand-in, the bus of the pin in the simulated world
+
+Bus transactions take their time on the virtual clock: a search costs about 13 ms per device,
+a reset with a ROM command about 1 ms.
+"""
+from sim import world
+
+SEARCH_ROM_US = 13000
+COMMAND_US = 1000
+
+
+class OneWireError(Exception):
+    pass
+
+
+class OneWire:
+    SEARCH_ROM = 0xF0
+    MATCH_ROM = 0x55
+    SKIP_ROM = 0xCC
+
+    def __init__(self, pin):
+        self.pin = pin
+        self.bus = world.current.bus(pin.id)
+
+    def _transaction(self, us: int) -> None:
+        self.bus.transactions += 1
+        world.current.clock.block(us)
+        if self.bus.failing:
+            raise OneWireError()
+
+    def reset(self, required=False) -> bool:
+        self._transaction(COMMAND_US)
+        present = bool(self.bus.sensors)
+        if required and not present:
+            raise OneWireError()
+        return present
+
+    def scan(self) -> list:
+        self._transaction(SEARCH_ROM_US * max(1, len(self.bus.sensors)))
+        return [bytearray(rom) for rom in self.bus.sensors]
@@ -0,0 +1,34 @@
+"""
+ucollections stand-in
+
+The deque takes the maxlen as a mandatory argument like MicroPython's, with flags=1 appending
+to a full deque raises IndexError, otherwise the oldest item is dropped.
+"""
+import collections as _collections
+from collections import OrderedDict, namedtuple
+
+
+class deque:
+
+    def __init__(self, iterable, maxlen, flags=0):
+        self._q = _collections.deque(iterable)
+        self.maxlen = maxlen
+        self.flags = flags
+
+    def append(self, item):
+        if len(self._q) >= self.maxlen:
+            if self.flags & 1:
+                raise IndexError("full")
+            self._q.popleft()
+        self._q.append(item)
+
+    def popleft(self):
+        if not self._q:
+            raise IndexError("empty")
+        return self._q.popleft()
+
+    def __len__(self):
+        return len(self._q)
+
+    def __bool__(self):
+        return bool(self._q)
@@ -0,0 +1,3 @@
+""" uerrno stand-in """
+from errno import *
+from errno import errorcode
@@ -0,0 +1,2 @@
+""" ujson stand-in, MicroPython raises ValueError on invalid input like json.JSONDecodeError is """
+from json import dumps, loads, dump, load
@@ -0,0 +1,2 @@
+""" uos stand-in, the flash file system is the working directory of the simulation """
+from os import listdir, mkdir, remove, rename, rmdir, stat
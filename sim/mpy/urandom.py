@@ -0,0 +1,30 @@
+""" urandom stand-in, drawing from the random generator of the world so runs are reproducible """
+from sim import world
+
+
+def getrandbits(n: int) -> int:
+    return world.current.random.getrandbits(n)
+
+
+def seed(n: int) -> None:
+    world.current.random.seed(n)
+
+
+def randrange(start, stop=None, step=1) -> int:
+    return world.current.random.randrange(start, stop, step)
+
+
+def randint(a: int, b: int) -> int:
+    return world.current.random.randint(a, b)
+
+
+def choice(seq):
+    return world.current.random.choice(seq)
+
+
+def random() -> float:
+    return world.current.random.random()
+
+
+def uniform(a: float, b: float) -> float:
+    return world.current.random.uniform(a, b)
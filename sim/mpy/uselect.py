@@ -0,0 +1,63 @@
+"""
+uselect stand-in
+
+Polling is where the virtual time of an idle event loop passes: when nothing is ready the clock
+skips to the next world event or the timeout, whichever comes first. Every call is charged the
+cost of one event loop iteration, so busy loops polling with a zero timeout make progress too.
+"""
+from sim import world
+from sim.clock import SimulationEnd
+from sim.net import POLLIN, POLLOUT, POLLERR, POLLHUP
+import errno as _errno
+
+
+class poll:
+
+    def __init__(self):
+        self.entries = {}
+
+    def register(self, obj, eventmask=POLLIN | POLLOUT):
+        self.entries[id(obj)] = [obj, eventmask]
+
+    def unregister(self, obj):
+        if self.entries.pop(id(obj), None) is None:
+            raise OSError(_errno.ENOENT)
+
+    def modify(self, obj, eventmask):
+        entry = self.entries.get(id(obj))
+        if entry is None:
+            raise OSError(_errno.ENOENT)
+        entry[1] = eventmask
+
+    def _ready(self) -> list:
+        res = []
+        for entry in self.entries.values():
+            obj, mask = entry
+            events = obj._poll_events() & (mask | POLLERR | POLLHUP)
+            if events:
+                res.append((obj, events))
+        return res
+
+    def ipoll(self, timeout=-1, flags=0):
+        current = world.current
+        clock = current.clock
+        current.polls += 1
+        clock.charge(clock.poll_cost_us)
+        deadline = None if timeout < 0 else clock.time_us() + timeout * 1000
+        while True:
+            res = self._ready()
+            if res or (deadline is not None and clock.time_us() >= deadline):
+                break
+            nxt = clock.next_event_us()
+            if nxt is None and deadline is None:
+                raise SimulationEnd("nothing left to wait for")
+            target = nxt if deadline is None or (nxt is not None and nxt < deadline) else deadline
+            clock.idle(max(0, target - clock.time_us()))
+        if flags & 1:
+            # One-shot: the object has to be registered again to be polled
+            for obj, events in res:
+                self.entries[id(obj)][1] = 0
+        return res
+
+    def poll(self, timeout=-1):
+        return self.ipoll(timeout)
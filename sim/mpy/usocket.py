@@ -0,0 +1,214 @@
+"""
+usocket stand-in on the simulated network
+
+Blocking calls wait on the virtual clock, non-blocking ones behave like lwIP on the ESP32 port:
+read() returns None when no data is available and write() accepts up to the free send buffer.
+"""
+from sim import world
+from sim.net import Endpoint, POLLIN, POLLOUT, POLLERR, POLLHUP, EINPROGRESS, EAGAIN, ETIMEDOUT, ENOTCONN
+
+AF_INET = 2
+AF_INET6 = 10
+SOCK_STREAM = 1
+SOCK_DGRAM = 2
+SOCK_RAW = 3
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+SOL_SOCKET = 0xFFF
+SO_REUSEADDR = 4
+
+# Error of the ESP32 port when a name can't be resolved
+_DNS_FAILURE = -202
+
+
+def getaddrinfo(host, port, af=0, type=0, proto=0, flags=0) -> list:
+    current = world.current
+    network = current.network
+    if not current.wifi.is_connected():
+        raise OSError(_DNS_FAILURE)
+    current.clock.block(network.dns_ms * 1000)
+    return [(AF_INET, SOCK_STREAM, IPPROTO_TCP, "", (network.resolve(host), port))]
+
+
+class socket:
+
+    def __init__(self, af=AF_INET, type=SOCK_STREAM, proto=IPPROTO_TCP):
+        self.endpoint = None
+        self.timeout_us = None
+        self.blocking = True
+        self.address = None
+        self.backlog = None
+
+    # Options
+
+    def setblocking(self, flag):
+        self.blocking = bool(flag)
+        self.timeout_us = None
+
+    def settimeout(self, value):
+        if value is None:
+            self.setblocking(True)
+        elif value == 0:
+            self.setblocking(False)
+        else:
+            self.blocking = True
+            self.timeout_us = int(value * 1000000)
+
+    def setsockopt(self, level, optname, value):
+        pass
+
+    def fileno(self):
+        return id(self)
+
+    # Connecting
+
+    def connect(self, address):
+        network = world.current.network
+        endpoint = Endpoint(network, True, network.sndbuf)
+        self.endpoint = endpoint
+        network.connect(endpoint, tuple(address))
+        if not self.blocking:
+            raise OSError(EINPROGRESS)
+        self._wait(lambda: endpoint.connected or endpoint.error)
+        if endpoint.error:
+            raise OSError(endpoint.error)
+
+    def bind(self, address):
+        self.address = tuple(address)
+
+    def listen(self, backlog=5):
+        self.backlog = []
+        world.current.network.listen(self.address, self.backlog.append)
+
+    def accept(self):
+        if not self.backlog:
+            if not self.blocking:
+                raise OSError(EAGAIN)
+            self._wait(lambda: self.backlog)
+        client = socket()
+        client.endpoint = self.backlog.pop(0)
+        world.current.network.endpoints.add(client.endpoint)
+        return client, ("10.0.0.1", 0)
+
+    def _wait(self, predicate):
+        if not world.current.clock.block_until(predicate, self.timeout_us):
+            raise OSError(ETIMEDOUT)
+
+    def _connected_endpoint(self) -> Endpoint:
+        endpoint = self.endpoint
+        if endpoint is None:
+            raise OSError(ENOTCONN)
+        if endpoint.error:
+            raise OSError(endpoint.error)
+        return endpoint
+
+    # Reading
+
+    def _readable(self):
+        endpoint = self.endpoint
+        return endpoint.rx or endpoint.peer_closed or endpoint.error
+
+    def read(self, n=-1):
+        endpoint = self._connected_endpoint()
+        if n < 0:
+            if self.blocking:
+                self._wait(lambda: endpoint.peer_closed or endpoint.error)
+                self._connected_endpoint()
+            elif not endpoint.rx and not endpoint.peer_closed:
+                return None
+            return endpoint.receive()
+        out = bytearray()
+        while len(out) < n:
+            if endpoint.rx:
+                out += endpoint.receive(n - len(out))
+                continue
+            if endpoint.peer_closed or not self.blocking:
+                break
+            self._wait(self._readable)
+            self._connected_endpoint()
+        if not out and n and not self.blocking and not endpoint.peer_closed:
+            return None
+        return bytes(out)
+
+    def readinto(self, buf, nbytes=-1):
+        if nbytes < 0:
+            nbytes = len(buf)
+        data = self.read(nbytes)
+        if data is None:
+            return None
+        buf[:len(data)] = data
+        return len(data)
+
+    def readline(self):
+        endpoint = self._connected_endpoint()
+        out = bytearray()
+        while not out.endswith(b"\n"):
+            if endpoint.rx:
+                i = endpoint.rx.find(b"\n")
+                out += endpoint.receive(-1 if i < 0 else i + 1)
+                continue
+            if endpoint.peer_closed or not self.blocking:
+                break
+            self._wait(self._readable)
+            self._connected_endpoint()
+        if not out and not self.blocking and not endpoint.peer_closed:
+            return None
+        return bytes(out)
+
+    def recv(self, bufsize):
+        endpoint = self._connected_endpoint()
+        if not endpoint.rx and not endpoint.peer_closed:
+            if not self.blocking:
+                raise OSError(EAGAIN)
+            self._wait(self._readable)
+            self._connected_endpoint()
+        return endpoint.receive(bufsize)
+
+    # Writing
+
+    def write(self, buf, off=0, sz=-1):
+        endpoint = self._connected_endpoint()
+        if isinstance(buf, str):
+            buf = buf.encode()
+        data = memoryview(buf)[off:] if sz < 0 else memoryview(buf)[off:off + sz]
+        if not self.blocking:
+            n = endpoint.send(data)
+            return n if n else None
+        sent = 0
+        while sent < len(data):
+            sent += endpoint.send(data[sent:])
+            if sent < len(data):
+                self._wait(lambda: endpoint.send_space() > 0 or endpoint.error)
+                self._connected_endpoint()
+        return sent
+
+    def send(self, buf):
+        n = self.write(buf)
+        if n is None:
+            raise OSError(EAGAIN)
+        return n
+
+    def sendall(self, buf):
+        blocking = self.blocking
+        self.blocking = True
+        try:
+            self.write(buf)
+        finally:
+            self.blocking = blocking
+
+    def close(self):
+        if self.endpoint is not None:
+            self.endpoint.close()
+        if self.backlog is not None:
+            world.current.network.unlisten(self.address)
+            self.backlog = None
+
+    def _poll_events(self) -> int:
+        if self.backlog:
+            return POLLIN
+        if self.endpoint is None:
+            return 0
+        return self.endpoint.poll_events()
+
+    def __repr__(self):
+        return "<socket %x>" % id(self)
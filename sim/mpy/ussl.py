@@ -0,0 +1,92 @@
+"""
+ussl stand-in
+
+The TLS handshake takes two round trips and the public key operations of mbedTLS on the ESP32.
+A blocking wrap_socket() blocks for all of it and returns the socket as is: the simulated link is trusted
+and not encrypted. With do_handshake=False on a non-blocking socket, like the ESP32 port, the handshake
+advances in the reads and writes instead: they return None while a flight of the handshake is on the way
+and only the public key operations, done when the server's first flight arrives, hold the CPU.
+"""
+from sim import world
+from sim.net import POLLIN, POLLOUT, POLLERR, POLLHUP
+
+HANDSHAKE_CPU_MS = 1800
+
+
+def wrap_socket(sock, server_side=False, keyfile=None, certfile=None, cert_reqs=0, ca_certs=None,
+                server_hostname=None, do_handshake=True):
+    if not do_handshake:
+        return SSLSocket(sock)
+    current = world.current
+    current.clock.block((4 * current.network.link.latency_ms + HANDSHAKE_CPU_MS) * 1000)
+    return sock
+
+
+def _noop() -> None:
+    pass
+
+
+class SSLSocket:
+
+    def __init__(self, sock) -> None:
+        """ TLS socket doing its handshake in the reads and writes """
+        self.sock = sock
+        # CPU time of the handshake once each of its round trips is back
+        self.flights = [HANDSHAKE_CPU_MS, 0]
+        self.flight_back_us = None
+
+    def _handshake(self) -> bool:
+        """ Advances the handshake as far as it can without waiting, returns True once it is done """
+        clock = world.current.clock
+        while self.flights:
+            self.sock._connected_endpoint()
+            if self.flight_back_us is None:
+                self.flight_back_us = clock.time_us() + 2 * world.current.network.link.latency_ms * 1000
+                # Wakes up an idle poll when the answer is back
+                clock.call_at(self.flight_back_us, _noop)
+                return False
+            if clock.time_us() < self.flight_back_us:
+                return False
+            clock.charge(self.flights.pop(0) * 1000)
+            self.flight_back_us = None
+        return True
+
+    def setblocking(self, flag):
+        self.sock.setblocking(flag)
+
+    def read(self, n=-1):
+        if not self._handshake():
+            return None
+        return self.sock.read(n)
+
+    def readinto(self, buf, nbytes=-1):
+        if not self._handshake():
+            return None
+        return self.sock.readinto(buf, nbytes)
+
+    def readline(self):
+        if not self._handshake():
+            return None
+        return self.sock.readline()
+
+    def write(self, buf, off=0, sz=-1):
+        if not self._handshake():
+            return None
+        return self.sock.write(buf, off, sz)
+
+    def close(self):
+        self.sock.close()
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def _poll_events(self) -> int:
+        events = self.sock._poll_events()
+        if events & (POLLERR | POLLHUP) or not self.flights:
+            return events
+        if self.flight_back_us is not None and world.current.clock.time_us() >= self.flight_back_us:
+            return POLLIN | POLLOUT
+        return 0
+
+    def __repr__(self):
+        return "<SSLSocket %r>" % self.sock
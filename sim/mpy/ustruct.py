@@ -0,0 +1,2 @@
+""" ustruct stand-in """
+from struct import *
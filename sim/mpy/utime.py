@@ -0,0 +1,63 @@
+"""
+utime stand-in on the virtual clock of the simulator
+
+The ticks wrap around at the small int range of the ESP32 port like on the device.
+time() counts from the MicroPython epoch, 2000-01-01 without NTP.
+"""
+import time as _time
+from sim import world
+
+TICKS_PERIOD = 1 << 30
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALFPERIOD = TICKS_PERIOD // 2
+_EPOCH_OFFSET = 946684800
+
+
+def ticks_ms() -> int:
+    return (world.current.clock.time_us() // 1000) & TICKS_MAX
+
+
+def ticks_us() -> int:
+    return world.current.clock.time_us() & TICKS_MAX
+
+
+def ticks_cpu() -> int:
+    return ticks_us()
+
+
+def ticks_add(ticks: int, delta: int) -> int:
+    return (ticks + delta) & TICKS_MAX
+
+
+def ticks_diff(ticks1: int, ticks2: int) -> int:
+    return ((ticks1 - ticks2 + TICKS_HALFPERIOD) & TICKS_MAX) - TICKS_HALFPERIOD
+
+
+def sleep(seconds) -> None:
+    world.current.clock.block(int(seconds * 1000000))
+
+
+def sleep_ms(ms) -> None:
+    world.current.clock.block(int(ms) * 1000)
+
+
+def sleep_us(us) -> None:
+    world.current.clock.block(int(us))
+
+
+def time() -> int:
+    return world.current.clock.time_us() // 1000000
+
+
+def localtime(secs=None) -> tuple:
+    if secs is None:
+        secs = time()
+    t = _time.gmtime(secs + _EPOCH_OFFSET)
+    return t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec, t.tm_wday, t.tm_yday
+
+
+gmtime = localtime
+
+
+def mktime(t) -> int:
+    return int(_time.mktime(tuple(t[:8]) + (0,)) - _time.timezone) - _EPOCH_OFFSET
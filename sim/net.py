@@ -0,0 +1,225 @@
+import errno
+
+# Values of the MicroPython ESP32 port
+EINPROGRESS = errno.EINPROGRESS
+ECONNRESET = errno.ECONNRESET
+ECONNREFUSED = errno.ECONNREFUSED
+ECONNABORTED = errno.ECONNABORTED
+EHOSTUNREACH = errno.EHOSTUNREACH
+ETIMEDOUT = errno.ETIMEDOUT
+EAGAIN = errno.EAGAIN
+ENOTCONN = errno.ENOTCONN
+
+POLLIN = 0x0001
+POLLOUT = 0x0004
+POLLERR = 0x0008
+POLLHUP = 0x0010
+
+
+class Link:
+
+    def __init__(self, latency_ms=20, bandwidth_kbps=1000) -> None:
+        """ One-way characteristics of the path between the unit and the servers """
+        self.latency_ms = latency_ms
+        self.bandwidth_kbps = bandwidth_kbps
+
+
+class Endpoint:
+
+    def __init__(self, network, station: bool, sndbuf: int) -> None:
+        """
+        One end of a simulated TCP connection
+
+        Data written is delivered to the peer after the transmission time and the latency of the link.
+        A station (unit side) endpoint is limited to sndbuf unacknowledged bytes like lwIP does,
+        the space is freed once the peer received the data.
+        Servers register on_data / on_close callbacks instead of polling.
+        """
+        self.network = network
+        self.station = station
+        self.sndbuf = sndbuf
+        self.peer = None
+        self.rx = bytearray()
+        self.in_flight = 0
+        self.link_free_us = 0
+        # Set once connected, peer_closed once the peer closed its side and everything was received
+        self.connected = False
+        self.peer_closed = False
+        self.error = 0
+        self.closed = False
+        self.on_data = None
+        self.on_close = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    # Sending
+
+    def send_space(self) -> int:
+        if self.sndbuf is None:
+            return 1 << 30
+        return self.sndbuf - self.in_flight
+
+    def send(self, data) -> int:
+        """ Queues up to send_space() bytes for delivery, returns the number of bytes accepted """
+        if self.error:
+            raise OSError(self.error)
+        if self.closed or not self.connected:
+            raise OSError(ENOTCONN)
+        n = min(len(data), self.send_space())
+        if n <= 0:
+            return 0
+        chunk = bytes(data[:n])
+        clock = self.network.clock
+        link = self.network.link
+        now = clock.time_us()
+        start = max(now, self.link_free_us)
+        self.link_free_us = start + n * 8000 // link.bandwidth_kbps
+        self.in_flight += n
+        self.bytes_sent += n
+        if self.station:
+            self.network.bytes_sent += n
+        clock.call_at(self.link_free_us + link.latency_ms * 1000, self._deliver, chunk)
+        return n
+
+    def _deliver(self, chunk) -> None:
+        self.in_flight -= len(chunk)
+        peer = self.peer
+        if peer is None or peer.closed or peer.error or self.error:
+            return
+        peer.rx += chunk
+        peer.bytes_received += len(chunk)
+        if peer.station:
+            self.network.bytes_received += len(chunk)
+        if peer.on_data is not None:
+            peer.on_data()
+
+    # Receiving
+
+    def receive(self, n=-1) -> bytes:
+        rx = self.rx
+        if n < 0 or n >= len(rx):
+            data = bytes(rx)
+            rx[:] = b""
+        else:
+            data = bytes(rx[:n])
+            del rx[:n]
+        return data
+
+    # Closing
+
+    def close(self) -> None:
+        """ Closes our side, the peer sees the end of stream once all the data sent before is delivered """
+        if self.closed:
+            return
+        self.closed = True
+        self.network.endpoints.discard(self)
+        peer = self.peer
+        if peer is not None and self.connected and not self.error:
+            link = self.network.link
+            t = max(self.network.clock.time_us(), self.link_free_us) + link.latency_ms * 1000
+            self.network.clock.call_at(t, peer._peer_finished)
+
+    def _peer_finished(self) -> None:
+        if self.closed:
+            return
+        self.peer_closed = True
+        if self.on_close is not None:
+            self.on_close()
+
+    def abort(self, error: int) -> None:
+        """ Breaks the connection without a goodbye, eg. when the access point goes down """
+        if self.closed or self.error:
+            return
+        self.error = error
+        self.rx[:] = b""
+        if self.on_close is not None:
+            self.on_close()
+
+    def poll_events(self) -> int:
+        if self.error:
+            return POLLERR | POLLHUP
+        events = 0
+        if self.rx or self.peer_closed:
+            events |= POLLIN
+        if self.peer_closed:
+            events |= POLLHUP
+        if self.connected and not self.peer_closed and self.send_space() > 0:
+            events |= POLLOUT
+        return events
+
+
+class Network:
+
+    def __init__(self, clock, wifi) -> None:
+        """
+        The network seen by the unit: name resolution, the servers listening and the live connections
+        Connections are only possible while the unit is associated with the access point.
+        """
+        self.clock = clock
+        self.wifi = wifi
+        self.link = Link()
+        self.hosts = {}
+        self.default_host = None
+        self.listeners = {}
+        self.endpoints = set()
+        self.dns_ms = 30
+        self.dns_lookups = 0
+        self.connects = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        # Send buffer of the unit's sockets, TCP_SND_BUF of the ESP32 lwIP
+        self.sndbuf = 5744
+
+    def add_host(self, name: str, ip: str) -> None:
+        self.hosts[name] = ip
+        if self.default_host is None:
+            self.default_host = ip
+
+    def resolve(self, name: str) -> str:
+        """ Resolves a host name, unknown names resolve to the first host like a catch-all DNS """
+        self.dns_lookups += 1
+        if name in self.hosts.values():
+            return name
+        return self.hosts.get(name, self.default_host)
+
+    def listen(self, address: tuple, accept) -> None:
+        """ Registers a server, accept is called with the server side Endpoint of every new connection """
+        self.listeners[address] = accept
+
+    def unlisten(self, address: tuple) -> None:
+        self.listeners.pop(address, None)
+
+    def connect(self, endpoint: Endpoint, address: tuple) -> None:
+        """
+        Starts connecting the endpoint, the handshake completes after a round trip
+        A refused connection sets the error of the endpoint instead
+        """
+        if not self.wifi.is_connected():
+            raise OSError(EHOSTUNREACH)
+        self.connects += 1
+        self.endpoints.add(endpoint)
+        rtt_us = 2 * self.link.latency_ms * 1000
+        self.clock.call_later(rtt_us, self._established, endpoint, address)
+
+    def _established(self, endpoint: Endpoint, address: tuple) -> None:
+        if endpoint.closed or endpoint.error:
+            return
+        accept = self.listeners.get(address)
+        if accept is None:
+            endpoint.error = ECONNREFUSED
+            return
+        server = Endpoint(self, False, None)
+        server.peer = endpoint
+        endpoint.peer = server
+        server.connected = True
+        endpoint.connected = True
+        accept(server)
+
+    def abort_all(self, error=ECONNABORTED) -> None:
+        """ Breaks all the connections of the unit """
+        for endpoint in list(self.endpoints):
+            peer = endpoint.peer
+            endpoint.abort(error)
+            if peer is not None:
+                peer.abort(error)
+        self.endpoints.clear()
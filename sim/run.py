@@ -0,0 +1,60 @@
+"""
+Command line runner of the simulator
+
+Boots the firmware against the simulated world and prints a summary of the run as JSON.
+The server side of the project can be scripted with periodic status requests and growlight switching,
+outages of the access point and the broker and broker stalls (connected but not answering)
+are given as START:DURATION in seconds.
+
+Run from the repository root: python -m sim.run --hours 24 --status-request-every 300 --wifi-outage 3600:120
+"""
+import argparse
+import json
+from sim.simulation import Simulation
+
+
+def parse_outage(value: str) -> tuple:
+    start, duration = value.split(":")
+    return float(start), float(duration)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Runs the unit firmware in virtual time")
+    parser.add_argument("--hours", type=float, default=24.0, help="virtual duration of the run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="echo the console of the firmware")
+    parser.add_argument("--cpu-scale", type=float, default=0.0,
+                        help="add the real CPU time of the firmware multiplied by this, eg. 30 for an ESP32")
+    parser.add_argument("--status-request-every", type=float, default=0, metavar="SEC")
+    parser.add_argument("--control-every", type=float, default=0, metavar="SEC",
+                        help="toggle the growlight from the server side")
+    parser.add_argument("--wifi-outage", type=parse_outage, action="append", default=[], metavar="START:DURATION")
+    parser.add_argument("--broker-outage", type=parse_outage, action="append", default=[], metavar="START:DURATION")
+    parser.add_argument("--broker-stall", type=parse_outage, action="append", default=[], metavar="START:DURATION")
+    args = parser.parse_args()
+
+    simulation = Simulation(args.hours, args.seed, args.verbose, args.cpu_scale)
+    simulation.add_default_hardware()
+    world = simulation.world
+    config = simulation.unit_config()
+    if args.status_request_every:
+        world.every(args.status_request_every, world.broker.publish, config.mqtt_topic_status_request, "")
+    if args.control_every:
+        state = [0]
+
+        def toggle_growlight():
+            state[0] ^= 1
+            world.broker.publish(config.mqtt_topic_control, json.dumps({"relay|growlight": state[0]}))
+        world.every(args.control_every, toggle_growlight)
+    for start, duration in args.wifi_outage:
+        world.wifi_outage(start, duration)
+    for start, duration in args.broker_outage:
+        world.broker_outage(start, duration)
+    for start, duration in args.broker_stall:
+        world.broker_stall(start, duration)
+
+    print(json.dumps(simulation.run(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+import importlib
+import os
+import sys
+import tempfile
+import time
+from sim import world as world_module
+from sim.clock import SimulationEnd
+from sim.world import World, Reset
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES_DIR = os.path.join(REPO_ROOT, "sim", "mpy")
+
+# Packages of the firmware, imported afresh on every boot
+FIRMWARE_PACKAGES = ("main", "uasyncio", "unit", "mqtt", "wifi", "modules")
+
+# Placeholders of unit/config.py filled for the simulated network
+DEFAULT_CONFIG = {
+    "wifi_ssid": "sim",
+    "wifi_password": "sim",
+    "mqtt_server": "broker.sim",
+    "mqtt_port": 8883,
+    "mqtt_user": "sim",
+    "mqtt_password": "sim",
+}
+
+
+def install_modules() -> None:
+    """ Puts the MicroPython module stand-ins and the firmware on the import path """
+    for path in (REPO_ROOT, MODULES_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+
+def purge_firmware() -> None:
+    """ Forgets the imported firmware modules, like a reboot wipes the heap """
+    for name in list(sys.modules):
+        if name.split(".")[0] in FIRMWARE_PACKAGES:
+            del sys.modules[name]
+
+
+class Console:
+
+    def __init__(self, world, stream=None) -> None:
+        """ stdout of the firmware, counts the lines and prefixes them with the virtual time if echoed """
+        self.world = world
+        self.stream = stream
+        self.lines = 0
+        self.at_line_start = True
+
+    def write(self, text: str) -> int:
+        self.lines += text.count("\n")
+        if self.stream is not None:
+            for part in text.splitlines(True):
+                if self.at_line_start:
+                    ms = self.world.clock.time_us() // 1000
+                    self.stream.write("[{:02d}:{:02d}:{:02d}.{:03d}] ".format(
+                        ms // 3600000, ms // 60000 % 60, ms // 1000 % 60, ms % 1000))
+                self.stream.write(part)
+                self.at_line_start = part.endswith("\n")
+        return len(text)
+
+    def flush(self) -> None:
+        if self.stream is not None:
+            self.stream.flush()
+
+
+class Simulation:
+
+    def __init__(self, hours=24.0, seed=1, verbose=False, cpu_scale=0.0, config=None, world=None) -> None:
+        """
+        Runs the unmodified firmware (main.main()) on the host against a simulated world
+
+        The firmware is booted again after machine.reset() until the virtual time is up.
+        Its flash is a temporary directory kept across reboots.
+        :param hours: virtual duration of the run
+        :param verbose: echoes the console of the firmware with virtual timestamps
+        :param cpu_scale: adds the real CPU time of the firmware scaled by this factor, 0 for a deterministic run
+        :param config: overrides of unit/config.py values on top of DEFAULT_CONFIG
+        """
+        install_modules()
+        self.world = world if world is not None else World(seed, hours, cpu_scale=cpu_scale)
+        self.verbose = verbose
+        self.config = dict(DEFAULT_CONFIG)
+        if config:
+            self.config.update(config)
+        self.flash_dir = tempfile.mkdtemp(prefix="sim-flash-")
+        self.console = Console(self.world, sys.stdout if verbose else None)
+        self.end_reason = None
+        self.real_sec = 0.0
+        self.loop = None
+
+    def unit_config(self):
+        """ Returns the unit/config.py module with the overrides of the simulation applied """
+        world_module.current = self.world
+        config = importlib.import_module("unit.config")
+        for key, value in self.config.items():
+            setattr(config, key, value)
+        return config
+
+    def add_default_hardware(self) -> None:
+        """ Adds the water temperature sensor the unit expects on its 1-wire pin """
+        self.world.add_sensor(self.unit_config().water_temp_sensor_pin)
+
+    def run(self) -> dict:
+        world_module.current = self.world
+        cwd = os.getcwd()
+        stdout = sys.stdout
+        started = time.perf_counter()
+        os.chdir(self.flash_dir)
+        sys.stdout = self.console
+        try:
+            while True:
+                purge_firmware()
+                self.world.boots += 1
+                self.unit_config()
+                main = importlib.import_module("main")
+                try:
+                    main.main()
+                    self.end_reason = "main() returned"
+                    break
+                except Reset:
+                    continue
+                except SimulationEnd as e:
+                    self.end_reason = e.args[0] if e.args else "time is up"
+                    break
+                finally:
+                    self.loop = sys.modules["uasyncio.core"]._event_loop
+        finally:
+            sys.stdout = stdout
+            os.chdir(cwd)
+            self.real_sec = time.perf_counter() - started
+        return self.summary()
+
+    def summary(self) -> dict:
+        world = self.world
+        clock = world.clock
+        broker = world.broker
+        network = world.network
+        published = {}
+        for publication in broker.log:
+            if publication.client_id is not None:
+                published[publication.topic] = published.get(publication.topic, 0) + 1
+        virtual_sec = clock.now_us / 1000000
+        return {
+            "virtualSec": virtual_sec,
+            "realSec": round(self.real_sec, 3),
+            "speedup": round(virtual_sec / self.real_sec) if self.real_sec else 0,
+            "endReason": self.end_reason,
+            "boots": world.boots,
+            "resets": world.resets,
+            "time": {
+                "busyMs": clock.busy_us // 1000,
+                "blockedMs": clock.blocked_us // 1000,
+                "idleMs": clock.idle_us // 1000,
+                "polls": world.polls
+            },
+            "wifi": {"associations": world.wifi.associations},
+            "network": {
+                "dnsLookups": network.dns_lookups,
+                "connects": network.connects,
+                "bytesSent": network.bytes_sent,
+                "bytesReceived": network.bytes_received
+            },
+            "mqtt": {
+                "connects": broker.connects,
+                "disconnects": broker.disconnects,
+                "packetsIn": broker.packets_in,
+                "packetsOut": broker.packets_out,
+                "pings": broker.pings,
+                "keepaliveTimeouts": broker.keepalive_timeouts,
+                "published": published
+            },
+            "pinEdges": {pin: len(edges) for pin, edges in world.pin_edges.items()},
+            "consoleLines": self.console.lines,
+            "loop": self.loop.queue_stats() if self.loop is not None else None
+        }
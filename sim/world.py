@@ -0,0 +1,187 @@
+import math
+import random
+from sim.clock import VirtualClock
+from sim.net import Network
+from sim.broker import Broker
+
+# The world the stand-in modules talk to, set by Simulation.run()
+current = None
+
+
+class Reset(BaseException):
+    """ Raised by machine.reset(), the simulation boots the firmware again """
+    pass
+
+
+class Wifi:
+
+    def __init__(self, clock) -> None:
+        """
+        The access point and the station interface of the unit
+
+        connect() associates after connect_ms if the access point is up. While it is down the station
+        keeps retrying on its own like the ESP-IDF does, and associates again once it is back.
+        """
+        self.clock = clock
+        self.ap_up = True
+        self.connect_ms = 1500
+        self.ip = "10.0.0.42"
+        self.active = False
+        self.wanted = False
+        self.associated = False
+        self.association = None
+        self.associations = 0
+        self.on_lost = []
+
+    def is_connected(self) -> bool:
+        return self.associated
+
+    def connect(self) -> None:
+        self.wanted = True
+        if not self.associated and self.association is None and self.ap_up:
+            self.association = self.clock.call_later(self.connect_ms * 1000, self._associated)
+
+    def _associated(self) -> None:
+        self.association = None
+        if self.ap_up and self.wanted:
+            self.associated = True
+            self.associations += 1
+
+    def disconnect(self) -> None:
+        self.wanted = False
+        self._lost()
+
+    def _lost(self) -> None:
+        if self.association is not None:
+            self.clock.cancel(self.association)
+            self.association = None
+        if self.associated:
+            self.associated = False
+            for callback in self.on_lost:
+                callback()
+
+    def set_ap_up(self, up: bool) -> None:
+        self.ap_up = up
+        if not up:
+            self._lost()
+        elif self.wanted:
+            self.connect()
+
+
+class OneWireBus:
+
+    def __init__(self) -> None:
+        """ Devices on the 1-wire bus of a pin, ROM codes mapped to DS18B20 sensor states """
+        self.sensors = {}
+        self.failing = False
+        self.transactions = 0
+
+
+class Sensor:
+
+    def __init__(self, rom: bytes, temperature) -> None:
+        """
+        A DS18B20 on a bus
+        :param temperature: temperature in Celsius as a function of the virtual time in seconds
+        """
+        self.rom = rom
+        self.temperature = temperature
+        self.resolution = 12
+        # Power-on value of the scratchpad until the first conversion is done
+        self.reading = 85.0
+        self.converting_until_us = None
+        self.converting_value = None
+
+
+class World:
+
+    def __init__(self, seed=1, hours=None, poll_cost_us=100, cpu_scale=0.0) -> None:
+        """
+        The simulated surroundings of one unit: clock, Wi-Fi, network, MQTT broker, pins and sensors
+        :param hours: virtual duration of the simulation, None to run until stopped
+        """
+        end_us = None if hours is None else int(hours * 3600 * 1000000)
+        self.clock = VirtualClock(end_us, poll_cost_us, cpu_scale)
+        self.random = random.Random(seed)
+        self.wifi = Wifi(self.clock)
+        self.network = Network(self.clock, self.wifi)
+        self.network.add_host("broker.sim", "10.0.0.1")
+        self.wifi.on_lost.append(self.network.abort_all)
+        self.broker = Broker(self.clock, self.network)
+        # Pin number: current value and (time_ms, value) history of the output pins
+        self.pins = {}
+        self.pin_edges = {}
+        self.buses = {}
+        self.resets = 0
+        self.boots = 0
+        self.polls = 0
+
+    # Scheduling the scenario
+
+    def at(self, seconds: float, callback, *args) -> None:
+        """ Runs callback at the given virtual time """
+        self.clock.call_at(int(seconds * 1000000), callback, *args)
+
+    def every(self, period_s: float, callback, *args, start_s=None) -> None:
+        """ Runs callback periodically, first at start_s (default: one period in) """
+        period_us = int(period_s * 1000000)
+
+        def tick():
+            callback(*args)
+            self.clock.call_later(period_us, tick)
+        self.clock.call_at(period_us if start_s is None else int(start_s * 1000000), tick)
+
+    def wifi_outage(self, start_s: float, duration_s: float) -> None:
+        self.at(start_s, self.wifi.set_ap_up, False)
+        self.at(start_s + duration_s, self.wifi.set_ap_up, True)
+
+    def broker_outage(self, start_s: float, duration_s: float) -> None:
+        self.at(start_s, self.broker.set_up, False)
+        self.at(start_s + duration_s, self.broker.set_up, True)
+
+    def broker_stall(self, start_s: float, duration_s: float) -> None:
+        """ The broker keeps the connections but doesn't answer for a while """
+        self.at(start_s, self.broker.set_responsive, False)
+        self.at(start_s + duration_s, self.broker.set_responsive, True)
+
+    # Hardware
+
+    def set_pin(self, pin: int, value: int) -> None:
+        if self.pins.get(pin) != value:
+            self.pins[pin] = value
+            self.pin_edges.setdefault(pin, []).append((self.clock.time_ms(), value))
+
+    def bus(self, pin: int) -> OneWireBus:
+        bus = self.buses.get(pin)
+        if bus is None:
+            bus = OneWireBus()
+            self.buses[pin] = bus
+        return bus
+
+    def add_sensor(self, pin: int, temperature=None, rom=None) -> Sensor:
+        """
+        Adds a DS18B20 to the bus of the pin
+        :param temperature: function of the virtual time in seconds, default is a daily cycle around 21C
+        """
+        if rom is None:
+            rom = bytes([0x28] + [self.random.randrange(256) for _ in range(6)])
+            rom += bytes([crc8(rom)])
+        if temperature is None:
+            phase = self.random.random() * 2 * math.pi
+            temperature = lambda t: 21.0 + 1.5 * math.sin(2 * math.pi * t / 86400 + phase)
+        sensor = Sensor(rom, temperature)
+        self.bus(pin).sensors[rom] = sensor
+        return sensor
+
+
+def crc8(data) -> int:
+    """ Dallas/Maxim 1-wire CRC """
+    crc = 0
+    for byte in data:
+        for _ in range(8):
+            mix = (crc ^ byte) & 1
+            crc >>= 1
+            if mix:
+                crc ^= 0x8C
+            byte >>= 1
+    return crc
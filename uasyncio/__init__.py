@@ -17,50 +17,80 @@ def set_debug(val):
 
 class PollEventLoop(EventLoop):
 
-    def __init__(self, runq_len=16, waitq_len=16):
-        EventLoop.__init__(self, runq_len, waitq_len)
+    def __init__(self, runq_len=16, waitq_len=16, max_len=0, overflow=OVERFLOW_GROW):
+        EventLoop.__init__(self, runq_len, waitq_len, max_len, overflow)
         self.poller = select.poll()
+        # id(sock): [reader, writer], the callback or task waiting for each direction or None,
+        # so one task can wait for a socket to be readable while another waits to write to it
         self.objmap = {}
 
+    def _arm(self, sock, entry):
+        mask = 0
+        if entry[0] is not None:
+            mask |= select.POLLIN
+        if entry[1] is not None:
+            mask |= select.POLLOUT
+        # Registering again modifies the event mask
+        self.poller.register(sock, mask)
+
+    def _add(self, sock, i, cb, args):
+        entry = self.objmap.get(id(sock))
+        if entry is None:
+            entry = self.objmap[id(sock)] = [None, None]
+        entry[i] = (cb, args) if args else cb
+        self._arm(sock, entry)
+
+    def _remove(self, sock, i):
+        entry = self.objmap.get(id(sock))
+        if entry is None:
+            return
+        entry[i] = None
+        if entry[1 - i] is not None:
+            self._arm(sock, entry)
+            return
+        del self.objmap[id(sock)]
+        try:
+            self.poller.unregister(sock)
+        except OSError as e:
+            # StreamWriter.awrite() first tries to write to a socket,
+            # and if that succeeds, yield IOWrite may never be called
+            # for that socket, and it will never be added to poller. So,
+            # ignore such error.
+            if e.args[0] != uerrno.ENOENT:
+                raise
+
     def add_reader(self, sock, cb, *args):
         if DEBUG and __debug__:
             log.debug("add_reader%s", (sock, cb, args))
-        if args:
-            self.poller.register(sock, select.POLLIN)
-            self.objmap[id(sock)] = (cb, args)
-        else:
-            self.poller.register(sock, select.POLLIN)
-            self.objmap[id(sock)] = cb
+        self._add(sock, 0, cb, args)
 
     def remove_reader(self, sock):
         if DEBUG and __debug__:
             log.debug("remove_reader(%s)", sock)
-        self.poller.unregister(sock)
-        del self.objmap[id(sock)]
+        self._remove(sock, 0)
 
     def add_writer(self, sock, cb, *args):
         if DEBUG and __debug__:
             log.debug("add_writer%s", (sock, cb, args))
-        if args:
-            self.poller.register(sock, select.POLLOUT)
-            self.objmap[id(sock)] = (cb, args)
-        else:
-            self.poller.register(sock, select.POLLOUT)
-            self.objmap[id(sock)] = cb
+        self._add(sock, 1, cb, args)
 
     def remove_writer(self, sock):
         if DEBUG and __debug__:
             log.debug("remove_writer(%s)", sock)
-        try:
-            self.poller.unregister(sock)
-            self.objmap.pop(id(sock), None)
-        except OSError as e:
-            # StreamWriter.awrite() first tries to write to a socket,
-            # and if that succeeds, yield IOWrite may never be called
-            # for that socket, and it will never be added to poller. So,
-            # ignore such error.
-            if e.args[0] != uerrno.ENOENT:
-                raise
+        self._remove(sock, 1)
+
+    def _call(self, cb):
+        if cb is None:
+            return
+        if DEBUG and __debug__:
+            log.debug("Calling IO callback: %r", cb)
+        if isinstance(cb, tuple):
+            cb[0](*cb[1])
+        elif isinstance(cb, Task):
+            # A task cancelled while waiting for IO is already rescheduled
+            self.wake(cb)
+        else:
+            cb()
 
     def wait(self, delay):
         if DEBUG and __debug__:
@@ -72,89 +102,225 @@ class PollEventLoop(EventLoop):
         # https://github.com/micropython/micropython/issues/2716 fixed.
         if res:
             for sock, ev in res:
-                cb = self.objmap[id(sock)]
+                entry = self.objmap.get(id(sock))
+                if entry is None:
+                    continue
+                reader, writer = entry
                 if ev & (select.POLLHUP | select.POLLERR):
                     # These events are returned even if not requested, and
                     # are sticky, i.e. will be returned again and again.
                     # If the caller doesn't do proper error handling and
                     # unregister this sock, we'll busy-loop on it, so we
                     # as well can unregister it now "just in case".
-                    self.remove_reader(sock)
-                if DEBUG and __debug__:
-                    log.debug("Calling IO callback: %r", cb)
-                if isinstance(cb, tuple):
-                    cb[0](*cb[1])
+                    # Both directions are woken to see the error.
+                    self._remove(sock, 0)
+                    self._remove(sock, 1)
                 else:
-                    cb.pend_throw(None)
-                    self.call_soon(cb)
+                    if not ev & select.POLLIN:
+                        reader = None
+                    if not ev & select.POLLOUT:
+                        writer = None
+                    entry[0] = entry[0] if reader is None else None
+                    entry[1] = entry[1] if writer is None else None
+                    # One-shot polling disarmed the socket, arm it again for the direction still waited for
+                    if entry[0] is not None or entry[1] is not None:
+                        self._arm(sock, entry)
+                self._call(reader)
+                self._call(writer)
+
+
+# Finds a byte in buf[start:end] without allocating, bytearray has no find() on MicroPython
+if hasattr(bytearray, "find"):
+    def _find(buf, byte, start, end):
+        return buf.find(byte, start, end)
+else:
+    def _find(buf, byte, start, end):
+        for i in range(start, end):
+            if buf[i] == byte:
+                return i
+        return -1
 
 
 class StreamReader:
 
-    def __init__(self, polls, ios=None):
+    def __init__(self, polls, ios=None, bufsize=512):
+        """
+        Buffered reader of a stream, usually a socket
+
+        Data is read with readinto() into a buffer preallocated at construction, so reading many small
+        items (lines, frame headers) costs one read of the stream per buffer full instead of one per item.
+        The buffer only grows for a line longer than it. Reads into a caller's buffer bigger than ours bypass it.
+        :param polls: the object polled for readability
+        :param ios: the object read from if it differs, eg. an SSL wrapper of the polled socket.
+        Its readinto() may return None when no application data is available yet.
+        """
         if ios is None:
             ios = polls
         self.polls = polls
         self.ios = ios
-
-    def read(self, n=-1):
-        while True:
+        self.buf = bytearray(bufsize)
+        self.mv = memoryview(self.buf)
+        # Unread data is buf[start:end]
+        self.start = 0
+        self.end = 0
+        self.eof = False
+        # Registered with the poller, the stream is only polled when a read finds no data
+        self.polling = False
+
+    def buffered(self) -> int:
+        return self.end - self.start
+
+    def _readinto(self, mv):
+        # Reads into mv, waiting for the stream only if it has nothing for us. Returns 0 at the end of the stream
+        if self.eof:
+            return 0
+        n = self.ios.readinto(mv)
+        while n is None:
+            # Also the case of stream wrappers (ssl, websockets, etc.) without application data yet
+            self.polling = True
             yield IORead(self.polls)
-            res = self.ios.read_percent(n)
-            if res is not None:
+            n = self.ios.readinto(mv)
+        if not n:
+            self.eof = True
+            if self.polling:
+                self.polling = False
+                yield IOReadDone(self.polls)
+        return n
+
+    def _fill(self):
+        # Reads more data after the buffered data, returns the number of bytes read, 0 at the end of the stream
+        if self.start == self.end:
+            self.start = self.end = 0
+        elif self.end == len(self.buf):
+            if self.start:
+                # Move the unread data to the front
+                n = self.end - self.start
+                self.buf[:n] = self.mv[self.start:self.end]
+                self.start = 0
+                self.end = n
+            else:
+                buf = bytearray(2 * len(self.buf))
+                buf[:self.end] = self.mv
+                self.buf = buf
+                self.mv = memoryview(buf)
+        n = yield from self._readinto(self.mv[self.end:])
+        self.end += n
+        return n
+
+    def _take(self, n):
+        # Returns n bytes from the buffer as bytes
+        start = self.start
+        self.start = start + n
+        return bytes(self.mv[start:start + n])
+
+    @coroutine
+    def read(self, n=-1):
+        """ Returns up to n bytes (n < 0: whatever is available) as soon as some data is available """
+        if self.start == self.end:
+            yield from self._fill()
+        avail = self.end - self.start
+        if n < 0 or n > avail:
+            n = avail
+        return self._take(n)
+
+    @coroutine
+    def readinto(self, buf):
+        """ Reads up to len(buf) bytes into buf (eg. a memoryview), returns the number of bytes, 0 at EOF """
+        size = len(buf)
+        if self.start == self.end:
+            if size >= len(self.buf):
+                return (yield from self._readinto(buf))
+            yield from self._fill()
+        n = min(size, self.end - self.start)
+        buf[:n] = self.mv[self.start:self.start + n]
+        self.start += n
+        return n
+
+    @coroutine
+    def readexactly_into(self, buf):
+        """ Fills buf (eg. a memoryview), returns the number of bytes read, less than len(buf) only at EOF """
+        mv = buf if isinstance(buf, memoryview) else memoryview(buf)
+        size = len(mv)
+        got = 0
+        while got < size:
+            n = yield from self.readinto(mv[got:])
+            if not n:
                 break
-            # This should not happen for real sockets, but can easily
-            # happen for stream wrappers (ssl, websockets, etc.)
-            #log.warn("Empty read")
-        if not res:
-            yield IOReadDone(self.polls)
-        return res
+            got += n
+        return got
 
+    @coroutine
     def readexactly(self, n):
-        buf = b""
-        while n:
-            yield IORead(self.polls)
-            res = self.ios.read_percent(n)
-            assert res is not None
-            if not res:
-                yield IOReadDone(self.polls)
-                break
-            buf += res
-            n -= len(res)
-        return buf
+        if self.end - self.start >= n:
+            return self._take(n)
+        buf = bytearray(n)
+        n = yield from self.readexactly_into(buf)
+        return bytes(memoryview(buf)[:n]) if n < len(buf) else bytes(buf)
 
+    @coroutine
     def readline(self):
         if DEBUG and __debug__:
             log.debug("StreamReader.readline()")
-        buf = b""
+        # Bytes already scanned are not scanned again after a fill
+        scanned = self.start
         while True:
-            yield IORead(self.polls)
-            res = self.ios.readline()
-            assert res is not None
-            if not res:
-                yield IOReadDone(self.polls)
+            i = _find(self.buf, 0x0a, scanned, self.end)
+            if i >= 0:
+                line = self._take(i + 1 - self.start)
                 break
-            buf += res
-            if buf[-1] == 0x0a:
+            scanned = self.end - self.start
+            if not (yield from self._fill()):
+                line = self._take(self.end - self.start)
                 break
+            scanned += self.start
         if DEBUG and __debug__:
-            log.debug("StreamReader.readline(): %s", buf)
-        return buf
+            log.debug("StreamReader.readline(): %s", line)
+        return line
 
+    @coroutine
     def aclose(self):
-        yield IOReadDone(self.polls)
+        if self.polling:
+            self.polling = False
+            yield IOReadDone(self.polls)
         self.ios.close()
 
     def __repr__(self):
         return "<StreamReader %r %r>" % (self.polls, self.ios)
 
 
+class _Written:
+    # Shared awaitable of writes that completed right away, see StreamWriter.awritev()
+    # Awaiting it iterates an exhausted iterator, which ends without raising and allocating a StopIteration
+
+    def __iter__(self):
+        return _exhausted
+
+    __await__ = __iter__
+
+
+_exhausted = iter(())
+_written = _Written()
+
+
 class StreamWriter:
 
-    def __init__(self, s, extra):
+    def __init__(self, s, extra, bufsize=256):
+        """
+        Writer of a stream, usually a socket
+        :param bufsize: size of the scratch buffer awritev() gathers small pieces in,
+        allocated on the first awritev() so writers that don't use it don't pay for it
+        """
         self.s = s
         self.extra = extra
-
+        self.bufsize = bufsize
+        self.scratch = None
+        self.scratch_mv = None
+        # Rest of a partial write of awritev()
+        self.pending_buf = None
+        self.pending_off = 0
+        self.pending_sz = 0
+
+    @coroutine
     def awrite(self, buf, off=0, sz=-1):
         # This method is called awrite (async write) to not proliferate
         # incompatibility with original asyncio. Unlike original asyncio
@@ -184,11 +350,92 @@ class StreamWriter:
             if DEBUG and __debug__:
                 log.debug("StreamWriter.awrite(): can write more")
 
+    def awritev(self, bufs):
+        """
+        Writes a sequence of buffers, eg. the header, topic and payload of a protocol frame, in as few writes
+        as possible without concatenating them. Returns the awaitable of the writes.
+        Pieces are gathered in the scratch buffer, a piece bigger than half of it is written directly
+        from the caller's buffer. The writes start right away and if the stream takes them all, a shared
+        completed awaitable is returned and nothing is allocated. Otherwise the returned coroutine resumes
+        the partial write from its offset, without copying, and goes on with the next piece, in the same
+        coroutine for the rest of the frame.
+        Not to be used by concurrent tasks on the same writer, the scratch buffer is shared.
+        :param bufs: a tuple or list of bytes-like objects
+        """
+        if self.scratch is None:
+            self.scratch = bytearray(self.bufsize)
+            self.scratch_mv = memoryview(self.scratch)
+        i = self._writev_from(bufs, 0)
+        if i < 0:
+            return _written
+        return self._resume_writev(bufs, i)
+
+    def _writev_from(self, bufs, i):
+        # Writes bufs from index i on as far as the stream takes them. Returns -1 once everything is
+        # written, otherwise the index of the next piece, the rest of the partial write is left in
+        # pending_buf, pending_off and pending_sz.
+        scratch = self.scratch
+        # Copied through a memoryview, a slice store of the bytearray may copy the piece first
+        mv = self.scratch_mv
+        size = len(scratch)
+        used = 0
+        n_bufs = len(bufs)
+        while i < n_bufs:
+            buf = bufs[i]
+            n = len(buf)
+            if used + n <= size:
+                mv[used:used + n] = buf
+                used += n
+                i += 1
+                continue
+            if used:
+                res = self.s.write(scratch, 0, used)
+                if res != used:
+                    return self._pending(scratch, res, used, i)
+                used = 0
+            i += 1
+            if n > size >> 1:
+                res = self.s.write(buf, 0, n)
+                if res != n:
+                    return self._pending(buf, res, n, i)
+            else:
+                mv[:n] = buf
+                used = n
+        if used:
+            res = self.s.write(scratch, 0, used)
+            if res != used:
+                return self._pending(scratch, res, used, i)
+        return -1
+
+    def _pending(self, buf, res, sz, i):
+        # res is None if the write took nothing
+        res = res or 0
+        self.pending_buf = buf
+        self.pending_off = res
+        self.pending_sz = sz - res
+        return i
+
+    @coroutine
+    def _resume_writev(self, bufs, i):
+        while i >= 0:
+            buf = self.pending_buf
+            off = self.pending_off
+            sz = self.pending_sz
+            self.pending_buf = None
+            while sz:
+                yield IOWrite(self.s)
+                res = self.s.write(buf, off, sz)
+                if res:
+                    off += res
+                    sz -= res
+            i = self._writev_from(bufs, i)
+
     # Write piecewise content from iterable (usually, a generator)
+    @coroutine
     def awriteiter(self, iterable):
-        for buf in iterable:
-            yield from self.awrite(buf)
+        yield from self.awritev([buf.encode() if isinstance(buf, str) else buf for buf in iterable])
 
+    @coroutine
     def aclose(self):
         yield IOWriteDone(self.s)
         self.s.close()
@@ -200,11 +447,16 @@ class StreamWriter:
         return "<StreamWriter %r>" % self.s
 
 
-def open_connection(host, port, ssl=False):
+@coroutine
+def open_connection(host, port, ssl=False, addr=None):
+    # addr: address of host already resolved, eg. cached, to skip the blocking getaddrinfo()
     if DEBUG and __debug__:
         log.debug("open_connection(%s, %s)", host, port)
-    ai = _socket.getaddrinfo(host, port, 0, _socket.SOCK_STREAM)
-    ai = ai[0]
+    if addr is None:
+        ai = _socket.getaddrinfo(host, port, 0, _socket.SOCK_STREAM)
+        ai = ai[0]
+    else:
+        ai = (_socket.AF_INET, _socket.SOCK_STREAM, 0, "", addr)
     s = _socket.socket(ai[0], ai[1], ai[2])
     s.setblocking(False)
     try:
@@ -214,21 +466,34 @@ def open_connection(host, port, ssl=False):
             raise
     if DEBUG and __debug__:
         log.debug("open_connection: After connect")
-    yield IOWrite(s)
+    try:
+        yield IOWrite(s)
+    except:
+        # Cancelled or timed out while connecting
+        get_event_loop().remove_writer(s)
+        s.close()
+        raise
 #    if __debug__:
 #        assert s2.fileno() == s.fileno()
     if DEBUG and __debug__:
         log.debug("open_connection: After iowait: %s", s)
     if ssl:
-        print("Warning: uasyncio SSL support is alpha")
         import ussl
-        s.setblocking(True)
-        s2 = ussl.wrap_socket(s)
-        s.setblocking(False)
-        return StreamReader(s, s2), StreamWriter(s2, {})
+        try:
+            # The handshake advances in the reads and writes of the streams instead of blocking
+            # for its round trips, the SSL socket is polled as it knows what the handshake waits for
+            s2 = ussl.wrap_socket(s, server_hostname=host, do_handshake=False)
+            return StreamReader(s2), StreamWriter(s2, {})
+        except TypeError:
+            # Ports without non-blocking handshakes
+            s.setblocking(True)
+            s2 = ussl.wrap_socket(s)
+            s.setblocking(False)
+            return StreamReader(s, s2), StreamWriter(s2, {})
     return StreamReader(s), StreamWriter(s, {})
 
 
+@coroutine
 def start_server(client_coro, host, port, backlog=10):
     if DEBUG and __debug__:
         log.debug("start_server(%s, %s)", host, port)
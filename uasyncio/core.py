@@ -1,10 +1,27 @@
 import utime as time
-import utimeq
 import ucollections
+from uasyncio.timerq import TimerQueue
 
 
 type_gen = type((lambda: (yield))())
 
+
+async def _coro():
+    pass
+
+# Native coroutines are generators on MicroPython, a type of their own on CPython
+_c = _coro()
+type_coro = type(_c)
+_c.close()
+type_coros = (type_gen, type_coro)
+
+try:
+    # Lets generator based awaitables be awaited from async def when running on CPython (eg. in the simulator)
+    from types import coroutine
+except ImportError:
+    def coroutine(f):
+        return f
+
 DEBUG = 0
 log = None
 
@@ -24,43 +41,305 @@ class TimeoutError(CancelledError):
     pass
 
 
+class InvalidStateError(Exception):
+    pass
+
+
+# Overflow policies of the runq and waitq, see EventLoop
+OVERFLOW_GROW = 0
+OVERFLOW_SHED = 1
+
+
+class Task:
+    """
+    A top-level coroutine scheduled in the event loop
+
+    Returned by EventLoop.create_task(). The task can be cancelled, inspected and joined
+    by awaiting it, which returns the result of the coroutine or raises its exception.
+    Slots only, so a task costs a fixed few words of heap.
+    """
+    __slots__ = ("coro", "data", "value", "waiting")
+
+    def __init__(self, coro):
+        # The coroutine, set to None when the task is done
+        self.coro = coro
+        # Pending value of the task while it runs: None if nothing is pending,
+        # False if parked (on IO or a waiter list) and an exception instance
+        # to be thrown into the coroutine on its next resumption.
+        # Holds the exception of a finished task that raised.
+        self.data = None
+        # Return value of the finished coroutine
+        self.value = None
+        # Tasks waiting to join this one, allocated on the first join
+        self.waiting = None
+
+    def done(self) -> bool:
+        return self.coro is None
+
+    def result(self):
+        """ Returns the result of the finished task or raises its exception """
+        if self.coro is not None:
+            raise InvalidStateError()
+        if self.data is not None:
+            raise self.data
+        return self.value
+
+    def cancel(self) -> bool:
+        """
+        Cancels the task by throwing CancelledError into it. A parked task is rescheduled
+        immediately, a sleeping task receives the exception when its sleep ends.
+        Returns False if the task has already finished.
+        """
+        if self.coro is None:
+            return False
+        self.throw(CancelledError())
+        return True
+
+    def throw(self, exc) -> None:
+        prev = self.data
+        self.data = exc
+        if prev is False:
+            _event_loop.call_soon(self)
+
+    def __iter__(self):
+        # Joins the task: yield from task / await task
+        if self.coro is not None:
+            cur_task = _event_loop.cur_task
+            if self.waiting is None:
+                self.waiting = []
+            self.waiting.append(cur_task)
+            try:
+                yield False
+            except:
+                if cur_task in self.waiting:
+                    self.waiting.remove(cur_task)
+                raise
+        return self.result()
+
+    __await__ = __iter__
+
+    def __repr__(self):
+        return "<Task %r>" % self.coro
+
+
+class Periodic:
+
+    def __init__(self, loop, period_ms, callback, args=()):
+        """
+        Periodic timer, see EventLoop.call_every()
+
+        Runs are scheduled against absolute deadlines, so the period doesn't drift by the time the work takes.
+        Ticks missed while the loop was blocked are coalesced into a single run and counted in missed.
+        If the callback returns a coroutine it is run as a task, and ticks due while it is still running
+        are coalesced into it as well.
+        """
+        self.loop = loop
+        self.period_ms = period_ms
+        self.callback = callback
+        self.args = args
+        self.deadline = None
+        self.handle = None
+        self.task = None
+        self.active = False
+        self.runs = 0
+        self.missed = 0
+
+    def start_at(self, deadline):
+        """ Schedules the first run at the given ticks_ms deadline """
+        self.deadline = deadline
+        self.active = True
+        self.handle = self.loop.call_at_(deadline, self)
+        return self
+
+    def cancel(self):
+        self.active = False
+        self.loop.cancel_timer(self.handle)
+        self.handle = None
+
+    def __call__(self):
+        if not self.active:
+            return
+        late = time.ticks_diff(self.loop.time(), self.deadline)
+        if late >= self.period_ms:
+            skipped = late // self.period_ms
+            self.missed += skipped
+            self.deadline = time.ticks_add(self.deadline, skipped * self.period_ms)
+        self.deadline = time.ticks_add(self.deadline, self.period_ms)
+        self.handle = self.loop.call_at_(self.deadline, self)
+        if self.task is not None:
+            if not self.task.done():
+                self.missed += 1
+                return
+            self.task = None
+        self.runs += 1
+        ret = self.callback(*self.args)
+        if isinstance(ret, type_coros):
+            self.task = self.loop.create_task(ret)
+
+    def __repr__(self):
+        return "<Periodic %dms %r>" % (self.period_ms, self.callback)
+
+
 class EventLoop:
 
-    def __init__(self, runq_len=16, waitq_len=16):
+    def __init__(self, runq_len=16, waitq_len=16, max_len=0, overflow=OVERFLOW_GROW):
+        # The runq and waitq are preallocated with the given lengths. When one
+        # is full it is reallocated with double the length, up to max_len
+        # entries (0 keeps the initial lengths), beyond that IndexError is raised.
+        # With OVERFLOW_SHED new tasks created as sheddable (low priority) are
+        # dropped instead of growing the runq past its initial length, all the
+        # other tasks grow it as with OVERFLOW_GROW.
         self.runq = ucollections.deque((), runq_len, True)
-        self.waitq = utimeq.utimeq(waitq_len)
+        self.waitq = TimerQueue(waitq_len)
+        self.runq_size = runq_len
+        self.runq_len = runq_len
+        self.waitq_len = waitq_len
+        self.max_len = max_len
+        self.overflow = overflow
+        # Overflow accounting
+        self.runq_hwm = 0
+        self.waitq_hwm = 0
+        self.runq_grown = 0
+        self.waitq_grown = 0
+        self.shed_tasks = 0
         # Current task being run. Task is a top-level coroutine scheduled
         # in the event loop (sub-coroutines executed transparently by
         # yield from/await, event loop "doesn't see" them).
         self.cur_task = None
+        # Registry of the live tasks, finished tasks are removed right away
+        self.tasks = set()
+        # Optional uasyncio.profiler.LoopProfiler, see enable_profiling()
+        self.profiler = None
 
     def time(self):
         return time.ticks_ms()
 
-    def create_task(self, coro):
+    def create_task(self, coro, sheddable=False):
         # CPython 3.4.2
-        self.call_later_ms(0, coro)
-        # CPython asyncio incompatibility: we don't return Task object
+        task = Task(coro)
+        if sheddable and self.overflow == OVERFLOW_SHED and len(self.runq) >= self.runq_size:
+            # Shed the new task, it is returned already cancelled. The coroutine
+            # never runs, not even its finally clauses, the caller checks done().
+            self.shed_tasks += 1
+            coro.close()
+            task.coro = None
+            task.data = CancelledError()
+            return task
+        self.tasks.add(task)
+        self.call_soon(task)
+        return task
+
+    def queue_stats(self) -> dict:
+        """ Returns the current lengths and the overflow accounting of the runq and waitq """
+        return {
+            "runqLen": self.runq_len,
+            "runqHwm": self.runq_hwm,
+            "runqGrown": self.runq_grown,
+            "waitqLen": self.waitq_len,
+            "waitqHwm": self.waitq_hwm,
+            "waitqGrown": self.waitq_grown,
+            "shedTasks": self.shed_tasks
+        }
+
+    def _grown_len(self, cur_len, name):
+        if self.max_len <= cur_len:
+            raise IndexError(name + " overflow")
+        new_len = cur_len * 2
+        if new_len > self.max_len:
+            new_len = self.max_len
+        if __debug__ and DEBUG:
+            log.warning("Growing %s to: %d", name, new_len)
+        return new_len
+
+    def _grow_runq(self):
+        self.runq_len = self._grown_len(self.runq_len, "runq")
+        runq = ucollections.deque((), self.runq_len, True)
+        while self.runq:
+            runq.append(self.runq.popleft())
+        self.runq = runq
+        self.runq_grown += 1
+
+    def _grow_waitq(self):
+        # The TimerQueue heap grows in place, only the cap is enforced here
+        self.waitq_len = self._grown_len(self.waitq_len, "waitq")
+        self.waitq_grown += 1
+
+    def all_tasks(self) -> list:
+        return list(self.tasks)
+
+    def task_count(self) -> int:
+        return len(self.tasks)
+
+    def find_task(self, coro):
+        """ Returns the live task running the given coroutine or None """
+        for task in self.tasks:
+            if task.coro is coro:
+                return task
+        return None
+
+    def enable_profiling(self):
+        """ Starts timing every coroutine slice, returns the LoopProfiler """
+        if self.profiler is None:
+            from uasyncio.profiler import LoopProfiler
+            self.profiler = LoopProfiler()
+        return self.profiler
+
+    def disable_profiling(self):
+        self.profiler = None
 
     def call_soon(self, callback, *args):
         if __debug__ and DEBUG:
             log.debug("Scheduling in runq: %s", (callback, args))
+        # Callbacks take two entries, tasks one
+        n = len(self.runq) + (1 if isinstance(callback, Task) else 2)
+        if n > self.runq_len:
+            self._grow_runq()
+        if n > self.runq_hwm:
+            self.runq_hwm = n
         self.runq.append(callback)
-        if not isinstance(callback, type_gen):
+        if not isinstance(callback, Task):
             self.runq.append(args)
 
+    def wake(self, task):
+        # Resume a task parked with "yield False". Returns False if it
+        # was already rescheduled (eg by cancel()), so the caller can move
+        # on to the next waiter.
+        if task.data is not False:
+            return False
+        task.data = None
+        self.call_soon(task)
+        return True
+
     def call_later(self, delay, callback, *args):
-        self.call_at_(time.ticks_add(self.time(), int(delay * 1000)), callback, args)
+        return self.call_at_(time.ticks_add(self.time(), int(delay * 1000)), callback, args)
 
     def call_later_ms(self, delay, callback, *args):
+        # Returns the TimerHandle to cancel the call with, or None if it was scheduled right away
         if not delay:
             return self.call_soon(callback, *args)
-        self.call_at_(time.ticks_add(self.time(), delay), callback, args)
+        return self.call_at_(time.ticks_add(self.time(), delay), callback, args)
+
+    def call_every(self, period_ms, callback, *args):
+        """
+        Runs the callback now and then every period_ms milliseconds on a drift-free schedule.
+        Plain callbacks are run by the loop directly, without a coroutine round trip.
+        Returns the Periodic timer that can be cancelled.
+        """
+        return Periodic(self, period_ms, callback, args).start_at(self.time())
 
-    def call_at_(self, time, callback, args=()):
+    def call_at_(self, time, callback, args=(), pooled=False):
         if __debug__ and DEBUG:
             log.debug("Scheduling in waitq: %s", (time, callback, args))
-        self.waitq.push(time, callback, args)
+        n = len(self.waitq) + 1
+        if n > self.waitq_len:
+            self._grow_waitq()
+        if n > self.waitq_hwm:
+            self.waitq_hwm = n
+        return self.waitq.push(time, callback, args, pooled)
+
+    def cancel_timer(self, handle) -> bool:
+        """ Removes a scheduled call from the waitq, returns False if it has already run or been removed """
+        return self.waitq.remove(handle)
 
     def wait(self, delay):
         # Default wait implementation, to be overriden in subclasses
@@ -69,9 +348,25 @@ class EventLoop:
             log.debug("Sleeping for: %s", delay)
         time.sleep_ms(delay)
 
+    def _finish(self, task, value, exc=None):
+        task.coro = None
+        task.value = value
+        task.data = exc
+        self.tasks.discard(task)
+        if self.profiler is not None:
+            self.profiler.forget(task)
+        if task.waiting:
+            for joiner in task.waiting:
+                self.wake(joiner)
+            task.waiting = None
+            return True
+        return False
+
     def run_forever(self):
         cur_task = [0, 0, 0]
         while True:
+            # Profiling is opt-in, when disabled it costs a None check per slice
+            prof = self.profiler
             # Expire entries in waitq and move them to runq
             tnow = self.time()
             while self.waitq:
@@ -79,9 +374,17 @@ class EventLoop:
                 delay = time.ticks_diff(t, tnow)
                 if delay > 0:
                     break
-                self.waitq.pop(cur_task)
+                handle = self.waitq.pop(cur_task)
                 if __debug__ and DEBUG:
                     log.debug("Moving from waitq to runq: %s", cur_task[1])
+                if prof is not None:
+                    if not isinstance(cur_task[1], Task):
+                        # The handle of a plain callback is queued in its place, so every timer
+                        # of a callback has its own due time
+                        prof.due(handle, t)
+                        self.call_soon(handle)
+                        continue
+                    prof.due(cur_task[1], t)
                 self.call_soon(cur_task[1], *cur_task[2])
 
             # Process runq
@@ -91,24 +394,31 @@ class EventLoop:
             while l:
                 cb = self.runq.popleft()
                 l -= 1
-                args = ()
-                if not isinstance(cb, type_gen):
+                if not isinstance(cb, Task):
                     args = self.runq.popleft()
                     l -= 1
                     if __debug__ and DEBUG:
                         log.info("Next callback to run: %s", (cb, args))
-                    cb(*args)
+                    if prof is not None:
+                        prof.call(cb, args)
+                    else:
+                        cb(*args)
                     continue
 
                 if __debug__ and DEBUG:
-                    log.info("Next coroutine to run: %s", (cb, args))
+                    log.info("Next coroutine to run: %s", cb)
                 self.cur_task = cb
                 delay = 0
                 try:
-                    if args is ():
-                        ret = next(cb)
+                    if prof is not None:
+                        ret = prof.resume(cb)
                     else:
-                        ret = cb.send(*args)
+                        exc = cb.data
+                        if exc is None:
+                            ret = cb.coro.send(None)
+                        else:
+                            cb.data = None
+                            ret = cb.coro.throw(exc)
                     if __debug__ and DEBUG:
                         log.info("Coroutine %s yield result: %s", cb, ret)
                     if isinstance(ret, SysCall1):
@@ -116,11 +426,11 @@ class EventLoop:
                         if isinstance(ret, SleepMs):
                             delay = arg
                         elif isinstance(ret, IORead):
-                            cb.pend_throw(False)
+                            cb.data = False
                             self.add_reader(arg, cb)
                             continue
                         elif isinstance(ret, IOWrite):
-                            cb.pend_throw(False)
+                            cb.data = False
                             self.add_writer(arg, cb)
                             continue
                         elif isinstance(ret, IOReadDone):
@@ -128,35 +438,48 @@ class EventLoop:
                         elif isinstance(ret, IOWriteDone):
                             self.remove_writer(arg)
                         elif isinstance(ret, StopLoop):
+                            self._finish(cb, arg)
                             return arg
                         else:
                             assert False, "Unknown syscall yielded: %r (of type %r)" % (ret, type(ret))
-                    elif isinstance(ret, type_gen):
-                        self.call_soon(ret)
+                    elif isinstance(ret, type_coros):
+                        self.create_task(ret)
+                    elif ret is False:
+                        # Don't reschedule, the task parked itself on a
+                        # waiter list and will be resumed by wake(). Mark it
+                        # so cancel() knows it has to reschedule it.
+                        # Checked before int, as bool is a subclass of it.
+                        cb.data = False
+                        continue
                     elif isinstance(ret, int):
                         # Delay
                         delay = ret
                     elif ret is None:
                         # Just reschedule
                         pass
-                    elif ret is False:
-                        # Don't reschedule
-                        continue
                     else:
                         assert False, "Unsupported coroutine yield value: %r (of type %r)" % (ret, type(ret))
                 except StopIteration as e:
                     if __debug__ and DEBUG:
                         log.debug("Coroutine finished: %s", cb)
+                    self._finish(cb, e.value)
                     continue
                 except CancelledError as e:
                     if __debug__ and DEBUG:
                         log.debug("Coroutine cancelled: %s", cb)
+                    self._finish(cb, None, e)
+                    continue
+                except Exception as e:
+                    # Exceptions nobody is waiting for stop the loop as before
+                    if not self._finish(cb, None, e):
+                        raise
                     continue
                 # Currently all syscalls don't return anything, so we don't
                 # need to feed anything to the next invocation of coroutine.
                 # If that changes, need to pass that value below.
                 if delay:
-                    self.call_later_ms(delay, cb)
+                    # Nobody else refers to the timer of a sleeping task, its handle is recycled
+                    self.call_at_(time.ticks_add(self.time(), delay), cb, (), True)
                 else:
                     self.call_soon(cb)
 
@@ -173,14 +496,15 @@ class EventLoop:
             self.wait(delay)
 
     def run_until_complete(self, coro):
+        @coroutine
         def _run_and_stop():
-            yield from coro
-            yield StopLoop(0)
-        self.call_soon(_run_and_stop())
-        self.run_forever()
+            ret = yield from coro
+            yield StopLoop(ret)
+        self.create_task(_run_and_stop())
+        return self.run_forever()
 
     def stop(self):
-        self.call_soon((lambda: (yield StopLoop(0)))())
+        self.create_task((lambda: (yield StopLoop(0)))())
 
     def close(self):
         pass
@@ -218,12 +542,13 @@ class IOWriteDone(SysCall1):
 
 _event_loop = None
 _event_loop_class = EventLoop
-def get_event_loop(runq_len=16, waitq_len=16):
+def get_event_loop(runq_len=16, waitq_len=16, max_len=0, overflow=OVERFLOW_GROW):
     global _event_loop
     if _event_loop is None:
-        _event_loop = _event_loop_class(runq_len, waitq_len)
+        _event_loop = _event_loop_class(runq_len, waitq_len, max_len, overflow)
     return _event_loop
 
+@coroutine
 def sleep(secs):
     yield int(secs * 1000)
 
@@ -243,6 +568,8 @@ class SleepMs(SysCall1):
         #print("__iter__")
         return self
 
+    __await__ = __iter__
+
     def __next__(self):
         if self.v is not None:
             #print("__next__ syscall enter")
@@ -258,45 +585,76 @@ sleep_ms = SleepMs()
 
 
 def cancel(coro):
-    prev = coro.pend_throw(CancelledError())
-    if prev is False:
-        _event_loop.call_soon(coro)
+    """ Cancels a task, given either the Task or the coroutine it runs """
+    task = coro
+    if not isinstance(task, Task):
+        task = _event_loop.find_task(coro)
+        if task is None:
+            return False
+    return task.cancel()
+
+
+def _timeout_func(token):
+    # token is a [task] list, emptied once the guarded block is done. The
+    # timer may already be in the runq by then, past cancel_timer(), eg if
+    # the block finished in the same tick the timeout expired.
+    task = token[0]
+    if task is None:
+        return
+    if __debug__ and DEBUG:
+        log.debug("timeout_func: cancelling %s", task)
+    task.throw(TimeoutError())
+
+
+@coroutine
+def wait_for_ms(coro, timeout):
+    # The timeout timer is removed from the waitq as soon as coro is done
+    token = [_event_loop.cur_task]
+    handle = _event_loop.call_later_ms(timeout, _timeout_func, token)
+    try:
+        return (yield from coro)
+    finally:
+        if __debug__ and DEBUG:
+            log.debug("wait_for_ms: cancelling %s", handle)
+        token[0] = None
+        _event_loop.cancel_timer(handle)
 
 
-class TimeoutObj:
-    def __init__(self, coro):
-        self.coro = coro
+def wait_for(coro, timeout):
+    return wait_for_ms(coro, int(timeout * 1000))
 
 
-def wait_for_ms(coro, timeout):
+class timeout_ms:
 
-    def waiter(coro, timeout_obj):
-        res = yield from coro
-        if __debug__ and DEBUG:
-            log.debug("waiter: cancelling %s", timeout_obj)
-        timeout_obj.coro = None
-        return res
+    def __init__(self, timeout):
+        """
+        Async context manager raising TimeoutError in the block if it takes longer than timeout milliseconds
 
-    def timeout_func(timeout_obj):
-        if timeout_obj.coro:
-            if __debug__ and DEBUG:
-                log.debug("timeout_func: cancelling %s", timeout_obj.coro)
-            prev = timeout_obj.coro.pend_throw(TimeoutError())
-            #print("prev pend", prev)
-            if prev is False:
-                _event_loop.call_soon(timeout_obj.coro)
+        Usage::
 
-    timeout_obj = TimeoutObj(_event_loop.cur_task)
-    _event_loop.call_later_ms(timeout, timeout_func, timeout_obj)
-    return (yield from waiter(coro, timeout_obj))
+            async with timeout_ms(500):
+                await reader.readline()
+        """
+        self.timeout = timeout
+        self.handle = None
+        self.token = None
 
+    async def __aenter__(self):
+        self.token = [_event_loop.cur_task]
+        self.handle = _event_loop.call_later_ms(self.timeout, _timeout_func, self.token)
+        return self
 
-def wait_for(coro, timeout):
-    return wait_for_ms(coro, int(timeout * 1000))
+    async def __aexit__(self, exc_type, exc, tb):
+        self.token[0] = None
+        _event_loop.cancel_timer(self.handle)
+        self.handle = None
+        self.token = None
+        return False
 
 
-def coroutine(f):
-    return f
+def timeout(secs):
+    return timeout_ms(int(secs * 1000))
+
 
 #
 # The functions below are deprecated in uasyncio, and provided only
@@ -304,12 +662,4 @@ def coroutine(f):
 #
 
 def ensure_future(coro, loop=_event_loop):
-    _event_loop.call_soon(coro)
-    # CPython asyncio incompatibility: we don't return Task object
-    return coro
-
-
-# CPython asyncio incompatibility: Task is a function, not a class (for efficiency)
-def Task(coro, loop=_event_loop):
-    # Same as async()
-    _event_loop.call_soon(coro)
+    return _event_loop.create_task(coro)
@@ -1,37 +1,108 @@
 class deque:
+    """
+    Circular buffer deque with O(1) operations at both ends
 
-    def __init__(self, iterable=None):
-        if iterable is None:
-            self.q = []
-        else:
-            self.q = list(iterable)
+    The buffer is preallocated with capacity items at construction. By default it doubles on demand
+    until max_capacity items (0 means no cap), so deque() is unbounded like the list-backed one was.
+    With grow=False it is never reallocated, appending to a full deque raises IndexError like
+    ucollections.deque does.
+    """
+
+    def __init__(self, iterable=None, capacity=16, grow=True, max_capacity=0):
+        if iterable is not None:
+            iterable = list(iterable)
+            if len(iterable) > capacity:
+                capacity = len(iterable)
+        if capacity < 1:
+            capacity = 1
+        self.grow = grow
+        self.max_capacity = max_capacity
+        self.q = [None] * capacity
+        self.head = 0
+        self.size = 0
+        if iterable:
+            self.extend(iterable)
+
+    def capacity(self) -> int:
+        return len(self.q)
+
+    def _grow(self):
+        capacity = len(self.q)
+        if not self.grow or (self.max_capacity and capacity >= self.max_capacity):
+            raise IndexError("deque full")
+        new_capacity = capacity * 2
+        if self.max_capacity and new_capacity > self.max_capacity:
+            new_capacity = self.max_capacity
+        # Unroll the buffer so the head is at index 0
+        self.q = self.q[self.head:] + self.q[:self.head] + [None] * (new_capacity - capacity)
+        self.head = 0
 
     def popleft(self):
-        return self.q.pop(0)
+        if not self.size:
+            raise IndexError("pop from an empty deque")
+        q = self.q
+        a = q[self.head]
+        q[self.head] = None
+        self.head += 1
+        if self.head == len(q):
+            self.head = 0
+        self.size -= 1
+        return a
 
     def popright(self):
-        return self.q.pop()
+        if not self.size:
+            raise IndexError("pop from an empty deque")
+        self.size -= 1
+        q = self.q
+        i = (self.head + self.size) % len(q)
+        a = q[i]
+        q[i] = None
+        return a
 
     def pop(self):
-        return self.q.pop()
+        return self.popright()
 
     def append(self, a):
-        self.q.append(a)
+        if self.size == len(self.q):
+            self._grow()
+        q = self.q
+        i = self.head + self.size
+        if i >= len(q):
+            i -= len(q)
+        q[i] = a
+        self.size += 1
 
     def appendleft(self, a):
-        self.q.insert(0, a)
+        if self.size == len(self.q):
+            self._grow()
+        self.head -= 1
+        if self.head < 0:
+            self.head = len(self.q) - 1
+        self.q[self.head] = a
+        self.size += 1
 
     def extend(self, a):
-        self.q.extend(a)
+        for item in a:
+            self.append(item)
+
+    def clear(self):
+        q = self.q
+        for i in range(len(q)):
+            q[i] = None
+        self.head = 0
+        self.size = 0
 
     def __len__(self):
-        return len(self.q)
+        return self.size
 
     def __bool__(self):
-        return bool(self.q)
+        return self.size > 0
 
     def __iter__(self):
-        yield from self.q
+        q = self.q
+        capacity = len(q)
+        for i in range(self.size):
+            yield q[(self.head + i) % capacity]
 
     def __str__(self):
-        return 'deque({})'.format(self.q)
+        return 'deque({})'.format(list(self))
@@ -0,0 +1,157 @@
+import utime as time
+from uasyncio.core import Periodic
+from uasyncio.timerq import TimerHandle
+
+# Indexes of the per coroutine statistics records
+SLICES = 0
+TOTAL_US = 1
+MAX_US = 2
+LAG_COUNT = 3
+LAG_TOTAL_MS = 4
+LAG_MAX_MS = 5
+
+
+def task_name(task) -> str:
+    """ Returns the function name of the coroutine run by the task """
+    coro = task.coro
+    name = getattr(coro, "__name__", None)
+    if name is None:
+        # MicroPython: <generator object 'name' at 3ffe5e70>
+        name = repr(coro).split()[2].strip("'")
+    return name
+
+
+def callback_name(callback) -> str:
+    """ Returns the name of a plain callback, periodic timers are named after their callback """
+    prefix = ""
+    if isinstance(callback, Periodic):
+        prefix = "every {}ms: ".format(callback.period_ms)
+        callback = callback.callback
+    return prefix + getattr(callback, "__name__", repr(callback))
+
+
+def _record_slice(record, start_us) -> None:
+    elapsed = time.ticks_diff(time.ticks_us(), start_us)
+    record[SLICES] += 1
+    record[TOTAL_US] += elapsed
+    if elapsed > record[MAX_US]:
+        record[MAX_US] = elapsed
+
+
+class LoopProfiler:
+
+    def __init__(self) -> None:
+        """
+        Event loop profiler for uasyncio.core.EventLoop
+
+        Enabled with EventLoop.enable_profiling(), it times every slice of the top-level coroutines.
+        Statistics are aggregated by coroutine name, so short lived tasks of the same coroutine share a record.
+        Plain callbacks run by the loop, like periodic timers, are recorded by their name as well:
+        - number of resumptions (slices)
+        - total and maximum time spent in a slice, the maximum shows how long the loop was blocked
+        - scheduling lag between the due time of a timer wakeup and the actual resumption
+        """
+        self.stats = {}
+        self.started_ms = time.ticks_ms()
+        self._records = {}
+        # Due times of the tasks and of the timer handles of the plain callbacks in the runq
+        self._due = {}
+
+    def _named_record(self, name: str) -> list:
+        record = self.stats.get(name)
+        if record is None:
+            record = [0, 0, 0, 0, 0, 0]
+            self.stats[name] = record
+        return record
+
+    def _record(self, task) -> list:
+        record = self._records.get(task)
+        if record is None:
+            record = self._named_record(task_name(task))
+            self._records[task] = record
+        return record
+
+    def due(self, entry, due_ms: int) -> None:
+        """
+        Called by the event loop when a timer is moved from the waitq to the runq
+        :param entry: the task, or the TimerHandle of a plain callback, the handle of a task is recycled
+        """
+        self._due[entry] = due_ms
+
+    def _record_lag(self, record, entry) -> None:
+        due_ms = self._due.pop(entry, None)
+        if due_ms is not None:
+            lag = time.ticks_diff(time.ticks_ms(), due_ms)
+            record[LAG_COUNT] += 1
+            record[LAG_TOTAL_MS] += lag
+            if lag > record[LAG_MAX_MS]:
+                record[LAG_MAX_MS] = lag
+
+    def forget(self, task) -> None:
+        """ Called by the event loop when a task is finished """
+        self._records.pop(task, None)
+        self._due.pop(task, None)
+
+    def resume(self, task):
+        """ Resumes the task like EventLoop.run_forever() does and records the slice """
+        record = self._record(task)
+        self._record_lag(record, task)
+        start = time.ticks_us()
+        try:
+            exc = task.data
+            if exc is None:
+                return task.coro.send(None)
+            task.data = None
+            return task.coro.throw(exc)
+        finally:
+            _record_slice(record, start)
+
+    def call(self, callback, args) -> None:
+        """ Runs a plain callback like EventLoop.run_forever() does and records it """
+        if isinstance(callback, TimerHandle):
+            record = self._named_record(callback_name(callback.callback))
+            self._record_lag(record, callback)
+            callback, args = callback.callback, callback.args
+        else:
+            record = self._named_record(callback_name(callback))
+        start = time.ticks_us()
+        try:
+            callback(*args)
+        finally:
+            _record_slice(record, start)
+
+    def reset(self) -> None:
+        self.stats.clear()
+        self._records.clear()
+        self._due.clear()
+        self.started_ms = time.ticks_ms()
+
+    def snapshot(self) -> dict:
+        """
+        Returns the statistics collected since the profiler was enabled or reset
+        lags is the number of timer wakeups the lag was taken of, the other slices were not due to a timer
+        """
+        snapshot = {}
+        for name, record in self.stats.items():
+            lag_count = record[LAG_COUNT]
+            snapshot[name] = {
+                "slices": record[SLICES],
+                "totalUs": record[TOTAL_US],
+                "maxUs": record[MAX_US],
+                "lags": lag_count,
+                "lagAvgMs": record[LAG_TOTAL_MS] // lag_count if lag_count else 0,
+                "lagMaxMs": record[LAG_MAX_MS]
+            }
+        return snapshot
+
+    def dump(self) -> None:
+        """ Prints the statistics to the console, the coroutines with the longest slices first """
+        elapsed_ms = time.ticks_diff(time.ticks_ms(), self.started_ms)
+        print("Loop profiler - {} ms profiled".format(elapsed_ms))
+        print("{:<36} {:>8} {:>12} {:>10} {:>8} {:>8}".format(
+            "coroutine", "slices", "total_us", "max_us", "lag_avg", "lag_max"))
+        snapshot = self.snapshot()
+        for name in sorted(snapshot, key=lambda n: snapshot[n]["maxUs"], reverse=True):
+            stats = snapshot[name]
+            print("{:<36} {:>8} {:>12} {:>10} {:>8} {:>8}".format(
+                name, stats["slices"], stats["totalUs"], stats["maxUs"], stats["lagAvgMs"], stats["lagMaxMs"]))
@@ -1,5 +1,5 @@
 from uasyncio.deque import deque
-from uasyncio.core import sleep
+from uasyncio import core
 
 
 class QueueEmpty(Exception):
@@ -10,6 +10,10 @@ class QueueFull(Exception):
     """Exception raised by put_nowait()."""
 
 
+# Marks a parked getter that has not been handed an item yet
+_no_item = object()
+
+
 class Queue:
     """A queue, useful for coordinating producer and consumer coroutines.
 
@@ -20,16 +24,41 @@ class Queue:
     Unlike the standard library Queue, you can reliably know this Queue's size
     with qsize(), since your single-threaded uasyncio application won't be
     interrupted between calling qsize() and doing an operation on the Queue.
+
+    Blocked getters and putters are parked on waiter lists instead of polling
+    the queue, and exactly one of them is woken up when an item is added or
+    removed. Items are handed over directly to a parked waiter, so a woken
+    coroutine never finds its item taken by someone else.
     """
-    _attempt_delay = 0.1
 
     def __init__(self, maxsize=0):
         self.maxsize = maxsize
-        self._queue = deque()
+        if maxsize > 0:
+            # Preallocated, the spare slot is for an item handed back by a cancelled
+            # getter. Several getters can be cancelled with their items, so it may
+            # still grow past it.
+            self._queue = deque(capacity=maxsize + 1, grow=True)
+        else:
+            self._queue = deque(grow=True)
+        # Waiters are [coro, item] pairs, coro is set to None when cancelled
+        self._getters = deque(capacity=4, grow=True)
+        self._putters = deque(capacity=4, grow=True)
 
     def _get(self):
         return self._queue.popleft()
 
+    def _wake_next(self, waiters, item=_no_item):
+        """Wakes the first live waiter, optionally handing it an item."""
+        loop = core.get_event_loop()
+        while waiters:
+            waiter = waiters.popleft()
+            if waiter[0] is not None and loop.wake(waiter[0]):
+                if item is not _no_item:
+                    waiter[1] = item
+                return waiter
+        return None
+
+    @core.coroutine
     def get(self):
         """Returns generator, which can be used for getting (and removing)
         an item from a queue.
@@ -38,9 +67,19 @@ class Queue:
 
             item = yield from queue.get()
         """
-        while not self._queue:
-            yield from sleep(self._attempt_delay)
-        return self._get()
+        if self._queue:
+            return self.get_nowait()
+        waiter = [core.get_event_loop().cur_task, _no_item]
+        self._getters.append(waiter)
+        try:
+            yield False
+        except:
+            waiter[0] = None
+            if waiter[1] is not _no_item:
+                # Cancelled after an item was handed over, pass it on
+                self._requeue(waiter[1])
+            raise
+        return waiter[1]
 
     def get_nowait(self):
         """Remove and return an item from the queue.
@@ -49,11 +88,22 @@ class Queue:
         """
         if not self._queue:
             raise QueueEmpty()
-        return self._get()
+        item = self._get()
+        if self._putters:
+            # Move the item of the first parked putter into the freed slot
+            waiter = self._wake_next(self._putters)
+            if waiter is not None:
+                self._put(waiter[1])
+        return item
 
     def _put(self, val):
         self._queue.append(val)
 
+    def _requeue(self, val):
+        if self._wake_next(self._getters, val) is None:
+            self._queue.appendleft(val)
+
+    @core.coroutine
     def put(self, val):
         """Returns generator which can be used for putting item in a queue.
 
@@ -61,18 +111,32 @@ class Queue:
 
             yield from queue.put(item)
         """
-        while self.qsize() >= self.maxsize and self.maxsize:
-            yield from sleep(self._attempt_delay)
-        self._put(val)
+        if self._try_put(val):
+            return
+        waiter = [core.get_event_loop().cur_task, val]
+        self._putters.append(waiter)
+        try:
+            yield False
+        except:
+            waiter[0] = None
+            raise
 
     def put_nowait(self, val):
         """Put an item into the queue without blocking.
 
+        If a getter is parked the item is handed over to it directly.
         If no free slot is immediately available, raise QueueFull.
         """
-        if self.qsize() >= self.maxsize and self.maxsize:
+        if not self._try_put(val):
             raise QueueFull()
+
+    def _try_put(self, val):
+        if self._getters and self._wake_next(self._getters, val) is not None:
+            return True
+        if self.full():
+            return False
         self._put(val)
+        return True
 
     def qsize(self):
         """Number of items in the queue."""
@@ -1,28 +1,210 @@
 from uasyncio import core
+from uasyncio.deque import deque
+
+
+class WaitQueue:
+
+    def __init__(self, on_lost_wakeup=None):
+        """
+        FIFO of tasks parked on a synchronisation primitive, built on EventLoop.wake()
+
+        Parking and waking are O(1). Cancelled waiters are only marked and skipped when their turn comes,
+        the queue is compacted once more than half of it is cancelled waiters.
+        :param on_lost_wakeup: called when a woken waiter is cancelled before it could run,
+        so the primitive can pass on what was handed over to it (eg. the lock or a permit)
+        """
+        self.waiters = deque(capacity=4, grow=True)
+        self.on_lost_wakeup = on_lost_wakeup
+        self.cancelled = 0
+
+    def __len__(self):
+        return len(self.waiters)
+
+    @core.coroutine
+    def park(self):
+        # Waiters are [task, woken] pairs, task is set to None when cancelled
+        waiter = [core.get_event_loop().cur_task, False]
+        self.waiters.append(waiter)
+        try:
+            yield False
+        except:
+            waiter[0] = None
+            if waiter[1]:
+                if self.on_lost_wakeup is not None:
+                    self.on_lost_wakeup()
+            else:
+                self._cancelled()
+            raise
+
+    def _cancelled(self):
+        self.cancelled += 1
+        if self.cancelled * 2 > len(self.waiters):
+            for _ in range(len(self.waiters)):
+                waiter = self.waiters.popleft()
+                if waiter[0] is not None:
+                    self.waiters.append(waiter)
+            self.cancelled = 0
+
+    def wake_one(self) -> bool:
+        """ Wakes the longest waiting task, returns False if there was none """
+        loop = core.get_event_loop()
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if waiter[0] is None:
+                self.cancelled -= 1
+            elif loop.wake(waiter[0]):
+                waiter[1] = True
+                return True
+        return False
+
+    def wake_all(self) -> int:
+        woken = 0
+        while self.wake_one():
+            woken += 1
+        return woken
+
 
 class Lock:
 
     def __init__(self):
         self.locked = False
-        self.wlist = []
+        self.waiters = WaitQueue(self.release)
 
     def release(self):
         assert self.locked
-        self.locked = False
-        if self.wlist:
-            #print(self.wlist)
-            coro = self.wlist.pop(0)
-            core.get_event_loop().call_soon(coro)
+        # Hand the lock over to the first waiter, so a newcomer can't take it first
+        if not self.waiters.wake_one():
+            self.locked = False
 
+    @core.coroutine
     def acquire(self):
-        # As release() is not coro, assume we just released and going to acquire again
-        # so, yield first to let someone else to acquire it first
-        yield
-        #print("acquire:", self.locked)
-        while 1:
-            if not self.locked:
-                self.locked = True
-                return True
-            #print("putting", core.get_event_loop().cur_task, "on waiting list")
-            self.wlist.append(core.get_event_loop().cur_task)
-            yield False
+        if not self.locked:
+            self.locked = True
+            return True
+        # Woken up by release() with the lock already handed over
+        yield from self.waiters.park()
+        return True
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class Event:
+
+    def __init__(self):
+        self.state = False
+        self.waiters = WaitQueue()
+
+    def is_set(self) -> bool:
+        return self.state
+
+    def set(self):
+        """ Sets the event and wakes all the waiting tasks """
+        self.state = True
+        self.waiters.wake_all()
+
+    def clear(self):
+        self.state = False
+
+    @core.coroutine
+    def wait(self):
+        if not self.state:
+            yield from self.waiters.park()
+        return True
+
+
+class Semaphore:
+
+    def __init__(self, value=1):
+        if value < 0:
+            raise ValueError("Semaphore initial value must be >= 0")
+        self.value = value
+        self.waiters = WaitQueue(self.release)
+
+    def locked(self) -> bool:
+        return self.value == 0
+
+    def release(self):
+        # Hand the permit over to the first waiter, so a newcomer can't take it first
+        if not self.waiters.wake_one():
+            self.value += 1
+
+    @core.coroutine
+    def acquire(self):
+        if self.value > 0:
+            self.value -= 1
+            return True
+        yield from self.waiters.park()
+        return True
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class BoundedSemaphore(Semaphore):
+
+    def __init__(self, value=1):
+        Semaphore.__init__(self, value)
+        self.bound = value
+
+    def release(self):
+        if self.value >= self.bound:
+            raise ValueError("BoundedSemaphore released too many times")
+        Semaphore.release(self)
+
+
+class Condition:
+
+    def __init__(self, lock=None):
+        if lock is None:
+            lock = Lock()
+        self.lock = lock
+        self.waiters = WaitQueue(self.notify)
+
+    def locked(self) -> bool:
+        return self.lock.locked
+
+    def acquire(self):
+        return self.lock.acquire()
+
+    def release(self):
+        self.lock.release()
+
+    async def __aenter__(self):
+        await self.lock.acquire()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.lock.release()
+
+    @core.coroutine
+    def wait(self):
+        """ Releases the lock, waits to be notified and re-acquires the lock """
+        assert self.lock.locked
+        self.lock.release()
+        try:
+            yield from self.waiters.park()
+        finally:
+            yield from self.lock.acquire()
+        return True
+
+    @core.coroutine
+    def wait_for(self, predicate):
+        result = predicate()
+        while not result:
+            yield from self.wait()
+            result = predicate()
+        return result
+
+    def notify(self, n=1):
+        """ Wakes up to n of the waiting tasks """
+        while n and self.waiters.wake_one():
+            n -= 1
+
+    def notify_all(self):
+        self.waiters.wake_all()
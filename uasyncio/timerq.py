@@ -0,0 +1,144 @@
+import utime as time
+
+
+class TimerHandle:
+    """ An entry of the TimerQueue, returned by EventLoop.call_later() and co. to cancel the timer """
+    __slots__ = ("time", "callback", "args", "seq", "index")
+
+    def __init__(self):
+        self.time = 0
+        self.callback = None
+        self.args = ()
+        # Insertion order, entries due at the same time run first-in first-out
+        self.seq = 0
+        # Position in the heap, -1 once the timer has been popped or removed
+        self.index = -1
+
+    def active(self) -> bool:
+        return self.index >= 0
+
+    def __call__(self):
+        # Run from the runq in place of the callback while profiling, see LoopProfiler.call()
+        self.callback(*self.args)
+
+    def __repr__(self):
+        return "<TimerHandle %d %r>" % (self.time, self.callback)
+
+
+def _before(a, b) -> bool:
+    diff = time.ticks_diff(a.time, b.time)
+    return diff < 0 or (diff == 0 and a.seq < b.seq)
+
+
+class TimerQueue:
+
+    def __init__(self, pool_size=16):
+        """
+        Binary min-heap of timers ordered by their ticks_ms deadline, a drop-in for utimeq
+
+        Every entry knows its heap index, so a timer can be removed in O(log n) as soon as it is not needed
+        anymore instead of staying queued until its deadline.
+        Handles of internal entries (pooled=True) are recycled once popped, so sleeping tasks don't allocate.
+        """
+        self.heap = []
+        self.seq = 0
+        self.pool = [TimerHandle() for _ in range(pool_size)]
+        self.pool_size = pool_size
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __bool__(self):
+        return bool(self.heap)
+
+    def push(self, time, callback, args=(), pooled=False) -> TimerHandle:
+        """ Adds a timer, pooled handles must not be kept by the caller as they are reused once popped """
+        if pooled and self.pool:
+            handle = self.pool.pop()
+        else:
+            handle = TimerHandle()
+            pooled = False
+        handle.time = time
+        handle.callback = callback
+        handle.args = args
+        # A pooled handle is marked by an odd sequence number
+        self.seq += 2
+        handle.seq = self.seq + 1 if pooled else self.seq
+        handle.index = len(self.heap)
+        self.heap.append(handle)
+        self._sift_up(handle.index)
+        return handle
+
+    def peektime(self) -> int:
+        return self.heap[0].time
+
+    def pop(self, res) -> TimerHandle:
+        """
+        Removes the earliest timer and stores its time, callback and args in res like utimeq does
+        Returns the handle, a pooled one is already recycled
+        """
+        handle = self.heap[0]
+        self._remove_at(0)
+        res[0] = handle.time
+        res[1] = handle.callback
+        res[2] = handle.args
+        if handle.seq & 1 and len(self.pool) < self.pool_size:
+            handle.callback = None
+            handle.args = ()
+            self.pool.append(handle)
+        return handle
+
+    def remove(self, handle) -> bool:
+        """ Removes a pending timer, returns False if it has already been popped or removed """
+        if handle is None or handle.index < 0:
+            return False
+        self._remove_at(handle.index)
+        handle.callback = None
+        handle.args = ()
+        return True
+
+    def _remove_at(self, i) -> None:
+        heap = self.heap
+        handle = heap[i]
+        handle.index = -1
+        last = heap.pop()
+        if i < len(heap):
+            heap[i] = last
+            last.index = i
+            self._sift_down(i)
+            self._sift_up(last.index)
+
+    def _sift_up(self, i) -> None:
+        heap = self.heap
+        handle = heap[i]
+        while i:
+            parent_i = (i - 1) >> 1
+            parent = heap[parent_i]
+            if not _before(handle, parent):
+                break
+            heap[i] = parent
+            parent.index = i
+            i = parent_i
+        heap[i] = handle
+        handle.index = i
+
+    def _sift_down(self, i) -> None:
+        heap = self.heap
+        n = len(heap)
+        handle = heap[i]
+        while True:
+            child_i = 2 * i + 1
+            if child_i >= n:
+                break
+            child = heap[child_i]
+            right_i = child_i + 1
+            if right_i < n and _before(heap[right_i], child):
+                child_i = right_i
+                child = heap[right_i]
+            if not _before(child, handle):
+                break
+            heap[i] = child
+            child.index = i
+            i = child_i
+        heap[i] = handle
+        handle.index = i
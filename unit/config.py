@@ -8,6 +8,7 @@ unit_id_dict = {"unitID": mqtt_unit_id, "project": project, "name": name}
 
 # Unit - Hardware
 water_temp_sensor_pin = 23
+water_temp_resolution_bits = 12  # 9 to 12, the conversion takes 94, 188, 375 or 750 ms
 growlight_pin = 32
 growlight_relay_active_at = 1
 growlight_persistence_path = "growlight_status"
@@ -20,33 +21,74 @@ irrigation_off_sec = 120
 # Unit - Scheduling
 gc_collect_interval_sec = 1700
 post_status_interval_sec = 600
+water_temp_sample_interval_sec = 15  # the water temperature and the relays are sampled into the time series
+water_temp_max_age_sec = 120  # a new sample is taken for the status if the latest one is older than this
+temp_sensor_rescan_interval_sec = 3600  # the 1-wire buses are scanned again, also after an error
+status_request_window_ms = 500  # the status requests within this window are answered by one status
+time_series_hours = 24  # samples kept, allocated at boot: 5760 samples, 23040 bytes at 15 s
+time_series_upload_interval_sec = 600  # min, max, mean and last of the samples since the last upload
+status_formats = ["json"]  # "json" and/or "packed", the compact binary status on mqtt_topic_status_packed
+status_delta_enabled = False  # periodic and control statuses with only the changed fields, on mqtt_topic_status_delta
+status_keyframe_interval_sec = 3600  # a full status is still sent this often in delta mode
+status_deadbands = {"ds18b20|waterTemperatureCelsius": 0.25}  # an analog field changes once it moved this much
+
+# Unit - Event loop
+loop_runq_len = 16
+loop_waitq_len = 16
+loop_queue_max_len = 256  # the queues grow up to this many entries instead of resetting the unit
+loop_shed_tasks_on_overflow = False  # drop new low-priority tasks (status requests) instead of growing the runq
+
+# Unit - Diagnostics
+loop_profiling_enabled = False
+loop_profile_dump_interval_sec = 300
+loop_profile_publish = False
 
 # WIFI
 wifi_ssid = "PLACEHOLDER"
 wifi_password = "PLACEHOLDER"
 wifi_connection_check_interval_sec = 1
+wifi_connect_poll_interval_ms = 100  # while waiting for the access point to associate
+wifi_connect_timeout_sec = 15  # before trying again after a backoff
+wifi_reconnect_base_ms = 1000  # backoff with full jitter: random wait up to base * 2^failures
+wifi_reconnect_cap_ms = 60000  # but not more than this
 
 # MQTT
-mqtt_connection_check_interval_sec = 1
-mqtt_message_check_interval_ms = 100
+mqtt_reconnect_base_ms = 1000  # backoff with full jitter: random wait up to base * 2^failures, also before the first
+mqtt_reconnect_cap_ms = 30000  # but not more than this
+mqtt_address_cache_sec = 3600  # the resolved broker addresses are kept for this long
 mqtt_keepalive_sec = 200
+mqtt_response_timeout_sec = 10  # the connection is dropped if the broker takes longer to answer
 mqtt_qos = 1
 mqtt_use_ssl = True
 mqtt_queue_size = 10
+mqtt_max_inflight = 4  # QoS 1 messages sent without waiting for their acknowledgement
 mqtt_checkout_payload = ujson.dumps(unit_id_dict)
 
+# MQTT - Outbox for the messages sent while the broker is unreachable
+mqtt_outbox_dir = "outbox"
+mqtt_outbox_max_bytes = 32768  # the oldest telemetry is dropped above this
+mqtt_outbox_segment_bytes = 4096
+mqtt_outbox_batch_bytes = 512  # telemetry is written to the flash in batches of this size
+mqtt_outbox_flush_interval_sec = 300  # or at least this often
+mqtt_outbox_drain_interval_ms = 200  # between the stored messages sent after reconnecting
+
 # MQTT - Credentials
 mqtt_server = "PLACEHOLDER"
 mqtt_port = "PLACEHOLDER"
 mqtt_user = "PLACEHOLDER"
 mqtt_password = "PLACEHOLDER"
+mqtt_fallback_servers = []  # (server, port) tuples tried in turn after mqtt_server
 
 # MQTT - topics
 mqtt_topic_status_request = "/global/status_request"
 mqtt_topic_status = "/global/status"
+mqtt_topic_status_packed = "/global/status_packed"
+mqtt_topic_status_delta = "/global/status_delta"
+mqtt_topic_time_series = "/global/time_series"
 mqtt_topic_inactive = "/global/inactive"
 mqtt_topic_error = "/global/error"
 mqtt_topic_control = "/units/{}/control".format(mqtt_unit_id)
+mqtt_topic_profile = "/units/{}/profile".format(mqtt_unit_id)
 mqtt_subscribe_topics = [mqtt_topic_status_request, mqtt_topic_control]
 
 
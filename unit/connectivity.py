@@ -0,0 +1,75 @@
+import uasyncio as asyncio
+from uasyncio.synchro import Event
+
+DOWN = 0
+WIFI_UP = 1
+MQTT_CONNECTING = 2
+ONLINE = 3
+STATE_NAMES = ("DOWN", "WIFI_UP", "MQTT_CONNECTING", "ONLINE")
+
+
+class Connectivity:
+
+    def __init__(self) -> None:
+        """
+        Connectivity state machine of the unit for the tlvlp.iot project
+        DOWN -> WIFI_UP -> MQTT_CONNECTING -> ONLINE, back to WIFI_UP when the broker is lost
+        and to DOWN from any state when the Wi-Fi is lost.
+
+        The services report what they see and the subscribers are called on every transition,
+        so nothing polls or spins on the connection state. Co-routines can park in wait_online().
+        """
+        self.state = DOWN
+        self.subscribers = []
+        self.online = Event()
+
+    def subscribe(self, callback) -> None:
+        """
+        Adds a callback(old_state, new_state) called on every transition
+        A co-routine returned by the callback is scheduled, like the ones returned by timer callbacks.
+        """
+        self.subscribers.append(callback)
+
+    def is_online(self) -> bool:
+        return self.state == ONLINE
+
+    async def wait_online(self) -> None:
+        """ Parks the calling co-routine until the unit is ONLINE """
+        await self.online.wait()
+
+    # Transitions, the ones not valid from the current state are ignored
+
+    def wifi_up(self) -> None:
+        if self.state == DOWN:
+            self._set(WIFI_UP)
+
+    def wifi_down(self) -> None:
+        self._set(DOWN)
+
+    def mqtt_connecting(self) -> None:
+        if self.state == WIFI_UP:
+            self._set(MQTT_CONNECTING)
+
+    def mqtt_up(self) -> None:
+        if self.state == MQTT_CONNECTING:
+            self._set(ONLINE)
+
+    def mqtt_down(self) -> None:
+        if self.state > WIFI_UP:
+            self._set(WIFI_UP)
+
+    def _set(self, state: int) -> None:
+        old = self.state
+        if state == old:
+            return
+        self.state = state
+        print("Connectivity - {} -> {}".format(STATE_NAMES[old], STATE_NAMES[state]))
+        if state == ONLINE:
+            self.online.set()
+        else:
+            self.online.clear()
+        loop = asyncio.get_event_loop()
+        for callback in self.subscribers:
+            coro = callback(old, state)
+            if coro is not None:
+                loop.create_task(coro)
@@ -0,0 +1,70 @@
+import ujson
+
+
+class JsonSerializer:
+
+    def __init__(self, static_fields: dict, keys: tuple, capacity=256) -> None:
+        """
+        JSON serializer compiled from a schema for the tlvlp.iot project
+        Writes the document of ujson.dumps() of the static fields followed by the keys, without building a
+        dict for every message: the static fields and the key names are encoded once here, and only the values
+        are written into a reusable buffer. The values are encoded by str() for numbers and ujson for the rest,
+        both in C, so the document is the same as the one of ujson.dumps().
+        The encoded value of every key is kept until the value changes, most values of a status don't change
+        from one message to the next.
+        :param static_fields: fields that are the same in every message, eg. the unitID, project and name
+        :param keys: names of the values passed to encode(), in order
+        :param capacity: initial size of the buffer, it grows for a longer message
+        """
+        prefix = ujson.dumps(static_fields)[:-1]
+        separator = ", " if static_fields else ""
+        self.fragments = []
+        for key in keys:
+            self.fragments.append("{}{}: ".format(separator, ujson.dumps(key)).encode())
+            separator = ", "
+        # The last value of every key and its encoded bytes
+        self.cache = [None] * len(keys)
+        self.prefix_len = len(prefix)
+        self.buf = bytearray(max(capacity, self.prefix_len + 1))
+        self.buf[:self.prefix_len] = prefix.encode()
+        self.mv = memoryview(self.buf)
+
+    def encode(self, values) -> bytes:
+        """
+        :param values: in the order of the keys
+        :return: the document, a copy of the buffer since the message may be queued while the next one is written
+        """
+        pos = self.prefix_len
+        fragments = self.fragments
+        cache = self.cache
+        for i in range(len(fragments)):
+            value = values[i]
+            cached = cache[i]
+            # 1, 1.0 and True are equal but encoded differently
+            if cached is None or cached[0] != value or type(cached[0]) is not type(value):
+                kind = type(value)
+                # Non-finite floats through ujson like the rest
+                if kind is int or kind is float and value - value == 0:
+                    data = str(value).encode()
+                else:
+                    data = ujson.dumps(value).encode()
+                cached = cache[i] = (value, data)
+            fragment = fragments[i]
+            data = cached[1]
+            middle = pos + len(fragment)
+            end = middle + len(data)
+            if end >= len(self.buf):
+                self._grow(pos, end + 1)
+            # Copied through a memoryview, a slice store of the bytearray may copy the data first
+            mv = self.mv
+            mv[pos:middle] = fragment
+            mv[middle:end] = data
+            pos = end
+        self.buf[pos] = 0x7D  # }
+        return bytes(self.mv[:pos + 1])
+
+    def _grow(self, pos: int, length: int) -> None:
+        buf = bytearray(2 * length)
+        buf[:pos] = self.mv[:pos]
+        self.buf = buf
+        self.mv = memoryview(buf)
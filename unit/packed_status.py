@@ -0,0 +1,59 @@
+import ustruct
+
+VERSION = 1
+
+
+class PackedStatusCodec:
+
+    def __init__(self, unit_id_dict: dict, temperatures=(), relays=(), seconds=()) -> None:
+        """
+        Compact binary status for the tlvlp.iot project, an alternative to the JSON status
+        The key names are left out: the values follow the order of a schema that both ends know.
+
+        Layout, little-endian:
+        version (B) | project length (B) | project | name length (B) | name |
+        a temperature in 1/16 °C (h) for each temperature key, the resolution of the DS18B20 |
+        one bit for each relay key (B) | a uint32 (I) for each seconds key
+        :param unit_id_dict: the unitID, project and name of the unit
+        :param temperatures, relays, seconds: the status keys of the values, in order, at most 8 relays
+        """
+        if len(relays) > 8:
+            raise ValueError("Packed status - Error! At most 8 relays fit in the relay byte")
+        self.temperatures = temperatures
+        self.relays = relays
+        self.seconds = seconds
+        self.format = "<{}hB{}I".format(len(temperatures), len(seconds))
+        project = unit_id_dict["project"].encode()
+        name = unit_id_dict["name"].encode()
+        self.prefix = bytes([VERSION, len(project)]) + project + bytes([len(name)]) + name
+
+    def encode(self, status: dict) -> bytes:
+        """ Packs the values of a status dict, the one the JSON status is made of """
+        values = [round(status[key] * 16) for key in self.temperatures]
+        bits = 0
+        for i, key in enumerate(self.relays):
+            if status[key]:
+                bits |= 1 << i
+        values.append(bits)
+        for key in self.seconds:
+            values.append(status[key])
+        return self.prefix + ustruct.pack(self.format, *values)
+
+    def decode(self, data: bytes) -> dict:
+        """ Returns the same dict as the JSON status, for the server side and the benchmarks """
+        if data[0] != VERSION:
+            raise ValueError("Packed status - Error! Unsupported version: {}".format(data[0]))
+        pos = 2 + data[1]
+        project = bytes(data[2:pos]).decode()
+        name = bytes(data[pos + 1:pos + 1 + data[pos]]).decode()
+        pos += 1 + data[pos]
+        values = ustruct.unpack_from(self.format, data, pos)
+        status = {"unitID": "{}-{}".format(project, name), "project": project, "name": name}
+        for i, key in enumerate(self.temperatures):
+            status[key] = values[i] / 16
+        bits = values[len(self.temperatures)]
+        for i, key in enumerate(self.relays):
+            status[key] = bits >> i & 1
+        for i, key in enumerate(self.seconds):
+            status[key] = values[len(self.temperatures) + 1 + i]
+        return status
@@ -0,0 +1,55 @@
+import urandom
+import usocket
+import utime as time
+
+
+class ReconnectPolicy:
+
+    def __init__(self, base_ms: int, cap_ms: int, servers=(), address_ttl_sec=3600) -> None:
+        """
+        Reconnect policy for the tlvlp.iot project: capped exponential backoff with full jitter over a list of servers
+
+        The wait before an attempt is random between 0 and min(cap_ms, base_ms * 2^failures), failures counted
+        since the last success, so units that lost their server at the same moment spread their attempts out
+        instead of hitting it all at once. Every failed attempt moves on to the next server, a successful one
+        sticks to it. The resolved server addresses are cached, so the attempts don't wait for the DNS. The address
+        of a server that failed is dropped, it is resolved again on its next attempt in case it has changed.
+        :param servers: (host, port) tuples, the first one is preferred
+        :param address_ttl_sec: a server is resolved again after this long
+        """
+        self.base_ms = base_ms
+        self.cap_ms = cap_ms
+        self.servers = servers
+        self.address_ttl_ms = address_ttl_sec * 1000
+        self.failures = 0
+        self.index = 0
+        # (host, port): (address, ticks_ms of the resolution)
+        self.addresses = {}
+
+    def next_delay_ms(self) -> int:
+        """ Returns a random wait for the next attempt """
+        limit = min(self.cap_ms, self.base_ms << min(self.failures, 16))
+        return urandom.getrandbits(30) % (limit + 1)
+
+    def failed(self) -> None:
+        self.failures += 1
+        if self.servers:
+            self.addresses.pop(self.servers[self.index], None)
+            self.index = (self.index + 1) % len(self.servers)
+
+    def succeeded(self) -> None:
+        self.failures = 0
+
+    def server(self) -> tuple:
+        """ Returns the (host, port) of the server to try next """
+        return self.servers[self.index]
+
+    def address(self):
+        """ Returns the resolved address of the server to try next, blocks for the DNS if it isn't cached """
+        server = self.servers[self.index]
+        cached = self.addresses.get(server)
+        now = time.ticks_ms()
+        if cached is None or time.ticks_diff(now, cached[1]) > self.address_ttl_ms:
+            address = usocket.getaddrinfo(server[0], server[1], 0, usocket.SOCK_STREAM)[0][-1]
+            cached = self.addresses[server] = (address, now)
+        return cached[0]
@@ -1,5 +0,0 @@
-""" Flags shared by the asynchronous co-routines"""
-
-wifi_is_connected = False
-mqtt_is_connected = False
-
@@ -0,0 +1,65 @@
+from array import array
+
+_ITEM_BYTES = {"b": 1, "B": 1, "h": 2, "H": 2, "i": 4, "I": 4, "f": 4}
+
+
+class TimeSeries:
+
+    def __init__(self, capacity: int, typecode="h", scale=1) -> None:
+        """
+        Ring buffer of samples taken at a fixed interval for the tlvlp.iot project
+        The samples are kept in one array allocated here, without an object per sample, so the memory it takes
+        is fixed from the start: capacity * item size bytes. The oldest samples are overwritten when it is full.
+        :param typecode: array typecode of the stored values, eg. "h" for int16 or "B" for uint8
+        :param scale: the values are stored as round(value * scale), eg. 16 for a DS18B20 in 1/16 °C
+        """
+        self.capacity = capacity
+        self.scale = scale
+        self.values = array(typecode, bytes(capacity * _ITEM_BYTES[typecode]))
+        self.view = memoryview(self.values)
+        self.head = 0  # where the next sample goes
+        self.count = 0  # samples in the buffer
+        self.window = 0  # samples since the last aggregate_window()
+
+    def nbytes(self) -> int:
+        return self.capacity * _ITEM_BYTES[self.values.typecode]
+
+    def append(self, value) -> None:
+        self.values[self.head] = round(value * self.scale)
+        self.head += 1
+        if self.head == self.capacity:
+            self.head = 0
+        if self.count < self.capacity:
+            self.count += 1
+        if self.window < self.capacity:
+            self.window += 1
+
+    def aggregate(self, samples: int):
+        """
+        :return: a (min, max, mean, last) tuple of the latest samples, None if there are none
+        The buffer is read through memoryview slices, min(), max() and sum() iterate them without copying.
+        """
+        samples = min(samples, self.count)
+        if samples == 0:
+            return None
+        start = self.head - samples
+        if start < 0:
+            # Wrapped around, the older part is at the end of the buffer
+            start += self.capacity
+        part = self.view[start:self.head] if start < self.head else self.view[start:]
+        low = min(part)
+        high = max(part)
+        total = sum(part)
+        if start >= self.head and self.head:
+            part = self.view[:self.head]
+            low = min(low, min(part))
+            high = max(high, max(part))
+            total += sum(part)
+        scale = self.scale
+        return low / scale, high / scale, total / samples / scale, self.values[self.head - 1] / scale
+
+    def aggregate_window(self):
+        """ Aggregates the samples since the last call, see aggregate() """
+        samples = self.window
+        self.window = 0
+        return self.aggregate(samples)
@@ -1,10 +1,16 @@
 import uasyncio as asyncio
 import ujson
-from unit import config, shared_flags
+import utime as time
+from unit import config
 from modules.relay import Relay
 from modules.temp_sensor_ds18b20 import TempSensorDS18B20
-from modules.exceptions import InvalidModuleInputException
+from modules.temp_sensor_manager import TempSensorManager
+from modules.exceptions import InvalidModuleInputException, UnknownModuleException
+from modules.module_registry import ModuleRegistry
 from mqtt.mqtt_service import MqttMessage
+from unit.packed_status import PackedStatusCodec
+from unit.json_serializer import JsonSerializer
+from unit.time_series import TimeSeries
 
 
 class UnitService:
@@ -20,7 +26,10 @@ class UnitService:
         print("Unit service - Initializing service")
         self.mqtt_service = mqtt_service
         # Init hardware
-        self.water_temp_sensor = TempSensorDS18B20("waterTemperatureCelsius", config.water_temp_sensor_pin)
+        self.water_temp_sensor = TempSensorDS18B20("waterTemperatureCelsius",
+                                                   config.water_temp_sensor_pin,
+                                                   config.water_temp_resolution_bits)
+        self.temp_sensors = TempSensorManager([self.water_temp_sensor])
         self.growlight_relay = Relay("growlight",
                                      config.growlight_pin,
                                      config.growlight_relay_active_at,
@@ -28,34 +37,134 @@ class UnitService:
         self.irrigation_relay = Relay("irrigation",
                                       config.irrigation_pin,
                                       config.irrigation_relay_active_at)
+        # Control messages are dispatched by module id
+        self.module_registry = ModuleRegistry()
+        for relay in (self.growlight_relay, self.irrigation_relay):
+            self.module_registry.register(relay.get_module_id(), relay.handle_control_message)
+        self.module_registry.register(self.water_temp_sensor.get_module_id())
+        # Status schema, the values are read by read_status() in this order
+        self.status_keys = (self.water_temp_sensor.get_module_id(),
+                            self.growlight_relay.get_module_id(),
+                            self.irrigation_relay.get_module_id(),
+                            "irrigationOnSec",
+                            "irrigationOffSec")
+        self.status_serializer = JsonSerializer(config.unit_id_dict, self.status_keys)
+        self.error_serializer = JsonSerializer(config.unit_id_dict, ("error",))
+        self.packed_status_codec = PackedStatusCodec(
+            config.unit_id_dict,
+            temperatures=self.status_keys[:1],
+            relays=self.status_keys[1:3],
+            seconds=self.status_keys[3:])
+        # Samples of the last time_series_hours, the buffers are allocated here for good
+        samples = config.time_series_hours * 3600 // config.water_temp_sample_interval_sec
+        self.water_temp_series = TimeSeries(samples, "h", 16)
+        self.growlight_series = TimeSeries(samples, "B")
+        self.irrigation_series = TimeSeries(samples, "B")
+        self.time_series = ((self.water_temp_sensor.get_module_id(), self.water_temp_series),
+                            (self.growlight_relay.get_module_id(), self.growlight_series),
+                            (self.irrigation_relay.get_module_id(), self.irrigation_series))
+        print("Unit service - Time series of {} samples take {} bytes".format(
+            samples, sum(series.nbytes() for _, series in self.time_series)))
         # Run scheduled tasks
         loop = asyncio.get_event_loop()
-        loop.create_task(self.automated_irrigation_loop())
-        loop.create_task(self.status_updater_loop())
-        loop.create_task(self.incoming_message_processing_loop())
+        self.tasks = [loop.create_task(self.incoming_message_processing_loop())]
+        self.status_request_pending = False
+        self.last_status = None
+        self.last_status_ms = None
+        # The values as last published, by the full status or a delta
+        self.published_status = None
+        self.timers = [loop.call_every(config.water_temp_sample_interval_sec * 1000, self.record_samples),
+                       loop.call_every(config.time_series_upload_interval_sec * 1000,
+                                       self.send_time_series_to_server),
+                       loop.call_every(config.temp_sensor_rescan_interval_sec * 1000, self.temp_sensors.rescan),
+                       loop.call_every(config.post_status_interval_sec * 1000, self.send_status_update_to_server)]
+        self.timers.extend(self.start_automated_irrigation())
         print("Unit service - Service initialization complete")
 
-    async def send_status_to_server(self) -> None:
-        while not shared_flags.wifi_is_connected and not shared_flags.mqtt_is_connected:
-            await asyncio.sleep(0)
-        status_dict = config.unit_id_dict.copy()
-        status_dict.update([
-            await self.water_temp_sensor.read_first_celsius(),
-            self.growlight_relay.get_state(),
-            self.irrigation_relay.get_state(),
-            ("irrigationOnSec", config.irrigation_on_sec),
-            ("irrigationOffSec", config.irrigation_off_sec)
-        ])
-        status_json = ujson.dumps(status_dict)
-        message = MqttMessage(config.mqtt_topic_status, status_json)
+    async def send_status_to_server(self, important=False, only_if_changed=False) -> None:
+        """
+        Sends the status with the latest water temperature sample, unless it is too old
+        :param only_if_changed: nothing is sent if the status is the same as the last one sent
+        """
+        status = await self.read_status()
+        if only_if_changed and status == self.last_status:
+            return
+        self.last_status = status
+        self.last_status_ms = time.ticks_ms()
+        self.published_status = list(status)
+        if "json" in config.status_formats:
+            status_json = self.status_serializer.encode(status)
+            message = MqttMessage(config.mqtt_topic_status, status_json, important)
+            await self.mqtt_service.add_outgoing_message_to_queue(message)
+        if "packed" in config.status_formats:
+            status_packed = self.packed_status_codec.encode(dict(zip(self.status_keys, status)))
+            message = MqttMessage(config.mqtt_topic_status_packed, status_packed, important)
+            await self.mqtt_service.add_outgoing_message_to_queue(message)
+
+    async def read_status(self) -> list:
+        """ Returns the status values in the order of status_keys """
+        return [(await self.water_temp_sensor.read_cached_celsius(config.water_temp_max_age_sec * 1000))[1],
+                self.growlight_relay.state,
+                self.irrigation_relay.state,
+                config.irrigation_on_sec,
+                config.irrigation_off_sec]
+
+    async def send_status_update_to_server(self, important=False) -> None:
+        """
+        Sends the status, in delta mode only the fields changed since they were last published, with the unitID
+        A field of status_deadbands has changed once it moved at least that much from its published value.
+        A full status is sent as the keyframe every status_keyframe_interval_sec and nothing if nothing changed.
+        """
+        if not config.status_delta_enabled or self.last_status_ms is None \
+                or time.ticks_diff(time.ticks_ms(), self.last_status_ms) >= config.status_keyframe_interval_sec * 1000:
+            await self.send_status_to_server(important)
+            return
+        status = await self.read_status()
+        published = self.published_status
+        delta_dict = None
+        for i in range(len(status)):
+            value = status[i]
+            last = published[i]
+            if value == last:
+                continue
+            key = self.status_keys[i]
+            deadband = config.status_deadbands.get(key)
+            if deadband is not None and abs(value - last) < deadband:
+                continue
+            if delta_dict is None:
+                delta_dict = {"unitID": config.mqtt_unit_id}
+            delta_dict[key] = value
+            published[i] = value
+        if delta_dict is not None:
+            message = MqttMessage(config.mqtt_topic_status_delta, ujson.dumps(delta_dict), important)
+            await self.mqtt_service.add_outgoing_message_to_queue(message)
+
+    async def record_samples(self) -> None:
+        """ Samples the temperature sensors and records them with the relay states into the time series """
+        await self.temp_sensors.sample()
+        # A failed reading is left out
+        if self.water_temp_sensor.last_readings:
+            self.water_temp_series.append(self.water_temp_sensor.last_celsius)
+        self.growlight_series.append(self.growlight_relay.state)
+        self.irrigation_series.append(self.irrigation_relay.state)
+
+    async def send_time_series_to_server(self) -> None:
+        """
+        Sends the aggregates of the samples since the last upload in one message
+        eg. "relay|irrigation": {"min": 0, "max": 1, "mean": 0.5, "last": 1, "samples": 40}, the mean of a relay
+        is its duty cycle
+        """
+        series_dict = config.unit_id_dict.copy()
+        series_dict["sampleIntervalSec"] = config.water_temp_sample_interval_sec
+        for module_id, series in self.time_series:
+            samples = min(series.window, series.count)
+            aggregates = series.aggregate_window()
+            if aggregates is not None:
+                series_dict[module_id] = {"min": aggregates[0], "max": aggregates[1], "mean": aggregates[2],
+                                          "last": aggregates[3], "samples": samples}
+        message = MqttMessage(config.mqtt_topic_time_series, ujson.dumps(series_dict))
         await self.mqtt_service.add_outgoing_message_to_queue(message)
 
-    async def status_updater_loop(self) -> None:
-        """ Periodically sends a status update to the server """
-        while True:
-            await self.send_status_to_server()
-            await asyncio.sleep(config.post_status_interval_sec)
-
     async def incoming_message_processing_loop(self) -> None:
         """ Processes the incoming message queue"""
         while True:
@@ -64,73 +173,86 @@ class UnitService:
             payload = message.get_payload()
             print("Unit service - Message received from topic:{} with payload: {}".format(topic, payload))
             if topic == config.mqtt_topic_status_request:
-                await self.send_status_to_server()
+                self.handle_status_request()
             elif topic == config.mqtt_topic_control:
                 await self.handle_control_event(payload)
                 await asyncio.sleep(0)
-                await self.send_status_to_server()
+                await self.send_status_update_to_server(important=True)
             else:
                 await self.send_error_to_server("Unit service - Error! Unrecognized topic: {}".format(topic))
 
+    def handle_status_request(self) -> None:
+        """
+        Schedules a status for a status request, the requests arriving until it is queued are answered by it
+        A request within status_request_window_ms of the last status sent waits for the end of the window
+        and its status is only sent if it differs from the last one, so a burst of requests is answered by one
+        status per window, more only if the status changed.
+        """
+        if self.status_request_pending:
+            return
+        self.status_request_pending = True
+        wait_ms = 0
+        if self.last_status_ms is not None:
+            elapsed_ms = time.ticks_diff(time.ticks_ms(), self.last_status_ms)
+            wait_ms = max(0, config.status_request_window_ms - elapsed_ms)
+        task = asyncio.get_event_loop().create_task(self.send_requested_status(wait_ms), sheddable=True)
+        if task.done():
+            # Shed by a full runq without running, the next request schedules the status again
+            self.status_request_pending = False
+
+    async def send_requested_status(self, wait_ms: int) -> None:
+        try:
+            if wait_ms:
+                await asyncio.sleep_ms(wait_ms)
+            await self.send_status_to_server(only_if_changed=wait_ms > 0)
+        finally:
+            self.status_request_pending = False
+
     async def handle_control_event(self, payload_json: str) -> None:
-        """ Processes an incoming control message """
+        """
+        Processes an incoming control message
+        Every module id: value pair of the payload is applied in one pass,
+        eg. {"relay|growlight": 1, "relay|irrigation": 0}, the errors are sent after it
+        """
         try:
             payload = ujson.loads(payload_json)
-            if payload is None:
-                await self.send_error_to_server("Unit service - Error parsing payload!")
-            module = next(iter(payload))
-            value = payload.get(module)
-            if self.growlight_relay.id in payload.keys():
-                self.growlight_relay.handle_control_message(value)
-            else:
-                await self.send_error_to_server("Unit service - Error! Unrecognized module id: {}".format(payload_json))
         except ValueError:
             await self.send_error_to_server("Unit service - Error! Invalid payload: {}".format(payload_json))
-        except InvalidModuleInputException:
-            await self.send_error_to_server(
-                "Unit service - Error! Invalid value in control payload: {}".format(payload_json))
+            return
+        if not isinstance(payload, dict) or not payload:
+            await self.send_error_to_server("Unit service - Error parsing payload!")
+            return
+        errors = None
+        for module_id, value in payload.items():
+            try:
+                self.module_registry.dispatch(module_id, value)
+                continue
+            except UnknownModuleException:
+                error = "Unit service - Error! Unrecognized module id: {} in {}".format(module_id, payload_json)
+            except (InvalidModuleInputException, ValueError, TypeError):
+                error = "Unit service - Error! Invalid value for {} in control payload: {}".format(
+                    module_id, payload_json)
+            if errors is None:
+                errors = []
+            errors.append(error)
+        if errors is not None:
+            for error in errors:
+                await self.send_error_to_server(error)
 
     async def send_error_to_server(self, error: str) -> None:
-        while not shared_flags.wifi_is_connected and not shared_flags.mqtt_is_connected:
-            await asyncio.sleep(0)
-        error_dict = config.unit_id_dict.copy()
-        error_dict.update({
-            "error": error
-        })
-        error_json = ujson.dumps(error_dict)
-        message = MqttMessage(config.mqtt_topic_error, error_json)
+        error_json = self.error_serializer.encode((error,))
+        message = MqttMessage(config.mqtt_topic_error, error_json, important=True)
         await self.mqtt_service.add_outgoing_message_to_queue(message)
         print(error)
 
-    async def automated_irrigation_loop(self) -> None:
-        """ Automatically turns the unit's irrigation on and off using pre-configured values """
-        while True:
-            self.irrigation_relay.relay_on()
-            await asyncio.sleep(config.irrigation_on_sec)
-            self.irrigation_relay.relay_off()
-            await asyncio.sleep(config.irrigation_off_sec)
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+    def start_automated_irrigation(self) -> tuple:
+        """
+        Automatically turns the unit's irrigation on and off using pre-configured values
+        The on and off edges are two timers with the same cycle, the off edge shifted by the on time
+        """
+        loop = asyncio.get_event_loop()
+        cycle_ms = (config.irrigation_on_sec + config.irrigation_off_sec) * 1000
+        on_timer = loop.call_every(cycle_ms, self.irrigation_relay.relay_on)
+        off_timer = asyncio.Periodic(loop, cycle_ms, self.irrigation_relay.relay_off)
+        off_timer.start_at(time.ticks_add(on_timer.deadline, config.irrigation_on_sec * 1000))
+        return on_timer, off_timer
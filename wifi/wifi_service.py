@@ -1,46 +1,63 @@
 import network
 import uasyncio as asyncio
-from unit import shared_flags, config
+from unit import config
+from unit.reconnect_policy import ReconnectPolicy
 
 
 class WifiService(object):
 
-    def __init__(self) -> None:
+    def __init__(self, connectivity) -> None:
         """
         Wifi Service for the tlvlp.iot project
-        Handles the connection to the WLAN network
+        Handles the connection to the WLAN network and reports it to the connectivity state machine
+        While the access point doesn't associate, the connect is issued again after config.wifi_connect_timeout_sec
+        and a capped exponential backoff with full jitter.
 
         Tested on ESP32 MCUs
+        :param connectivity: tlvlp.iot connectivity state machine instance
         """
         print("Wifi service - Initializing service")
         # Init values
         self.wifi_client = network.WLAN(network.STA_IF)
+        self.connectivity = connectivity
+        self.reconnect_policy = ReconnectPolicy(config.wifi_reconnect_base_ms, config.wifi_reconnect_cap_ms)
         self.connection_in_progress = False
         # Add scheduled tasks
         loop = asyncio.get_event_loop()
-        loop.create_task(self.connection_checker_loop())
+        self.timers = [loop.call_every(config.wifi_connection_check_interval_sec * 1000, self.check_connection)]
         print("Wifi service - Service initialization complete")
 
-    async def connection_checker_loop(self) -> None:
-        """ Periodically checks the connection status and reconnects if necessary """
-        while True:
-            if not self.wifi_client.isconnected() and not self.connection_in_progress:
-                await self.connect()
-            await asyncio.sleep(config.wifi_connection_check_interval_sec)
+    def check_connection(self):
+        """ Periodically checks the connection status and returns the reconnecting co-routine if necessary """
+        if not self.wifi_client.isconnected() and not self.connection_in_progress:
+            return self.connect()
+        return None
 
     async def connect(self) -> None:
-        shared_flags.wifi_is_connected = False
+        self.connectivity.wifi_down()
         self.connection_in_progress = True
         print("Wifi service - Connecting")
         access_point = config.wifi_ssid
         password = config.wifi_password
         self.wifi_client.active(True)
+        policy = self.reconnect_policy
         self.wifi_client.connect(access_point, password)
+        # The station keeps trying on its own, the connect is issued again after the timeout and a backoff
+        timeout_ms = config.wifi_connect_timeout_sec * 1000
+        retry_at_ms = timeout_ms
+        waited_ms = 0
         while not self.wifi_client.isconnected():
-            await asyncio.sleep(0)
+            await asyncio.sleep_ms(config.wifi_connect_poll_interval_ms)
+            waited_ms += config.wifi_connect_poll_interval_ms
+            if waited_ms >= retry_at_ms:
+                policy.failed()
+                retry_at_ms = waited_ms + timeout_ms + policy.next_delay_ms()
+                print("Wifi service - Error! Not connected yet, connecting again")
+                self.wifi_client.connect(access_point, password)
+        policy.succeeded()
         config.wifi_ip = self.wifi_client.ifconfig()[0]
         print("Wifi service - Connection established (access_point: {}, password: {}, ip: {})".format(
             access_point, password, config.wifi_ip))
-        shared_flags.wifi_is_connected = True
         self.connection_in_progress = False
+        self.connectivity.wifi_up()
 